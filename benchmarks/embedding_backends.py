@@ -0,0 +1,150 @@
+"""
+Retrieval quality against speed of the embedding backends on the transcript corpus.
+
+Splits transcripts from the transcript store like the indexer does, embeds the chunks and
+a set of queries with every backend, and reports for each one:
+
+- encoding throughput of the chunks and the latency of single queries,
+- recall@k: the share of the top k chunks found with the torch float32 vectors that the
+  backend finds as well,
+- self recall@k: the share of queries, taken from the start of a chunk, finding that chunk,
+- the same recall when the vectors are rounded to float16, as the embedding cache stores them.
+
+    python -m benchmarks.embedding_backends [--backends torch onnx onnx-int8] [--max-chunks 2000]
+        [--queries queries.txt] [--k 10] [--json report.json]
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from common.embeddings import EMBEDDING_BACKENDS, EMBEDDING_MODEL, CachedEmbeddings
+from common.parallel_ingest import split_transcripts
+from common.transcript_index import TranscriptIndex
+from functions.initialize_database import CHUNK_OVERLAP, CHUNK_SIZE, DOC_LOCATION
+
+
+def load_chunks(doc_location: str, max_chunks: int, seed: int) -> list:
+    """Texts of up to `max_chunks` chunks of the indexed transcripts."""
+    index = TranscriptIndex(doc_location)
+    hashes = sorted({entry["hash"] for entry in index.entries().values()})
+    index.close()
+    chunks = [text for _, _, _, text in split_transcripts(doc_location, hashes, CHUNK_SIZE, CHUNK_OVERLAP, workers=1)]
+    random.Random(seed).shuffle(chunks)
+    return chunks[:max_chunks]
+
+
+def sample_queries(chunks: list, count: int, seed: int) -> list:
+    """(query, chunk index) pairs, a query is the first words of a randomly chosen chunk."""
+    picked = random.Random(seed).sample(range(len(chunks)), min(count, len(chunks)))
+    return [(" ".join(chunks[i].split()[:12]), i) for i in picked]
+
+
+def top_k(np, corpus, queries, k: int):
+    corpus = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def recall(reference, found) -> float:
+    return statistics.mean(len(set(a) & set(b)) / len(a) for a, b in zip(reference.tolist(), found.tolist()))
+
+
+def self_recall(found, targets: list) -> float:
+    return statistics.mean(target in row for row, target in zip(found.tolist(), targets))
+
+
+def run_backend(backend: str, model_name: str, batch_size: int, chunks: list, queries: list) -> dict:
+    import numpy as np
+
+    embeddings = CachedEmbeddings(model_name, batch_size, cache_path=None, query_cache_size=0, backend=backend)
+    # Load the model and warm it up outside of the timings
+    embeddings.encode(chunks[:batch_size])
+    start = time.perf_counter()
+    corpus = np.asarray(embeddings.encode(chunks), dtype=np.float32)
+    encode_seconds = time.perf_counter() - start
+
+    latencies = []
+    query_vectors = []
+    for query, _ in queries:
+        start = time.perf_counter()
+        query_vectors.append(embeddings.model.embed_query(query))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "backend": backend,
+        "corpus": corpus,
+        "queries": np.asarray(query_vectors, dtype=np.float32),
+        "chunks_per_second": len(chunks) / encode_seconds,
+        "query_p50_ms": latencies[len(latencies) // 2] * 1000,
+        "query_p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--doc-location", default=DOC_LOCATION)
+    parser.add_argument("--max-chunks", type=int, default=2000)
+    parser.add_argument("--queries", help="File with one query per line, sampled from the chunks by default")
+    parser.add_argument("--num-queries", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    import numpy as np
+
+    chunks = load_chunks(args.doc_location, args.max_chunks, args.seed)
+    if not chunks:
+        raise SystemExit(f"No transcripts in {args.doc_location}")
+    if args.queries:
+        with open(args.queries, "r") as f:
+            queries = [(line.strip(), None) for line in f if line.strip()]
+    else:
+        queries = sample_queries(chunks, args.num_queries, args.seed)
+    print(f"{len(chunks)} chunks, {len(queries)} queries, model {args.model}")
+
+    results = []
+    for backend in ["torch"] + [name for name in args.backends if name != "torch"]:
+        try:
+            results.append(run_backend(backend, args.model, args.batch_size, chunks, queries))
+        except Exception as e:
+            print(f"{backend}: unavailable ({e})")
+    if not results or results[0]["backend"] != "torch":
+        raise SystemExit("The torch backend is needed as the reference.")
+
+    reference = top_k(np, results[0]["corpus"], results[0]["queries"], args.k)
+    targets = [target for _, target in queries]
+    report = []
+    print(f"{'backend':<10} {'chunks/s':>9} {'q p50 ms':>9} {'q p95 ms':>9} "
+          f"{'recall@k':>9} {'f16 recall':>10} {'self@k':>7}")
+    for result in results:
+        found = top_k(np, result["corpus"], result["queries"], args.k)
+        found_f16 = top_k(np, result["corpus"].astype(np.float16).astype(np.float32),
+                          result["queries"].astype(np.float16).astype(np.float32), args.k)
+        row = {
+            "backend": result["backend"],
+            "chunks_per_second": result["chunks_per_second"],
+            "query_p50_ms": result["query_p50_ms"],
+            "query_p95_ms": result["query_p95_ms"],
+            "recall_at_k": recall(reference, found),
+            "float16_recall_at_k": recall(reference, found_f16),
+            "self_recall_at_k": self_recall(found, targets) if args.queries is None else None,
+        }
+        report.append(row)
+        self_at_k = f"{row['self_recall_at_k']:7.3f}" if row["self_recall_at_k"] is not None else f"{'-':>7}"
+        print(f"{row['backend']:<10} {row['chunks_per_second']:9.1f} {row['query_p50_ms']:9.2f} "
+              f"{row['query_p95_ms']:9.2f} {row['recall_at_k']:9.3f} {row['float16_recall_at_k']:10.3f} {self_at_k}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"model": args.model, "chunks": len(chunks), "queries": len(queries), "k": args.k,
+                       "backends": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of the HTML parser backends on episode pages.
+
+Checks every installed backend returns what the bs4 reference returns, then times the
+transcript link and feed link lookups on saved pages, or on a synthetic page when none
+are given:
+
+    python -m benchmarks.html_parsers [episode.html ...] [--repeat 20]
+"""
+import argparse
+import time
+from common.html_parser import BACKENDS, get_html_parser
+
+
+def synthetic_episode_page(paragraphs: int = 400) -> str:
+    """A page shaped like a podcast episode page, the transcript link sits after the show notes."""
+    nav = "".join(f'<li><a href="/category/{i}">Category {i}</a></li>' for i in range(60))
+    notes = "".join(f"<p>Show notes paragraph {i} with <b>bold</b> and <a href='/link/{i}'>a link</a>.</p>"
+                    for i in range(paragraphs))
+    comments = "".join(f"<div class='comment'><p>Comment {i} &amp; reply</p><br></div>" for i in range(paragraphs))
+    return (f"<html><head><script>var data = '<a href=\"/fake\">';</script>"
+            f"<link rel='alternate' href='/feed/'></head><body><ul>{nav}</ul>"
+            f"<article>{notes}<p><b>SHOW TRANSCRIPT: </b><a href=\"https://docs.google.com/document/d/abc?x=1&amp;y=2\">"
+            f"Transcript</a></p></article>{comments}"
+            f"<footer><a href='/feed/podcast'>RSS</a><a href='https://example.com/FEED.xml'>Atom</a></footer></body></html>")
+
+
+def measure(function, content: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(content)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="*", help="Saved episode pages")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = {path: open(path, encoding="utf-8").read() for path in args.pages}
+    if not pages:
+        pages = {"synthetic episode page": synthetic_episode_page()}
+
+    backends = []
+    for name in BACKENDS:
+        try:
+            backends.append(get_html_parser(name))
+        except ImportError:
+            print(f"{name}: not installed")
+
+    reference = get_html_parser("bs4")
+    for page_name, content in pages.items():
+        print(f"{page_name}: {len(content) / 1e3:.0f} kB")
+        expected = (reference.find_transcript_link(content), reference.find_feed_links(content))
+        for backend in backends:
+            result = (backend.find_transcript_link(content), backend.find_feed_links(content))
+            status = "ok" if result == expected else f"MISMATCH {result} != {expected}"
+            transcript = measure(backend.find_transcript_link, content, args.repeat)
+            feeds = measure(backend.find_feed_links, content, args.repeat)
+            print(f"  {backend.name:<12} transcript link {transcript * 1000:8.2f} ms "
+                  f"feed links {feeds * 1000:8.2f} ms  {status}")
+
+
+if __name__ == "__main__":
+    main()
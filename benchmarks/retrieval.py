@@ -0,0 +1,454 @@
+"""
+End to end ingestion and retrieval benchmark on an offline corpus.
+
+Builds a labeled corpus, a synthetic one or a saved one, serves its episode and transcript
+pages from memory in place of the network, and runs the real pipeline on it in a scratch
+directory: download_transcripts_func, initialize_database, then the BM25, dense and fused
+searches of QueryDatabaseTool. Pages are served through an in-process HTTP transport and
+the browser is replaced by a stub that fails, the LLM is not on these paths. Embeddings are
+computed with a deterministic hashing embedder unless --embeddings model is given, so no
+model download is needed.
+
+Reported, and written as JSON for comparing versions:
+- ingestion: download and indexing time, episodes/s and chunks/s, no-op reindex time,
+- index size on disk of the transcript store, Chroma, BM25 and the embedding cache,
+- latency percentiles of BM25, dense, fused and cached fused queries, batch throughput,
+- recall@k and MRR of each search against the labeled queries.
+
+    python -m benchmarks.retrieval [--episodes 200] [--queries 100] [--output results.json]
+    python -m benchmarks.retrieval --save-corpus corpus/          # write the synthetic corpus
+    python -m benchmarks.retrieval --corpus corpus/ --baseline previous.json
+
+A saved corpus directory holds episodes.jsonl ({"link", "text"} per line), queries.jsonl
+({"query", "relevant": [links]} per line) and optionally pages.jsonl ({"url", "file"} per
+line) mapping URLs to captured HTML pages, which are served instead of generated pages.
+With --baseline the results are compared to an earlier run and the exit status is 1 when
+latency, throughput or recall regressed beyond the tolerance.
+"""
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+TRANSCRIPT_HOST = "https://docs.google.com/document/d"
+EPISODE_HOST = "https://podcast.example.com/episodes"
+
+_STOPWORDS = ["the", "and", "to", "of", "a", "in", "that", "is", "it", "we", "you", "so", "for", "on",
+              "this", "with", "what", "they", "but", "really", "know", "think", "like", "just"]
+
+
+# Corpus
+
+def _pseudo_words(rng: random.Random, count: int, seen: set) -> list:
+    """Distinct pronounceable made-up words, so every term is under the control of the generator."""
+    consonants, vowels = "bcdfghklmnprstvz", "aeiou"
+    words = []
+    while len(words) < count:
+        word = "".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def synthetic_corpus(episodes: int, queries: int, words: int, topics: int, seed: int) -> tuple:
+    """
+    Episodes about one of `topics` topics, each with a few terms of its own such as guest and
+    product names. Half of the queries ask for one episode by its own terms, the other half
+    for a topic, with every episode of the topic relevant.
+    Returns:
+        tuple: (episodes [{link, text}], queries [{query, relevant}]).
+    """
+    rng = random.Random(seed)
+    seen = set()
+    vocabulary = _pseudo_words(rng, 3000, seen)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]  # Zipf like word frequencies
+    topic_terms = [_pseudo_words(rng, 12, seen) for _ in range(topics)]
+
+    corpus, own_terms, by_topic = [], [], {}
+    for i in range(episodes):
+        topic = i % topics
+        terms = _pseudo_words(rng, 4, seen)
+        link = f"{EPISODE_HOST}/{i:05d}-{terms[0]}/"
+        text = []
+        while len(text) < words:
+            sentence = rng.choices(vocabulary, weights, k=10) + rng.choices(_STOPWORDS, k=4)
+            sentence += rng.sample(topic_terms[topic], 2)
+            if rng.random() < 0.15:
+                sentence.append(rng.choice(terms))
+            rng.shuffle(sentence)
+            text.extend(sentence)
+        corpus.append({"link": link, "text": " ".join(text[:words]).capitalize() + "."})
+        own_terms.append(terms)
+        by_topic.setdefault(topic, []).append(link)
+
+    labeled = []
+    for q in range(queries):
+        if q % 2 == 0:
+            i = rng.randrange(episodes)
+            query = " ".join(rng.sample(own_terms[i], 2) + [rng.choice(topic_terms[i % topics])])
+            labeled.append({"query": query, "relevant": [corpus[i]["link"]]})
+        else:
+            # Only topics with episodes, with fewer episodes than topics some have none
+            topic = rng.choice(sorted(by_topic))
+            labeled.append({"query": " ".join(rng.sample(topic_terms[topic], 3)), "relevant": by_topic.get(topic, [])})
+    return corpus, labeled
+
+
+def _read_jsonl(path: str) -> list:
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _write_jsonl(path: str, records: list) -> None:
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def load_corpus(path: str) -> tuple:
+    """Load a saved corpus, returning (episodes, queries, captured pages by URL)."""
+    pages = {}
+    pages_path = os.path.join(path, "pages.jsonl")
+    if os.path.exists(pages_path):
+        for record in _read_jsonl(pages_path):
+            with open(os.path.join(path, record["file"]), "r", encoding="utf-8") as f:
+                pages[record["url"]] = f.read()
+    return _read_jsonl(os.path.join(path, "episodes.jsonl")), _read_jsonl(os.path.join(path, "queries.jsonl")), pages
+
+
+# Fixture pages
+
+def transcript_link(link: str) -> str:
+    return f"{TRANSCRIPT_HOST}/{hashlib.sha1(link.encode()).hexdigest()[:20]}"
+
+
+def episode_page(link: str) -> str:
+    """An episode page with show notes and the transcript link, as on the podcast site."""
+    notes = "".join(f"<p>Show notes paragraph {i} with <a href='/link/{i}'>a link</a>.</p>" for i in range(40))
+    return (f"<html><head><title>{link}</title><link rel='alternate' href='/feed/'></head><body>"
+            f"<article>{notes}<p><b>SHOW TRANSCRIPT: </b><a href=\"{transcript_link(link)}\">Transcript</a></p>"
+            f"</article></body></html>")
+
+
+def transcript_page(text: str, words_per_chunk: int = 120) -> str:
+    """A Google Docs transcript page, the text split over DOCS_modelChunk scripts."""
+    words = text.split()
+    parts = ["<html><body><script>var DOCS_timing = {};</script>"]
+    for i in range(0, len(words), words_per_chunk):
+        chunk = [{"ty": "is", "ibi": i + 1, "s": " ".join(words[i:i + words_per_chunk])},
+                 {"ty": "as", "st": "text", "si": 1, "ei": 1}]
+        parts.append(f"<script>DOCS_modelChunk = {json.dumps(chunk)}; "
+                     f"DOCS_modelChunkLoadStart = new Date().getTime();</script>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+class FixtureSite:
+    """Serves the pages of the corpus to httpx in place of the network."""
+
+    def __init__(self, episodes: list, captured: dict, latency: float):
+        self.pages = {}
+        for episode in episodes:
+            self.pages[episode["link"]] = episode_page(episode["link"])
+            self.pages[transcript_link(episode["link"])] = transcript_page(episode["text"])
+        self.pages.update(captured)
+        self.latency = latency
+        self.requests = 0
+
+    async def handle(self, request):
+        import httpx
+
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        content = self.pages.get(str(request.url))
+        if content is None:
+            return httpx.Response(404, text="not found")
+        return httpx.Response(200, text=content, headers={"content-type": "text/html; charset=utf-8"})
+
+
+class _NoBrowser:
+    """Browser pool stand-in, pages that would need rendering fail instead."""
+
+    async def arun(self, visit):
+        raise RuntimeError("The browser is disabled in the benchmark")
+
+    def run(self, visit):
+        raise RuntimeError("The browser is disabled in the benchmark")
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _hashed_feature(word: str, dimensions: int) -> tuple:
+    digest = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+    return digest % dimensions, 1.0 if digest >> 63 else -1.0
+
+
+class HashingEmbeddings:
+    """Deterministic bag of words embedder, a stand-in for the model that needs no download."""
+
+    def __init__(self, dimensions: int = 384):
+        self.dimensions = dimensions
+
+    def embed_query(self, text: str) -> list:
+        vector = [0.0] * self.dimensions
+        for word in text.lower().split():
+            index, sign = _hashed_feature(word.strip(".,"), self.dimensions)
+            vector[index] += sign
+        norm = sum(x * x for x in vector) ** 0.5 or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts: list) -> list:
+        return [self.embed_query(text) for text in texts]
+
+
+# Measurements
+
+def percentiles(seconds: list) -> dict:
+    ordered = sorted(seconds)
+    at = lambda p: ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+    return {"p50_ms": at(0.50), "p90_ms": at(0.90), "p99_ms": at(0.99),
+            "mean_ms": statistics.mean(ordered) * 1000, "count": len(ordered)}
+
+
+def relevance(ranked: list, relevant: list, ks: list) -> dict:
+    """
+    recall@k as the share of the relevant links found, out of at most k, and the reciprocal rank.
+    `relevant` must not be empty.
+    """
+    links = [result["link"] for result in ranked]
+    scores = {f"recall@{k}": len(set(links[:k]) & set(relevant)) / min(k, len(relevant)) for k in ks}
+    scores["mrr"] = next((1 / (rank + 1) for rank, link in enumerate(links) if link in relevant), 0.0)
+    return scores
+
+
+def mean_scores(rows: list) -> dict:
+    return {key: statistics.mean(row[key] for row in rows) for key in rows[0]} if rows else {}
+
+
+def directory_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args, episodes: list, queries: list, captured: dict, workdir: str) -> dict:
+    # Configuration is read from the environment at import, so the modules are imported
+    # once it points to the work directory
+    os.environ.update(DOC_LOCATION=os.path.join(workdir, "transcripts"),
+                      DB_PATH=os.path.join(workdir, "chroma_db"),
+                      EMBEDDING_CACHE_PATH=os.path.join(workdir, "embedding_cache.sqlite3"),
+                      MAX_RESULTS=str(max(args.k)),
+                      FETCH_MODE="http",
+                      ANONYMIZED_TELEMETRY="False")
+    import httpx
+    from langchain_core.messages import ToolMessage
+    import tools.visit_web_page_tool as visit_web_page_tool
+    import functions.download_transcripts_func as download
+    import functions.initialize_database as initialize
+    from common.embeddings import get_embeddings
+    from common.bm25_index import bm25_path
+    from common.index_generation import generation_path
+    from tools.query_database_tool import QueryDatabaseTool
+
+    site = FixtureSite(episodes, captured, args.fetch_latency_ms / 1000)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(site.handle))
+    visit_web_page_tool.get_async_http_client = lambda: client
+    visit_web_page_tool.get_browser_pool = lambda: _NoBrowser()
+    if args.embeddings == "hashing":
+        get_embeddings()._model = HashingEmbeddings()
+    os.makedirs(os.environ["DOC_LOCATION"], exist_ok=True)
+
+    results = {"revision": git_revision(), "config": {
+        "episodes": len(episodes), "queries": len(queries), "k": args.k, "embeddings": args.embeddings,
+        "corpus": args.corpus or "synthetic", "seed": args.seed, "fetch_latency_ms": args.fetch_latency_ms}}
+
+    # Ingestion
+    links = [episode["link"] for episode in episodes]
+    start = time.perf_counter()
+    asyncio.run(download.download_transcripts_func(
+        {"messages": [ToolMessage(content=json.dumps(links), tool_call_id="benchmark")]}))
+    download_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    initialize.initialize_database(None)
+    index_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    initialize.initialize_database(None)
+    noop_seconds = time.perf_counter() - start
+
+    tool = QueryDatabaseTool(db_path=os.environ["DB_PATH"], max_results=max(args.k))
+    chunks = tool._get_collection().count()
+    results["ingestion"] = {
+        "download_seconds": download_seconds, "episodes_per_second": len(episodes) / download_seconds,
+        "requests": site.requests, "index_seconds": index_seconds, "chunks": chunks,
+        "chunks_per_second": chunks / index_seconds, "noop_reindex_seconds": noop_seconds}
+    generation = generation_path(os.environ["DB_PATH"])
+    results["index_size_bytes"] = {
+        "transcript_store": directory_size(os.path.join(os.environ["DOC_LOCATION"], "store")),
+        "chroma": directory_size(generation) - directory_size(bm25_path(generation)),
+        "bm25": directory_size(bm25_path(generation)),
+        "embedding_cache": sum(directory_size(os.environ["EMBEDDING_CACHE_PATH"] + suffix)
+                               for suffix in ("", "-wal") if os.path.exists(os.environ["EMBEDDING_CACHE_PATH"] + suffix))}
+
+    # Queries, one at a time with the result and query embedding caches cleared so every
+    # search encodes and retrieves
+    tool.warm_up()
+    query_embeddings = tool.embedding_model
+    latencies = {"bm25": [], "dense": [], "fused": [], "fused_cached": []}
+    scores = {"bm25": [], "dense": [], "fused": []}
+    for labeled in queries:
+        query = labeled["query"]
+        start = time.perf_counter()
+        sparse = tool._sparse_search([query])[0]
+        latencies["bm25"].append(time.perf_counter() - start)
+        query_embeddings._query_cache.clear()
+        start = time.perf_counter()
+        dense = tool._dense_search(tool.embedding_model.embed_queries([query]))[0]
+        latencies["dense"].append(time.perf_counter() - start)
+        tool.result_cache.clear()
+        query_embeddings._query_cache.clear()
+        start = time.perf_counter()
+        fused = tool.batch_query([query])[0]
+        latencies["fused"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        tool.batch_query([query])
+        latencies["fused_cached"].append(time.perf_counter() - start)
+        # Queries without relevant links, possible in a --corpus, are timed but not scored
+        if labeled["relevant"]:
+            for name, ranked in (("bm25", sparse), ("dense", dense), ("fused", fused)):
+                scores[name].append(relevance(ranked, labeled["relevant"], args.k))
+    results["latency"] = {name: percentiles(values) for name, values in latencies.items()}
+    results["quality"] = {name: mean_scores(rows) for name, rows in scores.items()}
+
+    tool.result_cache.clear()
+    query_embeddings._query_cache.clear()
+    start = time.perf_counter()
+    tool.batch_query([labeled["query"] for labeled in queries])
+    results["throughput"] = {"batch_queries_per_second": len(queries) / (time.perf_counter() - start)}
+    return results
+
+
+# Reporting
+
+def print_results(results: dict) -> None:
+    ingestion = results["ingestion"]
+    print(f"revision {results['revision']}, {results['config']['episodes']} episodes, "
+          f"{results['config']['queries']} queries, {results['config']['embeddings']} embeddings")
+    print(f"download  {ingestion['download_seconds']:8.2f} s  {ingestion['episodes_per_second']:8.1f} episodes/s")
+    print(f"index     {ingestion['index_seconds']:8.2f} s  {ingestion['chunks_per_second']:8.1f} chunks/s "
+          f"({ingestion['chunks']} chunks), no-op reindex {ingestion['noop_reindex_seconds']:.2f} s")
+    print("size      " + ", ".join(f"{name} {size / 1e6:.2f} MB" for name, size in results["index_size_bytes"].items()))
+    for name, latency in results["latency"].items():
+        quality = results["quality"].get(name, {})
+        print(f"{name:<13} p50 {latency['p50_ms']:8.2f} ms  p90 {latency['p90_ms']:8.2f} ms  "
+              f"p99 {latency['p99_ms']:8.2f} ms  " + "  ".join(f"{key} {value:.3f}" for key, value in quality.items()))
+    print(f"batch     {results['throughput']['batch_queries_per_second']:8.1f} queries/s")
+
+
+def compare(results: dict, baseline: dict, tolerance: float, recall_drop: float) -> list:
+    """Return descriptions of the measurements that regressed against the baseline."""
+    regressions = []
+    revision = baseline.get("revision", "baseline")
+
+    def slower(name: str, new: float, old: float) -> None:
+        if new > old * (1 + tolerance):
+            regressions.append(f"{name}: {new:.2f} vs {old:.2f} in {revision}")
+
+    def lower(name: str, new: float, old: float, limit: float) -> None:
+        if new < limit:
+            regressions.append(f"{name}: {new:.3f} vs {old:.3f} in {revision}")
+
+    for name, latency in results["latency"].items():
+        if name in baseline.get("latency", {}):
+            slower(f"{name} p50 ms", latency["p50_ms"], baseline["latency"][name]["p50_ms"])
+            slower(f"{name} p90 ms", latency["p90_ms"], baseline["latency"][name]["p90_ms"])
+    for name in ("download_seconds", "index_seconds"):
+        if name in baseline.get("ingestion", {}):
+            slower(name, results["ingestion"][name], baseline["ingestion"][name])
+    if "throughput" in baseline:
+        new, old = results["throughput"]["batch_queries_per_second"], baseline["throughput"]["batch_queries_per_second"]
+        lower("batch queries/s", new, old, old / (1 + tolerance))
+    for name, quality in results["quality"].items():
+        for key, value in quality.items():
+            old = baseline.get("quality", {}).get(name, {}).get(key)
+            if old is not None:
+                lower(f"{name} {key}", value, old, old - recall_drop)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directory of a saved corpus, a synthetic one is generated by default")
+    parser.add_argument("--save-corpus", help="Write the synthetic corpus to this directory and exit")
+    parser.add_argument("--episodes", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--words", type=int, default=2500, help="Words per synthetic transcript")
+    parser.add_argument("--topics", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--embeddings", choices=["hashing", "model"], default="hashing",
+                        help="hashing needs no model download, model uses EMBEDDING_MODEL and EMBEDDING_BACKEND")
+    parser.add_argument("--fetch-latency-ms", type=float, default=0.0, help="Simulated latency of each page fetch")
+    parser.add_argument("--workdir", help="Directory for the indexes, a temporary one is removed afterwards")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown")
+    # Download order changes the Chroma insertion order, so recall varies slightly between runs
+    parser.add_argument("--recall-drop", type=float, default=0.05, help="Allowed absolute drop of recall and MRR")
+    args = parser.parse_args()
+
+    if args.corpus:
+        episodes, queries, captured = load_corpus(args.corpus)
+    else:
+        episodes, queries = synthetic_corpus(args.episodes, args.queries, args.words, args.topics, args.seed)
+        captured = {}
+    if args.save_corpus:
+        os.makedirs(args.save_corpus, exist_ok=True)
+        _write_jsonl(os.path.join(args.save_corpus, "episodes.jsonl"), episodes)
+        _write_jsonl(os.path.join(args.save_corpus, "queries.jsonl"), queries)
+        print(f"Saved {len(episodes)} episodes and {len(queries)} queries to {args.save_corpus}")
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="retrieval-benchmark-")
+    try:
+        results = run(args, episodes, queries, captured, os.path.abspath(workdir))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print_results(results)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.recall_drop)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
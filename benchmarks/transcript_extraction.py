@@ -0,0 +1,90 @@
+"""
+Benchmark of transcript extraction from Google Docs transcript pages.
+
+Compares the legacy full regex scan with the streaming extractor on captured pages, or on
+a synthetic page when none are given:
+
+    python -m benchmarks.transcript_extraction [page.html ...] [--chunks 20000] [--repeat 5]
+"""
+import argparse
+import io
+import json
+import os
+import re
+import time
+import tracemalloc
+from functions.extract_transcript_content_func import write_transcript_content
+
+
+def legacy_extract(html_content: str) -> str:
+    """The regex based extractor the streaming one replaced."""
+    text_content = []
+    for match in re.findall(r'DOCS_modelChunk\s=\s\[(.*?),\s*{', html_content, re.DOTALL):
+        data = json.loads(match)
+        if "s" in data:
+            text_content.append(data["s"])
+    return ' '.join(text_content)
+
+
+def streaming_extract(html_content: str) -> str:
+    output = io.StringIO()
+    write_transcript_content(html_content, output)
+    return output.getvalue()
+
+
+def streaming_extract_to_file(html_content: str) -> None:
+    """Streaming extraction as the download pipeline runs it, writing straight to a file."""
+    with open(os.devnull, "w") as f:
+        write_transcript_content(html_content, f)
+
+
+def synthetic_page(chunks: int, words_per_chunk: int = 120) -> str:
+    """A page shaped like a rendered Google Docs transcript with `chunks` model chunks."""
+    parts = ["<html><body><script>var DOCS_timing = {};</script>"]
+    for i in range(chunks):
+        text = " ".join(f"word{(i * words_per_chunk + j) % 997}" for j in range(words_per_chunk))
+        chunk = [{"ty": "is", "ibi": i * len(text) + 1, "s": f"Speaker {i % 3}: \"{text}\"\n"},
+                 {"ty": "as", "st": "text", "si": 1, "ei": len(text), "sm": {"ts_bd": i % 2 == 0}}]
+        parts.append(f"<script>DOCS_modelChunk = {json.dumps(chunk)}; "
+                     f"DOCS_modelChunkLoadStart = new Date().getTime();</script>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def measure(extract, html_content: str, repeat: int) -> dict:
+    """Best wall time over `repeat` runs and peak memory allocated by one run."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extract(html_content)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    extract(html_content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak, "mb_per_second": len(html_content) / best / 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="*", help="Captured transcript pages, as returned by fetch_page(clean_flag=True)")
+    parser.add_argument("--chunks", type=int, default=20000, help="Model chunks of the synthetic page")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pages = {path: open(path, encoding="utf-8").read() for path in args.pages}
+    if not pages:
+        pages = {f"synthetic ({args.chunks} chunks)": synthetic_page(args.chunks)}
+
+    for name, html_content in pages.items():
+        if legacy_extract(html_content) != streaming_extract(html_content):
+            print(f"{name}: extractors disagree")
+        print(f"{name}: {len(html_content) / 1e6:.1f} MB")
+        for label, extract in (("legacy regex", legacy_extract), ("streaming", streaming_extract_to_file)):
+            result = measure(extract, html_content, args.repeat)
+            print(f"  {label:<14} {result['seconds'] * 1000:9.1f} ms {result['mb_per_second']:8.1f} MB/s "
+                  f"peak {result['peak_bytes'] / 1e6:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
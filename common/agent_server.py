@@ -0,0 +1,557 @@
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+from typing import Optional
+from dotenv import load_dotenv
+from common.logging_config import logger
+from common.metrics import METRICS_PROFILE_PATH, counter, histogram, registry, span
+from common.query_router import CRAWL_TOOL_NAME, FEED_TOOL_NAME, QUERY_TOOL_NAME
+
+load_dotenv()
+
+SERVER_HOST = os.environ.get("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.environ.get("SERVER_PORT", "8080"))
+# Queries searched at the same time, and queries allowed to wait for a slot before the
+# server answers 503 instead of queueing more
+SERVER_MAX_CONCURRENT_QUERIES = int(os.environ.get("SERVER_MAX_CONCURRENT_QUERIES", "8"))
+SERVER_MAX_QUEUED_QUERIES = int(os.environ.get("SERVER_MAX_QUEUED_QUERIES", "64"))
+SERVER_QUERY_TIMEOUT = float(os.environ.get("SERVER_QUERY_TIMEOUT", "30"))
+# Queries routed at the same time, the LLM router calls the chat model for queries the rules
+# do not match. Waiting queries share the SERVER_MAX_QUEUED_QUERIES and SERVER_QUERY_TIMEOUT limits
+SERVER_MAX_CONCURRENT_ROUTES = int(os.environ.get("SERVER_MAX_CONCURRENT_ROUTES", "4"))
+# Queries arriving within SERVER_BATCH_WAIT_MS of each other are searched in one batch
+SERVER_BATCH_SIZE = int(os.environ.get("SERVER_BATCH_SIZE", "16"))
+SERVER_BATCH_WAIT_MS = float(os.environ.get("SERVER_BATCH_WAIT_MS", "5"))
+# Ingestion jobs run one at a time by default, in niced processes limited to SERVER_JOB_THREADS
+# threads, 0 gives them half of the cores. With more workers downloads run concurrently while
+# index builds still run one after the other, each waits for the build lock of the index root
+SERVER_JOB_WORKERS = int(os.environ.get("SERVER_JOB_WORKERS", "1"))
+SERVER_MAX_QUEUED_JOBS = int(os.environ.get("SERVER_MAX_QUEUED_JOBS", "8"))
+SERVER_JOB_THREADS = int(os.environ.get("SERVER_JOB_THREADS", "0"))
+SERVER_JOB_TIMEOUT = float(os.environ.get("SERVER_JOB_TIMEOUT", "3600"))
+SERVER_JOB_HISTORY = int(os.environ.get("SERVER_JOB_HISTORY", "100"))
+SERVER_MAX_SESSIONS = int(os.environ.get("SERVER_MAX_SESSIONS", "1000"))
+SERVER_SESSION_HISTORY = int(os.environ.get("SERVER_SESSION_HISTORY", "20"))
+SERVER_MAX_BODY = int(os.environ.get("SERVER_MAX_BODY", str(1024 * 1024)))
+# Seconds a keep-alive connection may sit idle before the next request, and seconds a client
+# has to send the rest of a request once it started
+SERVER_IDLE_TIMEOUT = float(os.environ.get("SERVER_IDLE_TIMEOUT", "60"))
+SERVER_READ_TIMEOUT = float(os.environ.get("SERVER_READ_TIMEOUT", "30"))
+
+INGESTION_TOOLS = (CRAWL_TOOL_NAME, FEED_TOOL_NAME)
+
+server_requests = counter("server_requests_total", "HTTP requests served, by route and status")
+server_request_seconds = histogram("server_request_seconds", "Time to answer an HTTP request, by route")
+server_rejections = counter("server_rejections_total", "Requests refused by admission control, by reason")
+server_jobs = counter("server_jobs_total", "Ingestion jobs finished, by tool and status")
+
+
+class HttpError(Exception):
+    """Error answered with an HTTP status and a JSON message."""
+
+    def __init__(self, status: int, message: str, headers: Optional[dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class AdmissionLimiter:
+    """
+    Caps the requests running a stage at the same time. Requests beyond `max_concurrent` wait
+    up to `timeout` seconds for a slot, and are refused with 503 once `max_queued` are waiting.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queued: int, timeout: float):
+        self.name = name
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if not self._slots.locked():
+            await self._slots.acquire()
+        elif self.waiting >= self.max_queued:
+            server_rejections.inc(reason="queue_full", stage=self.name)
+            raise HttpError(503, f"Too many {self.name} requests waiting, retry later", {"Retry-After": "1"})
+        else:
+            self.waiting += 1
+            try:
+                async with asyncio.timeout(self.timeout):
+                    await self._slots.acquire()
+            except TimeoutError:
+                server_rejections.inc(reason="timeout", stage=self.name)
+                raise HttpError(503, f"Timed out waiting for a {self.name} slot, retry later",
+                                {"Retry-After": "1"})
+            finally:
+                self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+
+class QueryBatcher:
+    """
+    Collects queries arriving within `max_wait` seconds of each other, up to `max_batch`, and
+    answers them with one abatch_query call, so concurrent sessions share forward passes and
+    index lookups.
+    """
+
+    def __init__(self, query_tool, max_batch: int = SERVER_BATCH_SIZE,
+                 max_wait: float = SERVER_BATCH_WAIT_MS / 1000):
+        self.query_tool = query_tool
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def query(self, text: str) -> list:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list) -> None:
+        try:
+            results = await self.query_tool.abatch_query([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class JobQueue:
+    """
+    Background queue of crawl and feed ingestion jobs. Each job runs functions.ingest_job in
+    its own process, niced and with capped thread counts, so ingestion does not starve the
+    queries served by this process. Jobs report their stage on stdout for status polling.
+    A job for a tool call that is already queued or running is not queued twice.
+    """
+
+    def __init__(self, workers: int = SERVER_JOB_WORKERS, max_queued: int = SERVER_MAX_QUEUED_JOBS,
+                 threads: int = SERVER_JOB_THREADS, timeout: float = SERVER_JOB_TIMEOUT,
+                 history: int = SERVER_JOB_HISTORY):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.threads = threads if threads > 0 else max(1, (os.cpu_count() or 1) // 2)
+        self.timeout = timeout
+        self.history = history
+        self.jobs = OrderedDict()
+        self._queue = asyncio.Queue()
+        self._worker_tasks = []
+        self._processes = {}
+
+    def start(self) -> None:
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, tool: str, args: dict) -> dict:
+        """Queue a job, or return the queued or running job for the same tool call."""
+        key = f"{tool} {json.dumps(args, sort_keys=True)}"
+        for job in self.jobs.values():
+            if job["key"] == key and job["status"] in ("queued", "running"):
+                return job
+        if sum(job["status"] == "queued" for job in self.jobs.values()) >= self.max_queued:
+            raise JobQueueFull(f"{self.max_queued} jobs are already queued")
+        job = {"id": uuid.uuid4().hex[:12], "key": key, "tool": tool, "args": args, "status": "queued",
+               "stage": None, "progress": {}, "result": None, "error": None,
+               "created_at": time.time(), "started_at": None, "finished_at": None}
+        self.jobs[job["id"]] = job
+        self._queue.put_nowait(job["id"])
+        self._forget_finished()
+        logger.info(f"Queued ingestion job {job['id']}: {tool} {args}")
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.jobs.get(job_id)
+
+    def counts(self) -> dict:
+        counts = {}
+        for job in self.jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return counts
+
+    def _forget_finished(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in ("succeeded", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    def _job_env(self, job_id: str) -> dict:
+        env = dict(os.environ)
+        threads = str(self.threads)
+        env.update(EMBEDDING_THREADS=threads, EMBED_WORKERS="1", INGEST_WORKERS=threads,
+                   OMP_NUM_THREADS=threads, MKL_NUM_THREADS=threads,
+                   METRICS_PROFILE_PATH=f"{METRICS_PROFILE_PATH}.{job_id}")
+        # The server owns the Prometheus port, the job only appends to the JSON-lines file
+        env["METRICS_EXPORT"] = ",".join(name for name in env.get("METRICS_EXPORT", "").split(",")
+                                         if name.strip() and name.strip() != "prometheus")
+        return env
+
+    async def _worker(self) -> None:
+        while True:
+            job = self.jobs.get(await self._queue.get())
+            if job is not None:
+                await self._run(job)
+
+    async def _run(self, job: dict) -> None:
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        errors = deque(maxlen=20)
+
+        async def read_events(stream):
+            async for line in stream:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(event, dict):
+                    continue
+                if "stage" in event:
+                    job["stage"] = event.pop("stage")
+                    job["progress"].update(event)
+                elif "result" in event:
+                    job["result"] = event["result"]
+                elif "error" in event:
+                    job["error"] = event["error"]
+
+        async def read_errors(stream):
+            async for line in stream:
+                errors.append(line.decode("utf-8", "replace").rstrip())
+
+        with span("server.job", tool=job["tool"], job=job["id"]):
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "functions.ingest_job", job["tool"], json.dumps(job["args"]),
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=self._job_env(job["id"]))
+            self._processes[job["id"]] = process
+            try:
+                async with asyncio.timeout(self.timeout):
+                    await asyncio.gather(read_events(process.stdout), read_errors(process.stderr), process.wait())
+            except TimeoutError:
+                process.kill()
+                await process.wait()
+                job["error"] = f"timed out after {self.timeout:.0f}s"
+            finally:
+                self._processes.pop(job["id"], None)
+
+        job["finished_at"] = time.time()
+        job["status"] = "succeeded" if process.returncode == 0 and job["error"] is None else "failed"
+        if job["status"] == "failed" and job["error"] is None:
+            job["error"] = "\n".join(errors) or f"exit status {process.returncode}"
+        server_jobs.inc(tool=job["tool"], status=job["status"])
+        logger.info(f"Ingestion job {job['id']} {job['status']} in "
+                    f"{job['finished_at'] - job['started_at']:.1f}s: {job['result'] or job['error']}")
+
+    async def close(self) -> None:
+        """Stop running jobs and the workers, queued jobs are dropped."""
+        processes = list(self._processes.values())
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            await process.wait()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+
+
+class SessionStore:
+    """Recent queries of each session, the least recently used sessions are dropped first."""
+
+    def __init__(self, max_sessions: int = SERVER_MAX_SESSIONS, history: int = SERVER_SESSION_HISTORY):
+        self.max_sessions = max_sessions
+        self.history = history
+        self.sessions = OrderedDict()
+
+    def get(self, session_id: Optional[str]) -> dict:
+        """Return the session, creating it when the id is unknown or missing."""
+        session = self.sessions.get(session_id) if session_id else None
+        if session is None:
+            session_id = session_id or uuid.uuid4().hex
+            session = self.sessions[session_id] = {"id": session_id, "created_at": time.time(),
+                                                   "queries": 0, "history": deque(maxlen=self.history)}
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def record(self, session: dict, entry: dict) -> None:
+        session["queries"] += 1
+        session["history"].append({"at": time.time(), **entry})
+
+
+def _json_default(value):
+    if isinstance(value, deque):
+        return list(value)
+    return str(value)
+
+
+class AgentServer:
+    """
+    HTTP server answering concurrent query sessions over one shared, warm QueryDatabaseTool.
+
+    POST /query {"query", "session"} picks a tool like the graph does. Searches are answered
+    right away, crawl and feed requests are queued as background jobs and answered with 202
+    and the job, whose status is polled with GET /jobs/<id>. Queries beyond
+    SERVER_MAX_CONCURRENT_ROUTES being routed, or SERVER_MAX_CONCURRENT_QUERIES being searched,
+    wait for a slot, and are refused with 503 once SERVER_MAX_QUEUED_QUERIES are waiting. Also served: POST /jobs {"tool", "args"},
+    GET /jobs, GET /sessions/<id>, GET /health and GET /metrics.
+    """
+
+    def __init__(self, query_tool, choose_tool, jobs: Optional[JobQueue] = None,
+                 max_concurrent: int = SERVER_MAX_CONCURRENT_QUERIES,
+                 max_queued: int = SERVER_MAX_QUEUED_QUERIES, query_timeout: float = SERVER_QUERY_TIMEOUT,
+                 max_concurrent_routes: int = SERVER_MAX_CONCURRENT_ROUTES):
+        """
+        Args:
+            query_tool (QueryDatabaseTool): Shared query tool.
+            choose_tool: Coroutine function returning the AIMessage with the tool call for a query.
+            jobs (Optional[JobQueue]): Queue of ingestion jobs.
+            max_concurrent (int): Queries searched at the same time.
+            max_queued (int): Queries waiting for a slot before new ones are refused.
+            query_timeout (float): Seconds a query waits for a slot before it is refused.
+            max_concurrent_routes (int): Queries routed to a tool at the same time.
+        """
+        self.query_tool = query_tool
+        self.choose_tool = choose_tool
+        self.jobs = jobs or JobQueue()
+        self.sessions = SessionStore()
+        self.batcher = QueryBatcher(query_tool)
+        self.routes = AdmissionLimiter("route", max_concurrent_routes, max_queued, query_timeout)
+        self.searches = AdmissionLimiter("query", max_concurrent, max_queued, query_timeout)
+        self._server = None
+
+    async def start(self, host: str = SERVER_HOST, port: int = SERVER_PORT) -> None:
+        self.jobs.start()
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        address = self._server.sockets[0].getsockname()
+        logger.info(f"Agent server listening on {address[0]}:{address[1]}")
+        print(f"Agent server listening on http://{address[0]}:{address[1]}")
+
+    async def serve_forever(self) -> None:
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        await self.jobs.close()
+
+    # HTTP
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as e:
+                    await self._respond(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    return
+                if request is None:
+                    return
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload, extra_headers = await self._dispatch(method, path, body)
+                await self._respond(writer, status, payload, keep_alive, extra_headers)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[tuple]:
+        """Read the next request, None when the client closed or left the connection idle."""
+        try:
+            async with asyncio.timeout(SERVER_IDLE_TIMEOUT):
+                line = await self._read_line(reader)
+        except TimeoutError:
+            return None
+        if not line:
+            return None
+        try:
+            async with asyncio.timeout(SERVER_READ_TIMEOUT):
+                return await self._read_rest(reader, line)
+        except TimeoutError:
+            raise HttpError(408, "Timed out reading the request")
+
+    @staticmethod
+    async def _read_line(reader: asyncio.StreamReader) -> bytes:
+        try:
+            return await reader.readline()
+        except ValueError:
+            # Raised by the stream for lines longer than its buffer limit
+            raise HttpError(400, "Request line or header too long")
+
+    async def _read_rest(self, reader: asyncio.StreamReader, line: bytes) -> tuple:
+        try:
+            method, target, _ = line.decode("latin-1").split()
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+        headers = {}
+        while True:
+            line = await self._read_line(reader)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HttpError(400, "Invalid Content-Length")
+        if length > SERVER_MAX_BODY:
+            raise HttpError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], headers, body
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool = True,
+                       extra_headers: Optional[dict] = None) -> None:
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload, default=_json_default).encode("utf-8"), "application/json"
+        headers = {"Content-Type": content_type, "Content-Length": str(len(body)),
+                   "Connection": "keep-alive" if keep_alive else "close", **(extra_headers or {})}
+        head = f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n" + \
+            "".join(f"{name}: {value}\r\n" for name, value in headers.items()) + "\r\n"
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> tuple:
+        """Route a request, returning (status, payload, extra headers)."""
+        parts = [part for part in path.split("/") if part]
+        route = "/" + (parts[0] if parts else "")
+        start = time.perf_counter()
+        status, payload, headers = 500, {"error": "Internal server error"}, {}
+        try:
+            with span("server.request", method=method, path=path):
+                if method == "POST" and parts == ["query"]:
+                    status, payload = await self._query(self._json_body(body))
+                elif method == "POST" and parts == ["jobs"]:
+                    request = self._json_body(body)
+                    status, payload = 202, self._submit_job(request.get("tool"), request.get("args") or {})
+                elif method == "GET" and parts == ["jobs"]:
+                    status, payload = 200, {"jobs": list(self.jobs.jobs.values())}
+                elif method == "GET" and len(parts) == 2 and parts[0] == "jobs":
+                    job = self.jobs.get(parts[1])
+                    if job is None:
+                        raise HttpError(404, f"Unknown job {parts[1]}")
+                    status, payload = 200, job
+                elif method == "GET" and len(parts) == 2 and parts[0] == "sessions":
+                    if parts[1] not in self.sessions.sessions:
+                        raise HttpError(404, f"Unknown session {parts[1]}")
+                    status, payload = 200, self.sessions.get(parts[1])
+                elif method == "GET" and parts == ["health"]:
+                    status, payload = 200, self._health()
+                elif method == "GET" and parts == ["metrics"]:
+                    status, payload = 200, registry.render_prometheus()
+                else:
+                    raise HttpError(404, f"No route for {method} {path}")
+        except HttpError as e:
+            status, payload, headers = e.status, {"error": str(e)}, e.headers
+        except Exception as e:
+            logger.error(f"Error answering {method} {path}: {e}")
+        server_requests.inc(route=route, status=status)
+        server_request_seconds.observe(time.perf_counter() - start, route=route)
+        return status, payload, headers
+
+    @staticmethod
+    def _json_body(body: bytes) -> dict:
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            raise HttpError(400, "Request body is not valid JSON")
+        if not isinstance(request, dict):
+            raise HttpError(400, "Request body must be a JSON object")
+        return request
+
+    # Endpoints
+
+    async def _query(self, request: dict) -> tuple:
+        query = request.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise HttpError(400, "Missing query")
+        session = self.sessions.get(request.get("session"))
+
+        # Routing may call the chat model, so it is admitted like the search
+        async with self.routes.slot():
+            response = await self.choose_tool(query)
+        tool_call = response.tool_calls[0] if response.tool_calls else None
+        if tool_call is None:
+            self.sessions.record(session, {"query": query, "tool": None})
+            return 200, {"session": session["id"], "tool": None, "message": response.content}
+
+        if tool_call["name"] in INGESTION_TOOLS:
+            job = self._submit_job(tool_call["name"], tool_call["args"])
+            self.sessions.record(session, {"query": query, "tool": tool_call["name"], "job": job["id"]})
+            return 202, {"session": session["id"], "tool": tool_call["name"], "job": job}
+
+        if tool_call["name"] != QUERY_TOOL_NAME:
+            raise HttpError(400, f"Unsupported tool {tool_call['name']}")
+        results = await self._admitted_search(tool_call["args"]["query"])
+        self.sessions.record(session, {"query": query, "tool": QUERY_TOOL_NAME,
+                                       "links": [result["link"] for result in results]})
+        return 200, {"session": session["id"], "tool": QUERY_TOOL_NAME, "results": results}
+
+    async def _admitted_search(self, query: str) -> list:
+        """Search once a query slot is free, refusing the query when too many are waiting."""
+        async with self.searches.slot():
+            return await self.batcher.query(query)
+
+    def _submit_job(self, tool: Optional[str], args: dict) -> dict:
+        if tool not in INGESTION_TOOLS:
+            raise HttpError(400, f"Jobs run one of {', '.join(INGESTION_TOOLS)}")
+        if not isinstance(args, dict) or not args.get("url"):
+            raise HttpError(400, "Job arguments need a url")
+        try:
+            return self.jobs.submit(tool, args)
+        except JobQueueFull as e:
+            server_rejections.inc(reason="job_queue_full")
+            raise HttpError(429, str(e), {"Retry-After": "60"})
+
+    def _health(self) -> dict:
+        return {"status": "ok", "queries_active": self.searches.active, "queries_waiting": self.searches.waiting,
+                "routes_active": self.routes.active, "routes_waiting": self.routes.waiting,
+                "sessions": len(self.sessions.sessions), "jobs": self.jobs.counts(),
+                "index_generation": self.query_tool.generation}
+
+
+async def serve(query_tool, choose_tool, host: str = SERVER_HOST, port: int = SERVER_PORT) -> None:
+    """Run the agent server until it is cancelled."""
+    server = AgentServer(query_tool, choose_tool)
+    await server.start(host, port)
+    await server.serve_forever()
@@ -0,0 +1,161 @@
+import json
+import os
+import shutil
+from typing import Optional
+from dotenv import load_dotenv
+from common.logging_config import logger
+from common.metrics import traced
+from common.transcript_store import TranscriptStore
+
+load_dotenv()
+
+# The BM25 index lives in this directory of each index generation, next to the vector store
+# it is published with
+BM25_DIR_NAME = "bm25"
+BM25_STOPWORDS = os.environ.get("BM25_STOPWORDS", "en")
+
+MANIFEST_FILE_NAME = "manifest.json"
+TOKENS_FILE_NAME = "tokens.jsonl"
+SNIPPET_LENGTH = 300
+
+
+def tokenize(texts, show_progress: bool = False) -> list:
+    """Tokenize a text or list of texts into lists of string tokens."""
+    import bm25s
+
+    return bm25s.tokenize(texts, stopwords=BM25_STOPWORDS, return_ids=False, show_progress=show_progress)
+
+
+def _read_tokens(path: str) -> dict:
+    tokens = {}
+    tokens_path = os.path.join(path, TOKENS_FILE_NAME)
+    if os.path.exists(tokens_path):
+        with open(tokens_path, "r") as f:
+            for line in f:
+                record = json.loads(line)
+                tokens[record["hash"]] = record["tokens"]
+    return tokens
+
+
+def _read_manifest(path: str) -> Optional[dict]:
+    manifest_path = os.path.join(path, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def bm25_path(generation: str) -> str:
+    """Return the directory of the BM25 index in the index generation at `generation`."""
+    return os.path.join(generation, BM25_DIR_NAME)
+
+
+def is_bm25_up_to_date(generation: Optional[str], entries: dict) -> bool:
+    """Return True if the generation at `generation` holds the BM25 index of the transcript index entries."""
+    manifest = _read_manifest(bm25_path(generation)) if generation else None
+    return manifest is not None and manifest["hashes"] == sorted(entry["hash"] for entry in entries.values())
+
+
+@traced("bm25_update")
+def update_bm25_index(entries: dict, doc_location: str, build_path: str, current: Optional[str] = None,
+                      store: Optional[TranscriptStore] = None) -> bool:
+    """
+    Write the BM25 index of the transcript index entries into the generation being built at
+    `build_path`, which is published together with the vector store.
+
+    Only the transcript text is indexed; link, title and a short snippet are kept as the
+    corpus returned with results. Tokens are cached per content hash, so only transcripts
+    added since the `current` generation are read and tokenized. BM25 scores depend on corpus
+    wide statistics, so the score matrix itself is rebuilt from the cached tokens, which is
+    cheap compared to reading and tokenizing the corpus.
+    Args:
+        entries (dict): Transcript index entries, title -> {title, link, hash}.
+        doc_location (str): Directory holding the transcript store.
+        build_path (str): Directory of the generation being built.
+        current (Optional[str]): Directory of the published generation, its tokens are reused.
+        store (Optional[TranscriptStore]): Open transcript store, opened from doc_location if None.
+    Returns:
+        bool: True if the index was rebuilt, False if the generation already held it.
+    """
+    if is_bm25_up_to_date(build_path, entries):
+        logger.info("BM25 index is up to date.")
+        return False
+    wanted = sorted(entries.values(), key=lambda entry: entry["hash"])
+    # The build may start from a copy of the current generation, with its old index
+    shutil.rmtree(bm25_path(build_path), ignore_errors=True)
+    os.makedirs(bm25_path(build_path))
+    _build(wanted, doc_location, bm25_path(current) if current else None, bm25_path(build_path), store)
+    logger.info(f"BM25 index with {len(wanted)} transcripts written to {build_path}.")
+    return True
+
+
+def _build(wanted: list, doc_location: str, current: Optional[str], build_path: str,
+           store: Optional[TranscriptStore]) -> None:
+    """Write and validate the index of the `wanted` entries at `build_path`, reusing the tokens of `current`."""
+    import bm25s
+
+    manifest = _read_manifest(current) if current else None
+    cached_tokens = _read_tokens(current) if manifest else {}
+    snippets = {item["hash"]: item["snippet"] for item in manifest.get("corpus", [])} if manifest else {}
+    new_entries = [entry for entry in wanted if entry["hash"] not in cached_tokens]
+    logger.info(f"Updating BM25 index: {len(new_entries)} new transcripts, "
+                f"{len(wanted) - len(new_entries)} cached.")
+    if new_entries:
+        own_store = store is None
+        store = TranscriptStore(doc_location) if own_store else store
+        try:
+            texts = dict(store.iter_texts(entry["hash"] for entry in new_entries))
+        finally:
+            if own_store:
+                store.close()
+        hashes = list(texts)
+        for hash_val, tokens in zip(hashes, tokenize([texts[hash_val] for hash_val in hashes])):
+            cached_tokens[hash_val] = tokens
+            snippets[hash_val] = texts[hash_val][:SNIPPET_LENGTH]
+        # Transcripts missing from the store are indexed without text
+        for entry in new_entries:
+            cached_tokens.setdefault(entry["hash"], [])
+
+    corpus = [{"link": entry["link"], "title": entry["title"], "hash": entry["hash"],
+               "snippet": snippets.get(entry["hash"], "")} for entry in wanted]
+    corpus_tokens = [cached_tokens[entry["hash"]] for entry in wanted]
+
+    if corpus_tokens:
+        retriever = bm25s.BM25()
+        retriever.index(corpus_tokens, show_progress=False)
+        retriever.save(build_path, corpus=corpus)
+    with open(os.path.join(build_path, TOKENS_FILE_NAME), "w") as f:
+        for entry, tokens in zip(wanted, corpus_tokens):
+            f.write(json.dumps({"hash": entry["hash"], "tokens": tokens}) + "\n")
+    with open(os.path.join(build_path, MANIFEST_FILE_NAME), "w") as f:
+        json.dump({"hashes": [entry["hash"] for entry in wanted], "corpus": corpus}, f)
+    _validate(build_path, len(wanted))
+
+
+def _validate(path: str, transcripts: int) -> None:
+    """Check that the index built at `path` loads and holds every transcript."""
+    manifest = _read_manifest(path)
+    if manifest is None or len(manifest["hashes"]) != transcripts:
+        raise ValueError(f"BM25 index at {path} does not list {transcripts} transcripts")
+    if transcripts:
+        retriever = _load(path)
+        if len(retriever.corpus) != transcripts:
+            raise ValueError(f"BM25 index at {path} has {len(retriever.corpus)} documents, expected {transcripts}")
+
+
+def _load(path: str):
+    import bm25s
+
+    return bm25s.BM25.load(path, load_corpus=True, mmap=True)
+
+
+def load_bm25_index(generation: str):
+    """Load the BM25 index of the index generation at `generation` with its corpus, memory mapping the score matrix."""
+    path = bm25_path(generation)
+    manifest = _read_manifest(path)
+    if manifest is None:
+        raise FileNotFoundError(f"BM25 index does not exist: {path}")
+    if not manifest["hashes"]:
+        raise ValueError(f"BM25 index is empty: {path}")
+    logger.info(f"Loading BM25 index from {path}")
+    return _load(path)
@@ -0,0 +1,185 @@
+import asyncio
+import atexit
+import os
+import threading
+from typing import Any, Awaitable, Callable, Optional
+from dotenv import load_dotenv
+from common.logging_config import logger
+
+load_dotenv()
+
+BROWSER_MAX_PAGES = int(os.environ.get("BROWSER_MAX_PAGES", "4"))
+BROWSER_PAGE_MAX_NAVIGATIONS = int(os.environ.get("BROWSER_PAGE_MAX_NAVIGATIONS", "50"))
+
+
+class _PooledPage:
+    """A browser context with a single page and the number of navigations done with it."""
+
+    def __init__(self, context, page):
+        self.context = context
+        self.page = page
+        self.navigations = 0
+
+
+class BrowserPool:
+    """
+    Long-lived headless Chromium shared by the crawl and visit tools.
+
+    Playwright objects are bound to the event loop that created them, so the pool owns a
+    dedicated event loop running on a daemon thread. Callers hand the pool a coroutine
+    function that receives a page; it is executed on the pool loop and its result is returned
+    either synchronously (`run`) or to the caller's own event loop (`arun`).
+    """
+
+    def __init__(self, max_pages: int = BROWSER_MAX_PAGES,
+                 page_max_navigations: int = BROWSER_PAGE_MAX_NAVIGATIONS):
+        """
+        Args:
+            max_pages (int): Maximum number of pages open at the same time.
+            page_max_navigations (int): Number of navigations after which a page and its
+                context are closed and replaced with fresh ones.
+        """
+        self.max_pages = max_pages
+        self.page_max_navigations = page_max_navigations
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._playwright = None
+        self._browser = None
+        self._idle = None  # asyncio.Queue of idle _PooledPage, created on the pool loop
+        self._slots = None  # asyncio.Semaphore capping concurrent pages
+        self._launch_lock = None  # asyncio.Lock serializing browser launches, created on the pool loop
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                name="browser-pool", daemon=True)
+                self._thread.start()
+        return self._loop
+
+    async def _ensure_browser(self):
+        if self._browser is not None and self._browser.is_connected():
+            return self._browser
+
+        # Only ever touched from the pool loop, so creating them without a lock is safe
+        if self._launch_lock is None:
+            self._launch_lock = asyncio.Lock()
+            self._idle = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_pages)
+
+        # Concurrent first callers wait for a single launch
+        async with self._launch_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return self._browser
+
+            from playwright.async_api import async_playwright
+
+            logger.info(f"Launching shared Chromium browser (max_pages={self.max_pages}, "
+                        f"page_max_navigations={self.page_max_navigations}).")
+            # Idle pages of a disconnected browser cannot be used anymore
+            while not self._idle.empty():
+                self._idle.get_nowait()
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(headless=True)
+            return self._browser
+
+    async def _acquire(self) -> _PooledPage:
+        browser = await self._ensure_browser()
+        await self._slots.acquire()
+        try:
+            if not self._idle.empty():
+                return self._idle.get_nowait()
+            context = await browser.new_context()
+            page = await context.new_page()
+            return _PooledPage(context, page)
+        except Exception:
+            self._slots.release()
+            raise
+
+    async def _release(self, pooled: _PooledPage, healthy: bool = True) -> None:
+        try:
+            if healthy and pooled.navigations < self.page_max_navigations and not pooled.page.is_closed():
+                self._idle.put_nowait(pooled)
+                return
+            logger.debug(f"Recycling browser page after {pooled.navigations} navigations.")
+            await self._close_pooled(pooled)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    async def _close_pooled(pooled: _PooledPage) -> None:
+        try:
+            await pooled.context.close()
+        except Exception as e:
+            logger.warning(f"Error closing browser context: {e}")
+
+    async def _with_page(self, func: Callable[[Any], Awaitable[Any]]) -> Any:
+        pooled = await self._acquire()
+        healthy = True
+        try:
+            pooled.navigations += 1
+            return await func(pooled.page)
+        except Exception:
+            # A page that raised may be left on an error or crashed; do not hand it out again.
+            healthy = False
+            raise
+        finally:
+            await self._release(pooled, healthy)
+
+    def run(self, func: Callable[[Any], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """
+        Run `func(page)` on a pooled page and block until it finishes.
+        Must not be called from the pool's own event loop.
+        """
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self._with_page(func), loop)
+        return future.result(timeout)
+
+    async def arun(self, func: Callable[[Any], Awaitable[Any]]) -> Any:
+        """Run `func(page)` on a pooled page and await the result from any event loop."""
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self._with_page(func), loop)
+        return await asyncio.wrap_future(future)
+
+    async def _shutdown(self) -> None:
+        if self._idle is not None:
+            while not self._idle.empty():
+                await self._close_pooled(self._idle.get_nowait())
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        # They belong to this loop, a later run starts a new one
+        self._launch_lock = self._idle = self._slots = None
+
+    def close(self) -> None:
+        """Close the browser and stop the pool event loop."""
+        if self._loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(30)
+        except Exception as e:
+            logger.warning(f"Error shutting down browser pool: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = None
+        self._thread = None
+
+
+_browser_pool: Optional[BrowserPool] = None
+_browser_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """Return the process-wide browser pool, creating it on first use."""
+    global _browser_pool
+    with _browser_pool_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool()
+            atexit.register(_browser_pool.close)
+        return _browser_pool
@@ -6,4 +6,10 @@ class GraphState(TypedDict):
     query: str
     html_content: str
     messages: any
-    results: list[Document]
\ No newline at end of file
+    results: list[Document]
+
+
+class SearchResult(TypedDict):
+    link: str
+    score: float
+    snippet: str
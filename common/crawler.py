@@ -0,0 +1,174 @@
+import asyncio
+import os
+import re
+import time
+from typing import Awaitable, Callable, Optional
+from urllib.parse import urldefrag, urljoin, urlparse
+from dotenv import load_dotenv
+from common.logging_config import logger
+
+load_dotenv()
+
+CRAWL_WORKERS = int(os.environ.get("CRAWL_WORKERS", "8"))
+CRAWL_PER_HOST_CONCURRENCY = int(os.environ.get("CRAWL_PER_HOST_CONCURRENCY", "2"))
+CRAWL_PER_HOST_DELAY = float(os.environ.get("CRAWL_PER_HOST_DELAY", "0.5"))
+CRAWL_MAX_PAGES = int(os.environ.get("CRAWL_MAX_PAGES", "5000"))
+CRAWL_MAX_FRONTIER = int(os.environ.get("CRAWL_MAX_FRONTIER", "20000"))
+
+
+class HostLimiter:
+    """Per-host concurrency cap plus a minimum delay between request starts to the same host."""
+
+    def __init__(self, concurrency: int, delay: float):
+        self.concurrency = concurrency
+        self.delay = delay
+        self._semaphores = {}
+        self._locks = {}
+        self._next_start = {}
+
+    async def acquire(self, host: str) -> None:
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.concurrency))
+        await semaphore.acquire()
+        try:
+            # Space out request starts to the same host
+            async with self._locks.setdefault(host, asyncio.Lock()):
+                now = time.monotonic()
+                start = max(now, self._next_start.get(host, now))
+                self._next_start[host] = start + self.delay
+            if start > now:
+                await asyncio.sleep(start - now)
+        except BaseException:
+            # Cancelled while waiting, the caller never gets to release the slot
+            semaphore.release()
+            raise
+
+    def release(self, host: str) -> None:
+        self._semaphores[host].release()
+
+
+def normalize_url(base: str, href: str) -> Optional[str]:
+    """Resolve `href` against `base` and drop the fragment; return None for non http(s) links."""
+    full_url, _ = urldefrag(urljoin(base, href.strip()))
+    if urlparse(full_url).scheme not in ['http', 'https']:
+        return None
+    return full_url
+
+
+class Crawler:
+    """
+    Breadth-first crawler with a deduplicated, bounded frontier and a pool of concurrent workers.
+
+    `fetch_links(url)` is awaited for each visited page and must return the raw hrefs found
+    on it. Links found on pages up to `max_depth` are reported; pages beyond it are not visited.
+    """
+
+    def __init__(self,
+                 fetch_links: Callable[[str], Awaitable[list]],
+                 max_depth: int = 2,
+                 workers: int = CRAWL_WORKERS,
+                 per_host_concurrency: int = CRAWL_PER_HOST_CONCURRENCY,
+                 per_host_delay: float = CRAWL_PER_HOST_DELAY,
+                 max_pages: int = CRAWL_MAX_PAGES,
+                 max_frontier: int = CRAWL_MAX_FRONTIER,
+                 same_domain: bool = True,
+                 url_pattern: Optional[str] = None):
+        """
+        Args:
+            fetch_links: Coroutine function returning the hrefs found on a page.
+            max_depth (int): Maximum depth of pages to visit, the start page is depth 0.
+            workers (int): Number of pages fetched concurrently.
+            per_host_concurrency (int): Maximum concurrent fetches against a single host.
+            per_host_delay (float): Minimum seconds between fetch starts against a single host.
+            max_pages (int): Budget of pages to visit.
+            max_frontier (int): Maximum number of pages waiting to be visited.
+            same_domain (bool): Only record and follow links on the start URL's host.
+            url_pattern (Optional[str]): Regular expression that links must match to be crawled.
+        """
+        self.fetch_links = fetch_links
+        self.max_depth = max_depth
+        self.workers = max(1, workers)
+        self.max_pages = max_pages
+        self.max_frontier = max_frontier
+        self.same_domain = same_domain
+        self.url_pattern = re.compile(url_pattern) if url_pattern else None
+        self.host_limiter = HostLimiter(per_host_concurrency, per_host_delay)
+
+        self.seen = set()  # every in-scope URL discovered, the crawl result
+        self.pages_visited = 0
+        self.pages_dropped = 0
+        self._allowed_host = None
+
+    def in_scope(self, url: str) -> bool:
+        """Return True if `url` should be recorded and followed."""
+        if self.same_domain and urlparse(url).hostname != self._allowed_host:
+            return False
+        if self.url_pattern is not None and not self.url_pattern.search(url):
+            return False
+        return True
+
+    async def run(self, start_url: str) -> list:
+        """Crawl from `start_url` and return the unique in-scope links found."""
+        self._allowed_host = urlparse(start_url).hostname
+        frontier = asyncio.Queue(maxsize=self.max_frontier)
+        frontier.put_nowait((start_url, 0))
+        queued = {start_url}
+
+        async def worker():
+            while True:
+                url, depth = await frontier.get()
+                try:
+                    await self._visit(url, depth, frontier, queued)
+                except Exception:
+                    # A worker that died would leave its queue items unfinished and hang join()
+                    logger.exception(f"Error crawling {url}")
+                finally:
+                    frontier.task_done()
+
+        tasks = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        try:
+            await frontier.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        logger.info(f"Crawl of {start_url} finished: visited {self.pages_visited} pages, "
+                    f"found {len(self.seen)} links, dropped {self.pages_dropped} pages over budget.")
+        return list(self.seen)
+
+    async def _visit(self, url: str, depth: int, frontier: asyncio.Queue, queued: set) -> None:
+        if self.pages_visited >= self.max_pages:
+            self.pages_dropped += 1
+            return
+        self.pages_visited += 1
+
+        host = urlparse(url).hostname or ""
+        await self.host_limiter.acquire(host)
+        try:
+            hrefs = await self.fetch_links(url)
+        except Exception as e:
+            logger.error(f"Error visiting {url}: {e}")
+            return
+        finally:
+            self.host_limiter.release(host)
+
+        logger.info(f"Visiting {url} at depth {depth}, found {len(hrefs)} links.")
+        for href in hrefs:
+            if not href:
+                continue
+            try:
+                full_url = normalize_url(url, href)
+                if full_url is None or full_url in self.seen or not self.in_scope(full_url):
+                    continue
+            except ValueError as e:
+                logger.warning(f"Skipping malformed link {href!r} on {url}: {e}")
+                continue
+            self.seen.add(full_url)
+
+            if depth + 1 > self.max_depth or full_url in queued:
+                continue
+            if len(queued) >= self.max_pages or frontier.full():
+                self.pages_dropped += 1
+                continue
+            queued.add(full_url)
+            frontier.put_nowait((full_url, depth + 1))
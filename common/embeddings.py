@@ -0,0 +1,295 @@
+import hashlib
+import os
+import platform
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from common.logging_config import logger
+from common.metrics import counter, span
+
+load_dotenv()
+
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", "0"))  # 0 keeps the torch default
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MMAP_SIZE = int(os.environ.get("EMBEDDING_CACHE_MMAP_SIZE", str(256 * 1024 * 1024)))
+EMBEDDING_QUERY_CACHE_SIZE = int(os.environ.get("EMBEDDING_QUERY_CACHE_SIZE", "1024"))
+# "torch", "onnx" or "onnx-int8", the ONNX backends need sentence-transformers[onnx]
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+# ONNX file of the model repository, empty uses model.onnx or the int8 file for this CPU
+EMBEDDING_ONNX_FILE = os.environ.get("EMBEDDING_ONNX_FILE", "")
+# Precision of the vectors in the disk cache, "float16" halves its size
+EMBEDDING_CACHE_DTYPE = os.environ.get("EMBEDDING_CACHE_DTYPE", "float16")
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Number of keys looked up in the disk cache per SQL statement
+_LOOKUP_BATCH = 500
+
+document_cache_lookups = counter("embedding_cache_lookups_total", "Document embedding cache lookups, by result")
+query_cache_lookups = counter("query_embedding_cache_lookups_total", "Query embedding LRU lookups, by result")
+texts_encoded = counter("texts_encoded_total", "Texts encoded by the embedding model, by kind")
+
+
+class EmbeddingCache:
+    """
+    Persistent SQLite cache of document embeddings keyed by (model, SHA-256 of text).
+    Vectors are written with `dtype` precision, entries written with another precision
+    stay readable.
+    """
+
+    def __init__(self, path: str, dtype: str = EMBEDDING_CACHE_DTYPE):
+        if dtype not in ("float16", "float32"):
+            raise ValueError(f"Unknown embedding cache dtype: {dtype}")
+        self.path = path
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={EMBEDDING_CACHE_MMAP_SIZE}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, "
+            "dtype TEXT NOT NULL DEFAULT 'float32', "
+            "PRIMARY KEY (model, key)) WITHOUT ROWID")
+        # Caches written before vectors had a precision hold float32 vectors
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")]
+        if "dtype" not in columns:
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN dtype TEXT NOT NULL DEFAULT 'float32'")
+
+    def get_many(self, model: str, keys: list) -> dict:
+        """Return a dict of key -> vector for the keys present in the cache."""
+        import numpy as np
+
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _LOOKUP_BATCH):
+                batch = keys[i:i + _LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, vector, dtype FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(batch))})",
+                    [model, *batch]).fetchall()
+                for key, blob, dtype in rows:
+                    found[key] = np.frombuffer(blob, dtype=dtype).astype(np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, items: dict) -> dict:
+        """Store a dict of key -> vector, return the vectors as they will be read back."""
+        import numpy as np
+
+        stored = {key: np.asarray(vector, dtype=self.dtype) for key, vector in items.items()}
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                [(model, key, vector.tobytes(), self.dtype) for key, vector in stored.items()])
+        return {key: vector.astype(np.float32).tolist() for key, vector in stored.items()}
+
+
+def _quantized_onnx_file() -> str:
+    """The int8 ONNX export of sentence-transformers models matching this CPU."""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            flags = f.read()
+    except OSError:
+        flags = ""
+    if "avx512_vnni" in flags:
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    if "avx512" in flags:
+        return "onnx/model_qint8_avx512.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+
+def backend_model_kwargs(backend: str, onnx_file: str = "", num_threads: int = 0) -> dict:
+    """Return the SentenceTransformer keyword arguments selecting an embedding backend."""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    if backend == "torch":
+        return {}
+    onnx_kwargs = {}
+    file_name = onnx_file or (_quantized_onnx_file() if backend == "onnx-int8" else "")
+    if file_name:
+        onnx_kwargs["file_name"] = file_name
+    if num_threads > 0:
+        import onnxruntime
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = num_threads
+        onnx_kwargs["session_options"] = session_options
+    return {"backend": "onnx", "model_kwargs": onnx_kwargs}
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embedding service shared by indexing and querying.
+
+    Document embeddings are computed in batches of `batch_size` and persisted in an
+    EmbeddingCache, so a chunk is encoded once per model no matter how often it is indexed.
+    Query embeddings are kept in an in-memory LRU. The model is loaded on first use, with
+    PyTorch or ONNX Runtime depending on the backend.
+    """
+
+    def __init__(self,
+                 model_name: str = EMBEDDING_MODEL,
+                 batch_size: int = EMBEDDING_BATCH_SIZE,
+                 num_threads: int = EMBEDDING_THREADS,
+                 cache_path: Optional[str] = EMBEDDING_CACHE_PATH,
+                 query_cache_size: int = EMBEDDING_QUERY_CACHE_SIZE,
+                 backend: str = EMBEDDING_BACKEND,
+                 onnx_file: str = EMBEDDING_ONNX_FILE):
+        """
+        Args:
+            model_name (str): Sentence transformers model name.
+            batch_size (int): Number of texts encoded per forward pass.
+            num_threads (int): CPU threads used by torch, 0 keeps the default.
+            cache_path (Optional[str]): SQLite file of the document embedding cache, None disables it.
+            query_cache_size (int): Number of query embeddings kept in memory.
+            backend (str): "torch", "onnx" or "onnx-int8".
+            onnx_file (str): ONNX file of the model repository, empty picks the backend default.
+        """
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {backend}")
+        self.model_name = model_name
+        self.backend = backend
+        self.onnx_file = onnx_file
+        # Backends produce slightly different vectors, so they do not share cache entries
+        self.cache_model = model_name if backend == "torch" else f"{model_name}@{backend}"
+        if onnx_file:
+            self.cache_model += f":{onnx_file}"
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        self.query_cache_size = query_cache_size
+        self._query_cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._model = None
+
+    @property
+    def model(self):
+        """The underlying HuggingFace embeddings model, loaded on first use."""
+        with self._lock:
+            if self._model is None:
+                from langchain_huggingface import HuggingFaceEmbeddings
+
+                if self.num_threads > 0:
+                    import torch
+                    torch.set_num_threads(self.num_threads)
+                logger.info(f"Loading embedding model {self.model_name} with the {self.backend} backend "
+                            f"(batch_size={self.batch_size}, threads={self.num_threads or 'default'}).")
+                with span("load_embedding_model", model=self.model_name, backend=self.backend):
+                    self._model = HuggingFaceEmbeddings(
+                        model_name=self.model_name,
+                        model_kwargs=backend_model_kwargs(self.backend, self.onnx_file, self.num_threads),
+                        encode_kwargs={"batch_size": self.batch_size})
+            return self._model
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def encode(self, texts: list) -> list:
+        """Encode texts with the model in batches of `batch_size`, bypassing the caches."""
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(self.model.embed_documents(texts[i:i + self.batch_size]))
+        return vectors
+
+    def embed_documents(self, texts: list, encode=None) -> list:
+        """
+        Embed documents, encoding only the texts missing from the cache.
+        Args:
+            texts (list): Texts to embed.
+            encode: Function encoding a list of texts, such as an EmbeddingShardPool,
+                defaults to the in-process model.
+        Returns:
+            list: One vector per text.
+        """
+        keys = [self._key(text) for text in texts]
+        vectors = self.cache.get_many(self.cache_model, list(set(keys))) if self.cache else {}
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        hits = sum(key in vectors for key in keys)
+        document_cache_lookups.inc(hits, result="hit")
+        document_cache_lookups.inc(len(keys) - hits, result="miss")
+        if missing:
+            logger.info(f"Embedding {len(missing)} texts, {len(texts) - len(missing)} served from cache.")
+            missing_keys = list(missing)
+            encode = encode or self.encode
+            with span("embed_documents", texts=len(missing_keys)):
+                encoded = dict(zip(missing_keys, encode([missing[key] for key in missing_keys])))
+            texts_encoded.inc(len(missing_keys), kind="document")
+            if self.cache:
+                # Use the stored precision, so results do not depend on what was cached before
+                encoded = self.cache.put_many(self.cache_model, encoded)
+            vectors.update(encoded)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> list:
+        """Embed a query, repeated queries are served from the LRU."""
+        with self._lock:
+            vector = self._query_cache.get(text)
+            if vector is not None:
+                self._query_cache.move_to_end(text)
+                query_cache_lookups.inc(result="hit")
+                return vector
+
+        query_cache_lookups.inc(result="miss")
+        with span("embed_query"):
+            vector = self.model.embed_query(text)
+        texts_encoded.inc(kind="query")
+        with self._lock:
+            self._query_cache[text] = vector
+            if len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def embed_queries(self, texts: list) -> list:
+        """
+        Embed many queries, encoding the ones missing from the LRU in batched forward passes.
+        Queries are encoded like documents, as HuggingFaceEmbeddings does without query_encode_kwargs.
+        """
+        vectors = {}
+        with self._lock:
+            for text in texts:
+                vector = self._query_cache.get(text)
+                if vector is not None:
+                    self._query_cache.move_to_end(text)
+                    vectors[text] = vector
+
+        missing = list(dict.fromkeys(text for text in texts if text not in vectors))
+        hits = sum(text in vectors for text in texts)
+        query_cache_lookups.inc(hits, result="hit")
+        query_cache_lookups.inc(len(texts) - hits, result="miss")
+        if missing:
+            with span("embed_queries", texts=len(missing)):
+                for i in range(0, len(missing), self.batch_size):
+                    batch = missing[i:i + self.batch_size]
+                    vectors.update(zip(batch, self.model.embed_documents(batch)))
+            texts_encoded.inc(len(missing), kind="query")
+        with self._lock:
+            for text in missing:
+                self._query_cache[text] = vectors[text]
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return [vectors[text] for text in texts]
+
+
+_embeddings: Optional[CachedEmbeddings] = None
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """Return the process-wide embedding service."""
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            _embeddings = CachedEmbeddings()
+        return _embeddings
@@ -0,0 +1,259 @@
+import os
+import re
+from html.parser import HTMLParser
+from typing import Optional
+from dotenv import load_dotenv
+from common.logging_config import logger
+
+load_dotenv()
+
+# "auto" picks the fastest installed backend, or one of "selectolax", "lxml", "scan", "bs4"
+HTML_PARSER = os.environ.get("HTML_PARSER", "auto")
+# Streaming backends parse this many characters at a time and stop once the target is found
+HTML_PARSER_CHUNK_SIZE = int(os.environ.get("HTML_PARSER_CHUNK_SIZE", "65536"))
+
+TRANSCRIPT_LINK_TEXT = "SHOW TRANSCRIPT: "
+FEED_HREF_RE = re.compile("feed", re.IGNORECASE)
+
+
+class Bs4Backend:
+    """Reference implementation on a full BeautifulSoup html.parser tree."""
+
+    name = "bs4"
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+        self._soup = BeautifulSoup
+
+    def find_transcript_link(self, content: str) -> Optional[str]:
+        soup = self._soup(content, 'html.parser')
+        transcript_tag = soup.find('b', string=TRANSCRIPT_LINK_TEXT)
+        if transcript_tag is None:
+            return None
+        link_tag = transcript_tag.find_next('a')
+        return link_tag.get('href') if link_tag else None
+
+    def find_feed_links(self, content: str) -> list:
+        soup = self._soup(content, 'html.parser')
+        return [link.get('href') for link in soup.find_all('a', href=lambda x: x and 'feed' in x.lower())]
+
+
+class SelectolaxBackend:
+    """Lexbor HTML5 parser, the whole page is parsed in C and only matching nodes reach Python."""
+
+    name = "selectolax"
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser = LexborHTMLParser
+
+    @staticmethod
+    def _string(node) -> Optional[str]:
+        # Same rule as BeautifulSoup's .string, the text of a node with a single child chain
+        children = list(node.iter(include_text=True))
+        if len(children) != 1:
+            return None
+        child = children[0]
+        if child.tag == "-text":
+            return child.text_content
+        return SelectolaxBackend._string(child)
+
+    def find_transcript_link(self, content: str) -> Optional[str]:
+        found = False
+        # Matches come back in document order, so the first anchor after the tag follows it
+        for node in self._parser(content).css('b, a'):
+            if not found:
+                found = node.tag == 'b' and self._string(node) == TRANSCRIPT_LINK_TEXT
+            elif node.tag == 'a':
+                return _href(node.attributes)
+        return None
+
+    def find_feed_links(self, content: str) -> list:
+        links = []
+        for node in self._parser(content).css('a[href]'):
+            href = node.attributes.get('href')
+            if href and 'feed' in href.lower():
+                links.append(href)
+        return links
+
+
+class LxmlBackend:
+    """libxml2 pull parser fed in chunks, parsing stops once the transcript link is found."""
+
+    name = "lxml"
+
+    def __init__(self):
+        from lxml import etree
+        self._etree = etree
+
+    @staticmethod
+    def _string(element) -> Optional[str]:
+        if len(element) == 0:
+            return element.text
+        if len(element) == 1 and not element.text and not element[0].tail:
+            return LxmlBackend._string(element[0])
+        return None
+
+    def _events(self, content: str, events: tuple, tag=None):
+        parser = self._etree.HTMLPullParser(events=events, tag=tag)
+        for start in range(0, len(content), HTML_PARSER_CHUNK_SIZE):
+            parser.feed(content[start:start + HTML_PARSER_CHUNK_SIZE])
+            yield from parser.read_events()
+        parser.close()
+        yield from parser.read_events()
+
+    def find_transcript_link(self, content: str) -> Optional[str]:
+        found = False
+        for event, element in self._events(content, ("start", "end"), tag=("b", "a")):
+            if not found:
+                found = event == "end" and element.tag == "b" and self._string(element) == TRANSCRIPT_LINK_TEXT
+            elif event == "start" and element.tag == "a":
+                return _href(element.attrib)
+        return None
+
+    def find_feed_links(self, content: str) -> list:
+        links = []
+        for _, element in self._events(content, ("start",), tag="a"):
+            href = element.get('href')
+            if href and 'feed' in href.lower():
+                links.append(href)
+        return links
+
+
+class _StopScan(Exception):
+    pass
+
+
+def _href(attributes: dict) -> Optional[str]:
+    """href of an anchor, an empty string for a bare attribute and None when it is missing."""
+    return (attributes['href'] or "") if 'href' in attributes else None
+
+
+class _TranscriptLinkScanner(HTMLParser):
+    """Tokenizer looking for the transcript anchor without building a tree."""
+
+    VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+                 "source", "track", "wbr"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []  # (tag, children) of the open <b> tag and the tags inside it
+        self.found = False
+        self.href = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.found:
+            if tag == 'a':
+                self.href = _href(dict(attrs))
+                raise _StopScan()
+            return
+        if self.stack:
+            self.stack[-1][1].append(None)
+            if tag not in self.VOID_TAGS:
+                self.stack.append((tag, []))
+        elif tag == 'b':
+            self.stack.append((tag, []))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in self.VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if not any(open_tag == tag for open_tag, _ in self.stack):
+            return
+        while True:
+            open_tag, children = self.stack.pop()
+            if not self.stack:
+                self.found = len(children) == 1 and children[0] == TRANSCRIPT_LINK_TEXT
+                return
+            # A nested tag with a single string counts as the string of its parent
+            if len(children) == 1 and children[0] is not None:
+                self.stack[-1][1][-1] = children[0]
+            if open_tag == tag:
+                return
+
+    def handle_data(self, data):
+        if self.stack:
+            children = self.stack[-1][1]
+            # Text split across fed chunks arrives in several calls
+            if children and isinstance(children[-1], str):
+                children[-1] += data
+            else:
+                children.append(data)
+
+
+class _FeedLinkScanner(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            href = dict(attrs).get('href')
+            if href and 'feed' in href.lower():
+                self.links.append(href)
+
+
+class ScanBackend:
+    """Standard library tokenizer fed in chunks, stops at the transcript link. No dependencies."""
+
+    name = "scan"
+
+    def find_transcript_link(self, content: str) -> Optional[str]:
+        scanner = _TranscriptLinkScanner()
+        try:
+            for start in range(0, len(content), HTML_PARSER_CHUNK_SIZE):
+                scanner.feed(content[start:start + HTML_PARSER_CHUNK_SIZE])
+            scanner.close()
+        except _StopScan:
+            pass
+        return scanner.href
+
+    def find_feed_links(self, content: str) -> list:
+        scanner = _FeedLinkScanner()
+        scanner.feed(content)
+        scanner.close()
+        return scanner.links
+
+
+BACKENDS = {backend.name: backend for backend in (SelectolaxBackend, LxmlBackend, ScanBackend, Bs4Backend)}
+_backends = {}
+
+
+def get_html_parser(name: str = HTML_PARSER):
+    """
+    Return the parser backend `name`, "auto" picks the first installed of selectolax, lxml
+    and the standard library scanner.
+    """
+    if name not in _backends:
+        if name == "auto":
+            for candidate in ("selectolax", "lxml", "scan"):
+                try:
+                    _backends[name] = get_html_parser(candidate)
+                    break
+                except ImportError:
+                    continue
+            logger.info(f"Using the {_backends[name].name} HTML parser.")
+        elif name in BACKENDS:
+            _backends[name] = BACKENDS[name]()
+        else:
+            raise ValueError(f"Unknown HTML parser: {name}")
+    return _backends[name]
+
+
+def find_transcript_link(content: str, parser: str = HTML_PARSER) -> Optional[str]:
+    """
+    Return the href of the first anchor after the <b>SHOW TRANSCRIPT: </b> tag, or None.
+    Pages without the marker text are rejected without being parsed.
+    """
+    if TRANSCRIPT_LINK_TEXT not in content:
+        return None
+    return get_html_parser(parser).find_transcript_link(content)
+
+
+def find_feed_links(content: str, parser: str = HTML_PARSER) -> list:
+    """Return the hrefs of all anchors whose href contains "feed", in document order."""
+    if not FEED_HREF_RE.search(content):
+        return []
+    return get_html_parser(parser).find_feed_links(content)
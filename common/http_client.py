@@ -0,0 +1,47 @@
+import asyncio
+import os
+import threading
+import weakref
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "30"))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_USER_AGENT = os.environ.get(
+    "HTTP_USER_AGENT",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36")
+
+# httpx advertises gzip/deflate, and br/zstd when the brotli/zstandard packages are installed.
+_client_options = dict(
+    follow_redirects=True,
+    timeout=HTTP_TIMEOUT,
+    limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+    headers={"User-Agent": HTTP_USER_AGENT},
+)
+
+_client = None
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_http_client() -> httpx.Client:
+    """Return the process-wide keep-alive HTTP client."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(**_client_options)
+        return _client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Return the keep-alive async HTTP client bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(**_client_options)
+        _async_clients[loop] = client
+    return client
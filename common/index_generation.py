@@ -0,0 +1,152 @@
+import fcntl
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from dotenv import load_dotenv
+from common.logging_config import logger
+
+load_dotenv()
+
+CURRENT_FILE_NAME = "CURRENT"
+BUILD_LOCK_FILE_NAME = ".build.lock"
+GENERATION_PREFIX = "gen-"
+
+# Published generations kept besides the current one, so readers that have not switched yet
+# keep working and a bad index can be rolled back by pointing CURRENT at the previous one
+INDEX_KEEP_GENERATIONS = int(os.environ.get("INDEX_KEEP_GENERATIONS", "1"))
+
+
+def _generation_number(name: str) -> Optional[int]:
+    if not name.startswith(GENERATION_PREFIX):
+        return None
+    number = name[len(GENERATION_PREFIX):]
+    return int(number) if number.isdigit() else None
+
+
+def _current_name(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, CURRENT_FILE_NAME), "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _unversioned_entries(root: str) -> list:
+    """Names under `root` that belong to an index written before generations were introduced."""
+    return [name for name in os.listdir(root) if _generation_number(name) is None
+            and not name.startswith(CURRENT_FILE_NAME) and name != BUILD_LOCK_FILE_NAME]
+
+
+def generation_path(root: str) -> Optional[str]:
+    """
+    Return the directory of the generation published under `root`.
+    An index written before generations were introduced is served from `root` itself,
+    None is returned when there is no index at all.
+    """
+    name = _current_name(root)
+    if name is not None:
+        return os.path.join(root, name)
+    if os.path.isdir(root) and _unversioned_entries(root):
+        return root
+    return None
+
+
+def current_generation(root: str) -> Optional[tuple]:
+    """
+    Return a cheap signature of the generation published under `root`, or None if there is
+    none. The signature changes whenever a generation is published, so readers can poll it
+    on every request with a single stat call.
+    """
+    try:
+        stat = os.stat(os.path.join(root, CURRENT_FILE_NAME))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+@contextmanager
+def new_generation(root: str) -> Iterator[str]:
+    """
+    Create the directory of the next generation under `root` and yield its path.
+    The directory is off the serving path until it is published with publish_generation
+    inside the block, if the block raises or returns without publishing it is discarded.
+    Builds of the same root hold an exclusive lock from here until they publish or discard,
+    so they run one after the other, and each reads the generation published by the one before.
+    """
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, BUILD_LOCK_FILE_NAME), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        _adopt_unversioned_index(root)
+        # With the lock held, unpublished generations newer than the current one were left by
+        # an interrupted build
+        current = _generation_number(_current_name(root) or "")
+        numbers = [number for number in map(_generation_number, os.listdir(root)) if number is not None]
+        for number in numbers:
+            if current is None or number > current:
+                discard_generation(os.path.join(root, f"{GENERATION_PREFIX}{number}"))
+        numbers = [number for number in numbers if current is not None and number <= current]
+        path = os.path.join(root, f"{GENERATION_PREFIX}{max(numbers, default=0) + 1}")
+        os.makedirs(path)
+        try:
+            yield path
+        finally:
+            if _current_name(root) != os.path.basename(path):
+                discard_generation(path)
+
+
+def publish_generation(path: str) -> str:
+    """
+    Make the generation at `path` the one served, by atomically replacing the CURRENT pointer
+    of its root, then remove old generations. Returns the generation name.
+    """
+    root, name = os.path.split(os.path.normpath(path))
+    marker = os.path.join(root, CURRENT_FILE_NAME)
+    with open(f"{marker}.tmp", "w") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{marker}.tmp", marker)
+    collect_generations(root)
+    return name
+
+
+def discard_generation(path: str) -> None:
+    """Remove a generation that was not published, the published one is untouched."""
+    logger.info(f"Discarding unpublished index generation {path}.")
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def collect_generations(root: str, keep: int = INDEX_KEEP_GENERATIONS) -> list:
+    """
+    Remove the generations under `root` older than the current one and the `keep` before it.
+    Generations newer than the current one are left alone, new_generation removes the ones
+    left by interrupted builds once it holds the build lock.
+    Returns the names removed.
+    """
+    current = _generation_number(_current_name(root) or "")
+    if current is None:
+        return []
+    older = sorted((number for number in map(_generation_number, os.listdir(root))
+                    if number is not None and number < current), reverse=True)
+    removed = [f"{GENERATION_PREFIX}{number}" for number in older[keep:]]
+    for name in removed:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    if removed:
+        logger.info(f"Removed old index generations {removed} from {root}.")
+    return removed
+
+
+def _adopt_unversioned_index(root: str) -> None:
+    """Move an index written before generations were introduced into gen-0 and publish it."""
+    if _current_name(root) is not None:
+        return
+    legacy = _unversioned_entries(root)
+    if not legacy:
+        return
+    path = os.path.join(root, f"{GENERATION_PREFIX}0")
+    os.makedirs(path, exist_ok=True)
+    for name in legacy:
+        os.rename(os.path.join(root, name), os.path.join(path, name))
+    logger.info(f"Moved the index in {root} to generation {GENERATION_PREFIX}0.")
+    publish_generation(path)
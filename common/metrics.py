@@ -0,0 +1,373 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as _SampleCounter
+from typing import Optional
+from dotenv import load_dotenv
+from common.logging_config import logger
+
+load_dotenv()
+
+# Comma separated exporters: "jsonl" appends spans and metric snapshots to METRICS_JSONL_PATH,
+# "prometheus" serves the metrics as text on METRICS_PROMETHEUS_PORT. Empty keeps them in memory
+METRICS_EXPORT = os.environ.get("METRICS_EXPORT", "")
+METRICS_JSONL_PATH = os.environ.get("METRICS_JSONL_PATH", "metrics.jsonl")
+METRICS_PROMETHEUS_PORT = int(os.environ.get("METRICS_PROMETHEUS_PORT", "9464"))
+# Sample the stacks of all threads every METRICS_PROFILE_INTERVAL seconds during the run
+METRICS_PROFILE = os.environ.get("METRICS_PROFILE", "0") == "1"
+METRICS_PROFILE_INTERVAL = float(os.environ.get("METRICS_PROFILE_INTERVAL", "0.01"))
+METRICS_PROFILE_PATH = os.environ.get("METRICS_PROFILE_PATH", "profile.folded")
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+                   120.0, 300.0)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic count per label set, such as pages fetched or cache hits."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in self._values.items()]
+
+    def render(self) -> list:
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram:
+    """Distribution of observed values per label set, in cumulative buckets as Prometheus expects."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bisect.bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [{"labels": dict(key), "count": sum(state[:-1]), "sum": state[-1],
+                     "buckets": dict(zip([*map(str, self.buckets), "+Inf"], state[:-1]))}
+                    for key, state in self._values.items()]
+
+    def render(self) -> list:
+        lines = []
+        with self._lock:
+            for key, state in self._values.items():
+                cumulative = 0
+                for bound, count in zip([*map(str, self.buckets), "+Inf"], state[:-1]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {state[-1]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide set of named counters and histograms."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        return self._get(Counter, name, description)
+
+    def histogram(self, name: str, description: str = "", buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, description, buckets)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: {"type": metric.kind, "values": metric.snapshot()} for metric in metrics}
+
+    def render_prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def counter(name: str, description: str = "") -> Counter:
+    """Return the counter `name` of the process-wide registry, creating it on first use."""
+    return registry.counter(name, description)
+
+
+def histogram(name: str, description: str = "", buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    """Return the histogram `name` of the process-wide registry, creating it on first use."""
+    return registry.histogram(name, description, buckets)
+
+
+span_seconds = histogram("span_duration_seconds", "Duration of traced operations, by span name and status")
+
+
+class JsonlExporter:
+    """Appends finished spans, and metric snapshots on flush, to a JSON-lines file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def export(self, record: dict) -> None:
+        line = json.dumps(record, default=str)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+
+    def flush(self) -> None:
+        self.export({"type": "metrics", "time": time.time(), "metrics": registry.snapshot()})
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+_jsonl_exporter: Optional[JsonlExporter] = None
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    Timed operation, nested under the span active when it starts. The duration is observed
+    in span_duration_seconds and the finished span is exported to the JSON-lines file.
+    Spans started in asyncio tasks and asyncio.to_thread calls nest under the span that
+    created them.
+    """
+
+    def __init__(self, name: str, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = None
+        self.trace_id = None
+        self.duration = None
+        self._token = None
+
+    def set(self, **attributes) -> None:
+        """Add attributes, such as result sizes known only at the end."""
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        self.trace_id = self.parent.trace_id if self.parent is not None else uuid.uuid4().hex
+        self._token = _current_span.set(self)
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        status = "ok" if exc_type is None else "error"
+        span_seconds.observe(self.duration, span=self.name, status=status)
+        if _jsonl_exporter is not None:
+            record = {"type": "span", "name": self.name, "trace_id": self.trace_id, "span_id": self.span_id,
+                      "parent_id": self.parent.span_id if self.parent is not None else None,
+                      "start": self.start_time, "duration": self.duration, "status": status,
+                      "attributes": self.attributes}
+            if exc is not None:
+                record["error"] = repr(exc)
+            _jsonl_exporter.export(record)
+        return False
+
+
+def span(name: str, **attributes) -> Span:
+    """Return a span to use as a context manager, `with span("fetch", url=url) as s: ...`."""
+    return Span(name, **attributes)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator running a function, or coroutine function, in a span named `name`."""
+    def decorate(function):
+        span_name = name or function.__qualname__
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with Span(span_name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Span(span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all other threads every `interval` seconds from a background thread.
+    Waiting threads are sampled too, so the profile shows where wall time goes.
+    Samples are written in the folded stack format read by flamegraph.pl and speedscope, and
+    the functions seen most often on top of the stacks are logged.
+    """
+
+    def __init__(self, interval: float = METRICS_PROFILE_INTERVAL, path: str = METRICS_PROFILE_PATH):
+        self.interval = interval
+        self.path = path
+        self.samples = _SampleCounter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling profiler started, every {self.interval * 1000:.1f} ms.")
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        """Stop sampling, write the folded stacks and log the hottest functions."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        with open(self.path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        top = _SampleCounter()
+        for stack, count in self.samples.items():
+            top[stack.rsplit(";", 1)[-1]] += count
+        total = sum(self.samples.values())
+        lines = [f"Profile of {total} samples written to {self.path}, top of stack:"]
+        lines.extend(f"  {count / total:6.1%} {function}" for function, count in top.most_common(15))
+        logger.info("\n".join(lines))
+
+
+_profiler: Optional[SamplingProfiler] = None
+_prometheus_server = None
+
+
+def _start_prometheus_server(port: int):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Serving Prometheus metrics on port {server.server_address[1]}.")
+    return server
+
+
+def start_metrics(export: str = METRICS_EXPORT, profile: bool = METRICS_PROFILE) -> None:
+    """Start the configured exporters, and the sampling profiler if enabled for this run."""
+    global _jsonl_exporter, _prometheus_server, _profiler
+    exporters = {name.strip() for name in export.split(",") if name.strip()}
+    unknown = exporters - {"jsonl", "prometheus"}
+    if unknown:
+        raise ValueError(f"Unknown metrics exporters: {', '.join(sorted(unknown))}")
+    if "jsonl" in exporters and _jsonl_exporter is None:
+        _jsonl_exporter = JsonlExporter(METRICS_JSONL_PATH)
+        logger.info(f"Writing spans and metrics to {METRICS_JSONL_PATH}.")
+    if "prometheus" in exporters and _prometheus_server is None:
+        _prometheus_server = _start_prometheus_server(METRICS_PROMETHEUS_PORT)
+    if profile and _profiler is None:
+        _profiler = SamplingProfiler()
+        _profiler.start()
+
+
+def stop_metrics() -> None:
+    """Write a final metrics snapshot, stop the profiler and the exporters."""
+    global _jsonl_exporter, _prometheus_server, _profiler
+    if _profiler is not None:
+        _profiler.stop()
+        _profiler = None
+    if _jsonl_exporter is not None:
+        _jsonl_exporter.flush()
+        _jsonl_exporter.close()
+        _jsonl_exporter = None
+    if _prometheus_server is not None:
+        _prometheus_server.shutdown()
+        _prometheus_server = None
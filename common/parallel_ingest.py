@@ -0,0 +1,204 @@
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from dotenv import load_dotenv
+from common.logging_config import logger
+from common.metrics import traced
+
+load_dotenv()
+
+# Processes reading and splitting transcripts, 0 uses every core, 1 splits in-process
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "0"))
+# Transcripts read and split per task
+INGEST_SPLIT_BATCH = int(os.environ.get("INGEST_SPLIT_BATCH", "32"))
+# Embedding shard processes, each loads its own copy of the model. 1 embeds in-process
+EMBED_WORKERS = int(os.environ.get("EMBED_WORKERS", "1"))
+# Torch or ONNX Runtime threads of each shard, 0 divides the cores evenly between the shards
+EMBED_WORKER_THREADS = int(os.environ.get("EMBED_WORKER_THREADS", "0"))
+# Start method of the worker processes, spawn is safe with the threads of a running agent
+INGEST_START_METHOD = os.environ.get("INGEST_START_METHOD", "spawn")
+# Seconds between progress log lines
+INGEST_PROGRESS_INTERVAL = float(os.environ.get("INGEST_PROGRESS_INTERVAL", "5"))
+
+
+class IngestProgress:
+    """Progress and throughput of an ingestion stage, logged at most every `interval` seconds."""
+
+    def __init__(self, stage: str, total: int, unit: str = "chunks",
+                 interval: float = INGEST_PROGRESS_INTERVAL):
+        self.stage = stage
+        self.total = total
+        self.unit = unit
+        self.interval = interval
+        self.done = 0
+        self.start = time.perf_counter()
+        self._last_log = self.start
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.start
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def update(self, count: int) -> None:
+        self.done += count
+        now = time.perf_counter()
+        if now - self._last_log >= self.interval:
+            self._last_log = now
+            logger.info(f"{self.stage}: {self.done}/{self.total} {self.unit}, {self.rate():.1f} {self.unit}/s")
+
+    def finish(self) -> dict:
+        """Log and return the totals of the stage."""
+        elapsed = time.perf_counter() - self.start
+        logger.info(f"{self.stage}: {self.done} {self.unit} in {elapsed:.1f}s, {self.rate():.1f} {self.unit}/s")
+        return {"stage": self.stage, self.unit: self.done, "seconds": elapsed, "rate": self.rate()}
+
+
+def _worker_count(workers: int) -> int:
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+
+class _Splitter:
+    """Reads transcripts from the store and splits them into chunks."""
+
+    def __init__(self, doc_location: str, chunk_size: int, chunk_overlap: int):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        from common.transcript_store import TranscriptStore
+
+        self.store = TranscriptStore(doc_location)
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            add_start_index=True)
+
+    def split(self, hashes: list) -> list:
+        chunks = []
+        for hash_val, text in self.store.iter_texts(hashes):
+            for i, document in enumerate(self.splitter.create_documents([text])):
+                chunks.append((hash_val, i, document.metadata["start_index"], document.page_content))
+        return chunks
+
+
+_splitter: Optional[_Splitter] = None
+
+
+def _init_split_worker(doc_location: str, chunk_size: int, chunk_overlap: int) -> None:
+    global _splitter
+    _splitter = _Splitter(doc_location, chunk_size, chunk_overlap)
+
+
+def _split_batch(hashes: list) -> list:
+    return _splitter.split(hashes)
+
+
+@traced("split_transcripts")
+def split_transcripts(doc_location: str, hashes: list, chunk_size: int, chunk_overlap: int,
+                      workers: int = INGEST_WORKERS, batch_size: int = INGEST_SPLIT_BATCH) -> list:
+    """
+    Read transcripts from the store and split them into chunks, in a process pool.
+    Workers read the texts themselves, so only the chunks cross process boundaries.
+    Args:
+        doc_location (str): Directory holding the transcript store.
+        hashes (list): Content hashes of the transcripts to split.
+        chunk_size (int): Maximum number of characters per chunk.
+        chunk_overlap (int): Characters shared by consecutive chunks.
+        workers (int): Worker processes, 0 uses every core and 1 splits in-process.
+        batch_size (int): Transcripts per task.
+    Returns:
+        list: (hash, chunk index, start index, text) tuples, in the order of `hashes`.
+    """
+    if not hashes:
+        return []
+    workers = min(_worker_count(workers), math.ceil(len(hashes) / batch_size))
+    progress = IngestProgress("split", len(hashes), unit="transcripts")
+    batches = [hashes[i:i + batch_size] for i in range(0, len(hashes), batch_size)]
+    chunks = []
+    if workers <= 1:
+        splitter = _Splitter(doc_location, chunk_size, chunk_overlap)
+        try:
+            for batch in batches:
+                chunks.extend(splitter.split(batch))
+                progress.update(len(batch))
+        finally:
+            splitter.store.close()
+    else:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context(INGEST_START_METHOD),
+                                 initializer=_init_split_worker,
+                                 initargs=(doc_location, chunk_size, chunk_overlap)) as pool:
+            for batch, batch_chunks in zip(batches, pool.map(_split_batch, batches)):
+                chunks.extend(batch_chunks)
+                progress.update(len(batch))
+    progress.finish()
+    return chunks
+
+
+_shard_embeddings = None
+
+
+def _init_embed_worker(model_name: str, batch_size: int, backend: str, onnx_file: str,
+                       threads: int, cores) -> None:
+    global _shard_embeddings
+    core_set = cores.get()
+    if core_set and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, core_set)
+    # Set before torch is imported, so its thread pools are sized for the shard
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    from common.embeddings import CachedEmbeddings
+    _shard_embeddings = CachedEmbeddings(model_name, batch_size, num_threads=threads, cache_path=None,
+                                         backend=backend, onnx_file=onnx_file)
+
+
+def _embed_batch(texts: list) -> list:
+    return _shard_embeddings.encode(texts)
+
+
+class EmbeddingShardPool:
+    """
+    Worker processes each holding a copy of the embedding model, pinned to their own cores
+    with a fixed torch or ONNX Runtime thread count. A batch of texts is split evenly across the shards.
+    With a single worker texts are encoded in-process and `encode` is None.
+    """
+
+    def __init__(self, model_name: str, batch_size: int, backend: str = "torch", onnx_file: str = "",
+                 workers: int = EMBED_WORKERS, threads: int = EMBED_WORKER_THREADS):
+        self.workers = _worker_count(workers)
+        self.encode = None
+        self._pool = None
+        if self.workers <= 1:
+            return
+
+        cores = os.cpu_count() or 1
+        self.threads = threads if threads > 0 else max(1, cores // self.workers)
+        context = multiprocessing.get_context(INGEST_START_METHOD)
+        core_sets = context.Queue()
+        for shard in range(self.workers):
+            # Shards get disjoint cores while there are enough of them
+            core_sets.put({(shard * self.threads + i) % cores for i in range(self.threads)}
+                          if self.workers * self.threads <= cores else None)
+        logger.info(f"Starting {self.workers} embedding shards with {self.threads} threads each.")
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                         initializer=_init_embed_worker,
+                                         initargs=(model_name, batch_size, backend, onnx_file,
+                                                   self.threads, core_sets))
+        self.encode = self._encode
+
+    def _encode(self, texts: list) -> list:
+        shard_size = math.ceil(len(texts) / self.workers)
+        shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+        vectors = []
+        for shard_vectors in self._pool.map(_embed_batch, shards):
+            vectors.extend(shard_vectors)
+        return vectors
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,131 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", "3600"))
+# Cosine similarity above which a cached query answers a new one, for example 0.97. The
+# semantic tier is off by default (0), near-duplicate queries then get their own search
+QUERY_CACHE_SIMILARITY = float(os.environ.get("QUERY_CACHE_SIMILARITY", "0"))
+
+
+def normalize_query(query: str) -> str:
+    """Case and whitespace insensitive cache key of a query."""
+    return re.sub(r'\s+', ' ', query).strip().lower()
+
+
+class QueryResultCache:
+    """
+    LRU cache of search results with a TTL.
+
+    The exact tier is keyed by the normalized query text and answers without encoding the
+    query. The optional semantic tier returns the results of a cached query whose embedding
+    is at least `similarity` cosine similar. Entries belong to one index generation, callers
+    `clear` the cache when the index changes.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL,
+                 similarity: float = QUERY_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()  # key -> (expires_at, unit embedding or None, results)
+        self._lock = threading.Lock()
+        self._matrix = None  # (keys, stacked unit embeddings) for the semantic tier
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def get(self, query: str) -> Optional[list]:
+        """Return the cached results of `query`, or None."""
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                # With the semantic tier enabled the miss is counted by get_similar
+                if self.similarity <= 0:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry[2]
+
+    def get_similar(self, embedding: list) -> Optional[list]:
+        """Return the results of the most similar cached query above the threshold, or None."""
+        if self.similarity <= 0:
+            return None
+        with self._lock:
+            matrix = self._get_matrix()
+            if matrix is None:
+                self.misses += 1
+                return None
+            import numpy as np
+
+            keys, vectors = matrix
+            scores = vectors @ self._unit(embedding)
+            best = int(np.argmax(scores))
+            entry = self._entries.get(keys[best])
+            if scores[best] < self.similarity or entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(keys[best])
+            self.semantic_hits += 1
+            return entry[2]
+
+    def put(self, query: str, embedding: Optional[list], results: list) -> None:
+        """Cache the results of `query`, with its embedding for the semantic tier."""
+        key = normalize_query(query)
+        unit = self._unit(embedding) if embedding is not None and self.similarity > 0 else None
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, unit, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self) -> None:
+        """Drop every entry, used when a new index generation is published."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        """Return hit and miss counters."""
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {"exact_hits": self.exact_hits,
+                    "semantic_hits": self.semantic_hits,
+                    "misses": self.misses,
+                    "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                    "entries": len(self._entries)}
+
+    def _remove(self, key: str) -> None:
+        del self._entries[key]
+        self._matrix = None
+
+    def _get_matrix(self):
+        if self._matrix is None:
+            import numpy as np
+
+            keys = [key for key, entry in self._entries.items() if entry[1] is not None]
+            if not keys:
+                return None
+            self._matrix = (keys, np.stack([self._entries[key][1] for key in keys]))
+        return self._matrix
+
+    @staticmethod
+    def _unit(embedding):
+        import numpy as np
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
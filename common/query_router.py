@@ -0,0 +1,106 @@
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Optional
+from dotenv import load_dotenv
+from common.logging_config import logger
+from common.metrics import counter, histogram
+
+load_dotenv()
+
+# "llm" always asks the LLM which tool to call, "auto" routes obvious inputs locally and
+# asks the LLM otherwise, "local" never calls the LLM
+ROUTER_MODE = os.environ.get("ROUTER_MODE", "auto")
+
+# Tool that URL inputs are sent to, "crawl" crawls the site, "feed" reads its Atom/RSS feed
+DISCOVERY_MODE = os.environ.get("DISCOVERY_MODE", "crawl")
+
+URL_RE = re.compile(r'https?://[^\s<>"\']+|www\.[^\s<>"\']+', re.IGNORECASE)
+# Words suggesting the user wants to download or index a site rather than search it
+CRAWL_INTENT_RE = re.compile(
+    r'\b(crawl|scrape|download|ingest|index|fetch|visit|website|site|url|link)s?\b', re.IGNORECASE)
+
+# Words asking for new episodes of a known site, answered from its feed
+FEED_INTENT_RE = re.compile(r'\b(feeds?|rss|atom|refresh|update|new episodes?|latest)\b', re.IGNORECASE)
+
+CRAWL_TOOL_NAME = "crawl_web_page"
+FEED_TOOL_NAME = "discover_feed"
+QUERY_TOOL_NAME = "query_database"
+
+
+class RouterStats:
+    """Counts of inputs routed locally and by the LLM, per chosen tool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, path: str, tool: Optional[str], elapsed: float) -> None:
+        with self._lock:
+            route = self.routes.setdefault((path, tool or "none"), {"count": 0, "seconds": 0.0})
+            route["count"] += 1
+            route["seconds"] += elapsed
+
+    def summary(self) -> dict:
+        """Return counts and total routing seconds per path and tool, and the fast path rate."""
+        with self._lock:
+            summary = {f"{path}:{tool}": dict(route) for (path, tool), route in self.routes.items()}
+            total = sum(route["count"] for route in self.routes.values())
+            fast = sum(route["count"] for (path, _), route in self.routes.items() if path == "fast_path")
+        summary["fast_path_rate"] = fast / total if total else 0.0
+        return summary
+
+
+router_stats = RouterStats()
+routing_decisions = counter("routing_decisions_total", "Inputs routed, by path and tool")
+routing_seconds = histogram("routing_seconds", "Time to pick a tool, by path")
+
+
+def route_query(query: str, mode: str = ROUTER_MODE, discovery_mode: str = DISCOVERY_MODE) -> Optional[dict]:
+    """
+    Pick the tool for a user input without calling the LLM.
+    Args:
+        query (str): The user input.
+        mode (str): Router mode, see ROUTER_MODE.
+        discovery_mode (str): Discovery of the episodes of a URL, see DISCOVERY_MODE.
+    Returns:
+        Optional[dict]: A tool call dict with "name" and "args", or None when the LLM
+        should decide.
+    """
+    if mode == "llm":
+        return None
+    if mode not in ("auto", "local"):
+        raise ValueError(f"Unknown router mode: {mode}")
+
+    match = URL_RE.search(query)
+    if match:
+        url = match.group(0).rstrip('.,;:!?)]}')
+        if not url.lower().startswith("http"):
+            url = f"https://{url}"
+        if discovery_mode == "feed" or FEED_INTENT_RE.search(query):
+            return {"name": FEED_TOOL_NAME, "args": {"url": url}}
+        return {"name": CRAWL_TOOL_NAME, "args": {"url": url}}
+
+    # Mentions of crawling without a URL are left to the LLM, unless it is bypassed
+    if mode == "auto" and CRAWL_INTENT_RE.search(query):
+        return None
+    if not query.strip():
+        return None
+    return {"name": QUERY_TOOL_NAME, "args": {"query": query.strip()}}
+
+
+def make_tool_call(route: dict) -> dict:
+    """Turn a route into a tool call for an AIMessage, with a unique id."""
+    return {"name": route["name"], "args": route["args"],
+            "id": f"fast-path-{uuid.uuid4().hex}", "type": "tool_call"}
+
+
+def log_route(path: str, tool: Optional[str], start: float) -> None:
+    """Record a routing decision made since `start` and log it."""
+    elapsed = time.perf_counter() - start
+    router_stats.record(path, tool, elapsed)
+    routing_decisions.inc(path=path, tool=tool or "none")
+    routing_seconds.observe(elapsed, path=path)
+    logger.info(f"Routed input via {path} to {tool or 'no tool'} in {elapsed:.3f}s")
@@ -0,0 +1,97 @@
+import heapq
+import os
+from dotenv import load_dotenv
+from common.common import SearchResult
+
+load_dotenv()
+
+# "rrf" for reciprocal rank fusion, "blend" for weighted min-max normalized scores
+HYBRID_FUSION = os.environ.get("HYBRID_FUSION", "rrf")
+HYBRID_SPARSE_WEIGHT = float(os.environ.get("HYBRID_SPARSE_WEIGHT", "1.0"))
+HYBRID_DENSE_WEIGHT = float(os.environ.get("HYBRID_DENSE_WEIGHT", "1.0"))
+RRF_K = int(os.environ.get("RRF_K", "60"))
+SNIPPET_LENGTH = int(os.environ.get("SNIPPET_LENGTH", "300"))
+
+
+def _first_per_link(results: list) -> list:
+    """Drop later results for a link that was already seen, keeping rank order."""
+    seen = set()
+    unique = []
+    for result in results:
+        if result["link"] not in seen:
+            seen.add(result["link"])
+            unique.append(result)
+    return unique
+
+
+def reciprocal_rank_fusion(ranked_lists: list, weights: list, top_k: int, k: int = RRF_K) -> list:
+    """
+    Fuse ranked result lists with weighted reciprocal rank fusion.
+    Args:
+        ranked_lists (list): Lists of results ordered best first, each a dict with a "link"
+            and optionally a "snippet".
+        weights (list): Weight of each list.
+        top_k (int): Number of fused results to return.
+        k (int): RRF constant, larger values flatten the contribution of top ranks.
+    Returns:
+        list: SearchResult dicts ordered by fused score.
+    """
+    scores = {}
+    snippets = {}
+    for results, weight in zip(ranked_lists, weights):
+        for rank, result in enumerate(_first_per_link(results), start=1):
+            link = result["link"]
+            scores[link] = scores.get(link, 0.0) + weight / (k + rank)
+            if not snippets.get(link):
+                snippets[link] = result.get("snippet", "")
+    return _top_results(scores, snippets, top_k)
+
+
+def blend_scores(scored_lists: list, weights: list, top_k: int) -> list:
+    """
+    Fuse result lists by a weighted sum of min-max normalized scores.
+    Args:
+        scored_lists (list): Lists of results, each a dict with a "link", a "score" where
+            higher is better and optionally a "snippet".
+        weights (list): Weight of each list.
+        top_k (int): Number of fused results to return.
+    Returns:
+        list: SearchResult dicts ordered by blended score.
+    """
+    scores = {}
+    snippets = {}
+    for results, weight in zip(scored_lists, weights):
+        results = _first_per_link(results)
+        if not results:
+            continue
+        low = min(result["score"] for result in results)
+        high = max(result["score"] for result in results)
+        span = high - low
+        for result in results:
+            link = result["link"]
+            normalized = (result["score"] - low) / span if span > 0 else 1.0
+            scores[link] = scores.get(link, 0.0) + weight * normalized
+            if not snippets.get(link):
+                snippets[link] = result.get("snippet", "")
+    return _top_results(scores, snippets, top_k)
+
+
+def _top_results(scores: dict, snippets: dict, top_k: int) -> list:
+    top = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+    return [SearchResult(link=link, score=score, snippet=snippets.get(link, "")[:SNIPPET_LENGTH])
+            for link, score in top]
+
+
+def fuse_results(sparse_results: list, dense_results: list, top_k: int,
+                 sparse_weight: float = HYBRID_SPARSE_WEIGHT,
+                 dense_weight: float = HYBRID_DENSE_WEIGHT,
+                 method: str = HYBRID_FUSION) -> list:
+    """
+    Fuse lexical and semantic results with the configured method. Dense results are listed
+    first so their best matching chunk is preferred as the snippet.
+    """
+    if method == "blend":
+        return blend_scores([dense_results, sparse_results], [dense_weight, sparse_weight], top_k)
+    if method != "rrf":
+        raise ValueError(f"Unknown fusion method: {method}")
+    return reciprocal_rank_fusion([dense_results, sparse_results], [dense_weight, sparse_weight], top_k)
@@ -0,0 +1,125 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from importlib.abc import MetaPathFinder
+from common.logging_config import logger
+
+
+class _TimedLoader:
+    """Loader wrapper recording how long executing a module takes."""
+
+    def __init__(self, loader, name: str, timer: "ImportTimer"):
+        self._loader = loader
+        self._name = name
+        self._timer = timer
+
+    def __getattr__(self, attribute):
+        return getattr(self._loader, attribute)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._timer._enter()
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._timer._exit(self._name, time.perf_counter() - start)
+
+
+class ImportTimer(MetaPathFinder):
+    """
+    Meta path finder measuring the self time of every module imported while installed,
+    aggregated per top-level package. Self time excludes nested imports, so the totals of
+    all packages add up to the time spent importing.
+    """
+
+    def __init__(self):
+        self.self_times = {}
+        self._local = threading.local()
+
+    def install(self) -> None:
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, fullname, self)
+                return spec
+        return None
+
+    def _enter(self) -> None:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)
+
+    def _exit(self, name: str, elapsed: float) -> None:
+        stack = self._local.stack
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        package = name.split(".")[0]
+        self.self_times[package] = self.self_times.get(package, 0.0) + elapsed - children
+
+    def top(self, count: int = 15) -> list:
+        """Return the `count` packages with the largest import time."""
+        return sorted(self.self_times.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+class StartupReport:
+    """Wall time of named startup phases, optionally with a per-package import breakdown."""
+
+    def __init__(self, time_imports: bool = True):
+        self.start = time.perf_counter()
+        self.phases = []
+        self.import_timer = ImportTimer() if time_imports else None
+        if self.import_timer is not None:
+            self.import_timer.install()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Measure the wall time of the enclosed block as phase `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def render(self) -> str:
+        lines = [f"Startup took {time.perf_counter() - self.start:.3f}s"]
+        for name, elapsed in self.phases:
+            lines.append(f"  {name:<40} {elapsed:8.3f}s")
+        if self.import_timer is not None:
+            lines.append("Import time by package:")
+            for package, elapsed in self.import_timer.top():
+                lines.append(f"  {package:<40} {elapsed:8.3f}s")
+        return "\n".join(lines)
+
+    def finish(self) -> str:
+        """Stop timing imports, log the report and return it."""
+        if self.import_timer is not None:
+            self.import_timer.uninstall()
+        report = self.render()
+        logger.info(report)
+        return report
+
+
+@contextmanager
+def _null_phase():
+    yield
+
+
+def phase(report, name: str):
+    """Return `report.phase(name)`, or a no-op context manager when reporting is disabled."""
+    return report.phase(name) if report is not None else _null_phase()
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from common.logging_config import logger
+
+INDEX_FILE_NAME = "index.sqlite3"
+LEGACY_INDEX_FILE_NAME = "blog_index.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    title TEXT PRIMARY KEY,
+    link TEXT NOT NULL UNIQUE,
+    transcript_link TEXT,
+    hash TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS link_state (
+    link TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS feeds (
+    site TEXT PRIMARY KEY,
+    feed_url TEXT NOT NULL,
+    etag TEXT,
+    modified TEXT,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS feed_entries (
+    link TEXT PRIMARY KEY,
+    feed_url TEXT NOT NULL,
+    added_at REAL NOT NULL
+);
+"""
+
+
+class TranscriptIndex:
+    """
+    SQLite-backed index of downloaded transcripts.
+
+    Every completed transcript is committed in its own transaction, so an interrupted
+    download keeps everything finished before it. Content hashes are unique in the index and
+    links that failed or turned out to be duplicates are remembered with their attempt count,
+    so a resumed run decides whether to skip a link with a single primary key lookup.
+    """
+
+    def __init__(self, doc_location: str, max_retries: int = 3):
+        """
+        Args:
+            doc_location (str): Directory holding the transcripts and the index database.
+            max_retries (int): Attempts after which a failing link is no longer retried.
+        """
+        self.doc_location = doc_location
+        self.max_retries = max_retries
+        os.makedirs(doc_location, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(doc_location, INDEX_FILE_NAME),
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._import_legacy_index()
+
+    def _import_legacy_index(self) -> None:
+        """Import entries of a blog_index.json written by earlier versions, once."""
+        legacy_path = os.path.join(self.doc_location, LEGACY_INDEX_FILE_NAME)
+        if not os.path.exists(legacy_path) or len(self) > 0:
+            return
+
+        with open(legacy_path, "r") as f:
+            blog_index = json.load(f)
+        imported = 0
+        with self._lock, self._conn:
+            for title, value in blog_index.items():
+                path = os.path.join(self.doc_location, title)
+                if not os.path.exists(path):
+                    continue
+                with open(path, "r") as f:
+                    hash_val = hashlib.sha256(f.read().encode('utf-8')).hexdigest()
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO transcripts VALUES (?, ?, ?, ?, ?)",
+                    (title, value["link"], value.get("transcript_link"), hash_val, time.time()))
+                imported += 1
+        logger.info(f"Imported {imported} entries from {legacy_path} into the transcript index.")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+
+    def should_skip(self, link: str) -> bool:
+        """Return True if `link` is already downloaded, a known duplicate or out of retries."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM transcripts WHERE link = ?", (link,)).fetchone():
+                return True
+            row = self._conn.execute(
+                "SELECT status, attempts FROM link_state WHERE link = ?", (link,)).fetchone()
+        if row is None:
+            return False
+        status, attempts = row
+        return status == "duplicate" or attempts >= self.max_retries
+
+    def has_hash(self, hash_val: str) -> bool:
+        """Return True if a transcript with this content hash is already stored."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM transcripts WHERE hash = ?", (hash_val,)).fetchone() is not None
+
+    def add_transcript(self, title: str, link: str, transcript_link: Optional[str], hash_val: str) -> None:
+        """Record a completed transcript, the file must already be written."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?, ?)",
+                (title, link, transcript_link, hash_val, time.time()))
+            self._conn.execute("DELETE FROM link_state WHERE link = ?", (link,))
+
+    def mark_duplicate(self, link: str) -> None:
+        """Record that the transcript of `link` has the same content as a stored one."""
+        self._set_state(link, "duplicate", None)
+
+    def mark_failed(self, link: str, error: str) -> None:
+        """Record a failed attempt for `link`, it is retried until max_retries is reached."""
+        self._set_state(link, "failed", error)
+
+    def _set_state(self, link: str, status: str, error: Optional[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO link_state (link, status, attempts, last_error, updated_at) "
+                "VALUES (?, ?, 1, ?, ?) "
+                "ON CONFLICT(link) DO UPDATE SET status = excluded.status, "
+                "attempts = attempts + 1, last_error = excluded.last_error, "
+                "updated_at = excluded.updated_at",
+                (link, status, error, time.time()))
+
+    def entries(self) -> dict:
+        """Return the index as a dict of title -> {title, link, transcript_link, hash}."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT title, link, transcript_link, hash FROM transcripts ORDER BY created_at").fetchall()
+        return {title: {"title": title, "link": link, "transcript_link": transcript_link, "hash": hash_val}
+                for title, link, transcript_link, hash_val in rows}
+
+    def get_feed(self, site: str) -> Optional[dict]:
+        """Return the feed discovered for `site` with its validators, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT feed_url, etag, modified FROM feeds WHERE site = ?", (site,)).fetchone()
+        if row is None:
+            return None
+        return {"feed_url": row[0], "etag": row[1], "modified": row[2]}
+
+    def set_feed(self, site: str, feed_url: str, etag: Optional[str], modified: Optional[str]) -> None:
+        """Remember the feed of `site` and the ETag/Last-Modified of its last response."""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO feeds VALUES (?, ?, ?, ?, ?)",
+                               (site, feed_url, etag, modified, time.time()))
+
+    def add_feed_entries(self, feed_url: str, links: list) -> None:
+        """Record the entry links listed by a feed."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO feed_entries VALUES (?, ?, ?)",
+                                   [(link, feed_url, now) for link in links])
+
+    def pending_feed_links(self, feed_url: str) -> list:
+        """
+        Return the entry links of a feed that are not downloaded, not duplicates and not out of
+        retries, oldest first. Entries listed by an earlier response stay pending until
+        downloaded, so an unchanged feed still yields the links a previous run did not finish.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT f.link FROM feed_entries f "
+                "LEFT JOIN link_state s ON s.link = f.link "
+                "WHERE f.feed_url = ? "
+                "AND NOT EXISTS (SELECT 1 FROM transcripts t WHERE t.link = f.link) "
+                "AND (s.link IS NULL OR (s.status != 'duplicate' AND s.attempts < ?)) "
+                "ORDER BY f.added_at, f.rowid",
+                (feed_url, self.max_retries)).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,247 @@
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from itertools import groupby
+from typing import Iterable, Iterator
+from dotenv import load_dotenv
+from common.logging_config import logger
+
+load_dotenv()
+
+STORE_DIR_NAME = "store"
+CATALOG_FILE_NAME = "catalog.sqlite3"
+SEGMENT_FILE_PATTERN = "segment-{:06d}.seg"
+
+# "zstd" needs the zstandard package, "zlib" is always available
+TRANSCRIPT_STORE_CODEC = os.environ.get("TRANSCRIPT_STORE_CODEC", "zstd")
+TRANSCRIPT_STORE_LEVEL = int(os.environ.get("TRANSCRIPT_STORE_LEVEL", "6"))
+# A new segment file is started once the current one reaches this size
+TRANSCRIPT_SEGMENT_SIZE = int(os.environ.get("TRANSCRIPT_SEGMENT_SIZE", str(64 * 1024 * 1024)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    codec TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# SQLite limits the number of parameters of a statement
+_QUERY_BATCH_SIZE = 500
+
+
+def _available_codec(codec: str) -> str:
+    if codec == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            logger.warning("zstandard is not installed, compressing transcripts with zlib.")
+            return "zlib"
+    elif codec != "zlib":
+        raise ValueError(f"Unknown transcript store codec: {codec}")
+    return codec
+
+
+def _compressor(codec: str, level: int):
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    return zlib.compressobj(level)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        import zstandard
+        # Frames written by a streaming compressor do not record their size
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown transcript store codec: {codec}")
+
+
+class BlobWriter:
+    """File-like object compressing the text of one transcript as it is written."""
+
+    def __init__(self, codec: str, level: int):
+        self.codec = codec
+        self._compressor = _compressor(codec, level)
+        self._parts = []
+        self.size = 0
+
+    def write(self, text: str) -> int:
+        data = text.encode('utf-8')
+        self.size += len(data)
+        compressed = self._compressor.compress(data)
+        if compressed:
+            self._parts.append(compressed)
+        return len(text)
+
+    def finish(self) -> bytes:
+        """Return the compressed frame, the writer cannot be used afterwards."""
+        self._parts.append(self._compressor.flush())
+        return b"".join(self._parts)
+
+
+class TranscriptStore:
+    """
+    Content-addressed store of transcript texts, keyed by the SHA-256 of the text.
+
+    Each transcript is compressed into its own frame and appended to large segment files,
+    with its location kept in a SQLite catalog. Storing a hash that is already present is a
+    no-op, and the bulk reader reads the frames of many transcripts in segment order, one open
+    file at a time, instead of opening a file per transcript. The mapping from links to
+    hashes is kept by the TranscriptIndex.
+    """
+
+    def __init__(self, doc_location: str, codec: str = TRANSCRIPT_STORE_CODEC,
+                 level: int = TRANSCRIPT_STORE_LEVEL, segment_size: int = TRANSCRIPT_SEGMENT_SIZE):
+        """
+        Args:
+            doc_location (str): Directory holding the transcript index, the store is a subdirectory.
+            codec (str): Compression of new transcripts, "zstd" or "zlib".
+            level (int): Compression level.
+            segment_size (int): Size in bytes after which a new segment file is started.
+        """
+        self.path = os.path.join(doc_location, STORE_DIR_NAME)
+        self.codec = _available_codec(codec)
+        self.level = level
+        self.segment_size = segment_size
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.path, CATALOG_FILE_NAME),
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        row = self._conn.execute("SELECT MAX(segment) FROM blobs").fetchone()
+        self._segment = row[0] or 1
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, SEGMENT_FILE_PATTERN.format(segment))
+
+    def blob_writer(self) -> BlobWriter:
+        """Return a writer compressing a transcript with the store codec, see put_blob."""
+        return BlobWriter(self.codec, self.level)
+
+    def has(self, hash_val: str) -> bool:
+        """Return True if the transcript with this content hash is stored."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM blobs WHERE hash = ?", (hash_val,)).fetchone() is not None
+
+    def missing(self, hashes: Iterable[str]) -> set:
+        """Return the hashes among `hashes` that are not stored."""
+        wanted = set(hashes)
+        stored = set()
+        ordered = list(wanted)
+        with self._lock:
+            for i in range(0, len(ordered), _QUERY_BATCH_SIZE):
+                batch = ordered[i:i + _QUERY_BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT hash FROM blobs WHERE hash IN ({','.join('?' * len(batch))})", batch)
+                stored.update(row[0] for row in rows)
+        return wanted - stored
+
+    def put(self, hash_val: str, text: str) -> None:
+        """Store a transcript text under its content hash."""
+        writer = self.blob_writer()
+        writer.write(text)
+        self.put_blob(hash_val, writer)
+
+    def put_blob(self, hash_val: str, writer: BlobWriter) -> None:
+        """Finish a BlobWriter and append its frame under the content hash of its text."""
+        if self.has(hash_val):
+            return
+        data = writer.finish()
+        with self._lock:
+            if os.path.exists(self._segment_path(self._segment)) and \
+                    os.path.getsize(self._segment_path(self._segment)) >= self.segment_size:
+                self._segment += 1
+            with open(self._segment_path(self._segment), "ab") as f:
+                # Other processes may append to the same segment
+                fcntl.flock(f, fcntl.LOCK_EX)
+                offset = f.seek(0, os.SEEK_END)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (hash_val, self._segment, offset, len(data), writer.size, writer.codec, time.time()))
+
+    def get(self, hash_val: str) -> str:
+        """Return the text of the transcript with this content hash."""
+        for _, text in self.iter_texts([hash_val]):
+            return text
+        raise KeyError(hash_val)
+
+    def iter_texts(self, hashes: Iterable[str]) -> Iterator[tuple]:
+        """
+        Yield (hash, text) for the stored transcripts among `hashes`, in storage order.
+        Frames are read segment by segment with one open file each, hashes that are not
+        stored are skipped.
+        Args:
+            hashes (Iterable[str]): Content hashes to read.
+        Returns:
+            Iterator[tuple]: (hash, text) pairs.
+        """
+        ordered = list(dict.fromkeys(hashes))
+        locations = []
+        with self._lock:
+            for i in range(0, len(ordered), _QUERY_BATCH_SIZE):
+                batch = ordered[i:i + _QUERY_BATCH_SIZE]
+                locations.extend(self._conn.execute(
+                    "SELECT hash, segment, offset, length, codec FROM blobs "
+                    f"WHERE hash IN ({','.join('?' * len(batch))})", batch).fetchall())
+        if len(locations) < len(ordered):
+            logger.warning(f"{len(ordered) - len(locations)} transcripts are missing from the store.")
+
+        locations.sort(key=lambda location: (location[1], location[2]))
+        for segment, group in groupby(locations, key=lambda location: location[1]):
+            with open(self._segment_path(segment), "rb") as f:
+                for hash_val, _, offset, length, codec in group:
+                    f.seek(offset)
+                    yield hash_val, _decompress(codec, f.read(length)).decode('utf-8')
+
+    def import_files(self, entries: dict, doc_location: str) -> int:
+        """
+        Move plain text transcripts written by earlier versions into the store.
+        Files are deleted once their text is stored.
+        Args:
+            entries (dict): Transcript index entries, title -> {title, link, hash}.
+            doc_location (str): Directory holding the transcript files.
+        Returns:
+            int: Number of files imported.
+        """
+        missing = self.missing(entry["hash"] for entry in entries.values())
+        imported = 0
+        for title, entry in entries.items():
+            path = os.path.join(doc_location, title)
+            if entry["hash"] not in missing or not os.path.exists(path):
+                continue
+            with open(path, "r") as f:
+                self.put(entry["hash"], f.read())
+            os.remove(path)
+            imported += 1
+        if imported:
+            logger.info(f"Imported {imported} transcript files into the transcript store.")
+        return imported
+
+    def stats(self) -> dict:
+        """Return the number of transcripts and their stored and uncompressed bytes."""
+        with self._lock:
+            count, stored, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        return {"transcripts": count, "stored_bytes": stored, "text_bytes": size,
+                "ratio": size / stored if stored else 0.0}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
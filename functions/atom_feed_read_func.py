@@ -1,12 +1,35 @@
 from typing import Any, Optional, Type
 from langchain.tools import BaseTool
-import feedparser
 from pydantic import BaseModel, Field
+from common.http_client import get_http_client
 
-def atom_feed_read_func(link: str) -> Any:
-    feed = feedparser.parse(link)
-    if feed.bozo:
+def atom_feed_read_func(link: str, etag: Optional[str] = None, modified: Optional[str] = None) -> dict:
+    """Read an Atom/RSS feed with a conditional GET.
+    Args:
+        link (str): URL of the feed.
+        etag (Optional[str]): ETag of the last response, sent as If-None-Match.
+        modified (Optional[str]): Last-Modified of the last response, sent as If-Modified-Since.
+    Returns:
+        dict: "entries" of the feed, the "etag" and "modified" validators to send next time and
+        "not_modified", True when the server answered 304 and there are no entries."""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+    response = get_http_client().get(link, headers=headers)
+    if response.status_code == 304:
+        return {"entries": [], "etag": etag, "modified": modified, "not_modified": True}
+    response.raise_for_status()
+
+    # Imported here so that importing the graph nodes stays cheap at agent startup
+    import feedparser
+
+    feed = feedparser.parse(response.content, response_headers=dict(response.headers))
+    if feed.bozo and not feed.entries:
         raise ValueError(f"Failed to parse feed: {feed.bozo_exception}")
-    
-    return feed.entries
 
+    return {"entries": feed.entries,
+            "etag": response.headers.get("ETag"),
+            "modified": response.headers.get("Last-Modified"),
+            "not_modified": False}
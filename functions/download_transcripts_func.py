@@ -1,92 +1,182 @@
-
-from functions.atom_feed_find_func import atom_feed_find_func
-from functions.atom_feed_read_func import atom_feed_read_func
-from tools.visit_web_page_tool import VisitWebPageSyncTool
+from tools.visit_web_page_tool import afetch_page, fetch_report
 from functions.extract_transcript_link_func import extract_transcript_link_func
-from functions.extract_transcript_content_func import extract_transcript_content_func
+from functions.extract_transcript_content_func import write_transcript_content
 import os
-import logging
-from langchain_core.tools import tool
+import asyncio
+from typing import Optional
 from common.common import GraphState
 import json
-import hashlib
-import shutil
+from dotenv import load_dotenv
 from common.logging_config import logger
+from common.transcript_index import TranscriptIndex
+from common.transcript_store import TranscriptStore
+from common.metrics import counter, span
+
+load_dotenv()
+
+# Markers the fetched pages must contain, pages without them are rendered in the browser
+TRANSCRIPT_LINK_MARKER = "SHOW TRANSCRIPT:"
+TRANSCRIPT_CONTENT_MARKER = "DOCS_modelChunk"
+
+# Concurrency of the download pipeline stages and the size of the queues between them
+DOWNLOAD_PAGE_WORKERS = int(os.environ.get("DOWNLOAD_PAGE_WORKERS", "8"))
+DOWNLOAD_TRANSCRIPT_WORKERS = int(os.environ.get("DOWNLOAD_TRANSCRIPT_WORKERS", "4"))
+DOWNLOAD_QUEUE_SIZE = int(os.environ.get("DOWNLOAD_QUEUE_SIZE", "16"))
+DOWNLOAD_MAX_RETRIES = int(os.environ.get("DOWNLOAD_MAX_RETRIES", "3"))
+DOC_LOCATION = os.environ.get("DOC_LOCATION", "transcripts")
+
+_DONE = object()  # End of stream marker passed between pipeline stages
+
+transcripts_processed = counter("transcripts_processed_total", "Episode links processed by the download pipeline, by outcome")
+
+
+async def _run_stage(name: str, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue],
+                     workers: int, downstream_workers: int, handler, on_error=None) -> None:
+    """
+    Run `workers` concurrent workers applying `handler` to the items of `inbox`.
+    Results other than None are put on the bounded `outbox`, so a slow stage applies
+    backpressure to the ones before it. Items whose handler raises are passed to `on_error`.
+    Once every worker has seen the end of stream marker,
+    one marker per downstream worker is forwarded.
+    """
+    async def worker():
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            try:
+                with span(f"download.{name}"):
+                    result = await handler(item)
+            except Exception as e:
+                logger.error(f"Error in download stage {name} for {item}: {e}")
+                if on_error is not None:
+                    on_error(item, e)
+                continue
+            if result is not None and outbox is not None:
+                await outbox.put(result)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    if outbox is not None:
+        for _ in range(downstream_workers):
+            await outbox.put(_DONE)
+
+
+def _transcript_title(link: str) -> str:
+    """File name of the transcript of an episode link."""
+    title = link.replace(":", "_").replace("/", "_").replace(".", "_") # Replace special characters in the link
+    return f"{title}.txt"
+
 
-def download_transcripts_func(state: GraphState) -> None:
-    """Download transcripts from the provided content.
+def _compress_transcript(web_content: str, store: TranscriptStore) -> tuple:
+    """Compress the transcript in the page content, return its hash, segment count and writer."""
+    with span("extract_transcript", size=len(web_content)) as extract_span:
+        writer = store.blob_writer()
+        hash_val, segments = write_transcript_content(web_content, writer)
+        extract_span.set(segments=segments)
+    return hash_val, segments, writer
+
+
+async def download_transcripts_func(state: GraphState) -> None:
+    """Download transcripts for the links returned by the crawler.
+
+    Links flow through a staged pipeline: fetch episode page -> extract transcript link ->
+    fetch transcript -> extract content -> dedupe and write. Network stages run with bounded
+    concurrency so waits overlap across many links.
     Args:
-        content (str): The HTML content to search for Atom feed links.
+        state (GraphState): Graph state whose last message holds the JSON list of links.
     """
     logger.debug(f"state = {state}")  # Print the first 100 characters of content for debugging
     links = json.loads(state["messages"][-1].content)
     if not isinstance(links, list):
         raise ValueError("Expected 'links' to be a list, but got: {}".format(type(links)))
 
-    blog_index = {}
-    visited_links = set()
-    hash_set = set()
-
-    # Create the transcripts directory if it doesn't exist
-    if not os.path.exists("transcripts"):
-        logger.info("Transcripts directory does not exists, creating it.")
-        os.makedirs("transcripts")
-        logger.info("Created transcripts directory.")
-    else:
-        if os.path.exists("transcripts/blog_index.json"):
-            logger.info("Found existing blog_index.json, using it.")
-            blog_index = json.load(open("transcripts/blog_index.json", "r"))
-
-            # Restore visited links from the blog index
-            for item in blog_index.values():
-                visited_links.add(item["link"])
-            logger.info(f"Restored {len(visited_links)} visited links from blog index.")
-
-    # Traverse all the links and download the transcripts
-    for link in links:
-        if link in visited_links:
-            logger.info(f"Skipping already visited link: {link}")
-            continue
-        visited_links.add(link)
-        logger.info(f"Processing link: {link}")
+    # Completed, duplicate and failed links are persisted as they happen, so an
+    # interrupted run resumes where it stopped
+    index = TranscriptIndex(DOC_LOCATION, max_retries=DOWNLOAD_MAX_RETRIES)
+    store = TranscriptStore(DOC_LOCATION)
+    store.import_files(index.entries(), DOC_LOCATION)
+    logger.info(f"Transcript index has {len(index)} transcripts.")
+    queued_links = set()
 
-        # Visit the web page and get the content
-        content = VisitWebPageSyncTool().invoke(input={"url": link, "clean_flag": False})
+    async def fetch_episode(link: str):
+        logger.info(f"Processing link: {link}")
 
-        # Find the transcript link in the content
-        transcript_link = extract_transcript_link_func(content)
+        # Visit the web page and find the transcript link in the content
+        content = await afetch_page(link, clean_flag=False, expect=TRANSCRIPT_LINK_MARKER)
+        with span("extract_transcript_link"):
+            transcript_link = await asyncio.to_thread(extract_transcript_link_func, content)
         logger.info(f"transcript_link = {transcript_link}")
-        if transcript_link is not None:
-            web_content = VisitWebPageSyncTool().invoke(input={"url":transcript_link, "clean_flag":True})
-            transcript_content = extract_transcript_content_func(web_content)
+        if transcript_link is None:
+            record_failure(link, "transcript link not found")
+            return None
+        return link, transcript_link
 
-            # Calculate hash of the transcript content to avoid duplicates
-            if not transcript_content:
-                logger.warning(f"No transcript content found for link: {link}")
-                continue
-            
-            hash_val = hashlib.sha256(transcript_content.encode('utf-8')).hexdigest()
-            if hash_val in hash_set:
-                logger.info(f"Transcript content already exists for link: {link}, skipping.")
+    async def fetch_transcript(item: tuple):
+        link, transcript_link = item
+        web_content = await afetch_page(transcript_link, clean_flag=True, expect=TRANSCRIPT_CONTENT_MARKER)
+
+        # Compress the transcript while it is extracted, it is stored once known not to be a duplicate
+        hash_val, segments, writer = await asyncio.to_thread(_compress_transcript, web_content, store)
+        if not segments:
+            logger.warning(f"No transcript content found for link: {link}")
+            record_failure(link, "no transcript content")
+            return None
+        return link, transcript_link, hash_val, writer
+
+    async def save_transcript(item: tuple):
+        link, transcript_link, hash_val, writer = item
+
+        # Compare the hash of the transcript content to avoid duplicates
+        if index.has_hash(hash_val):
+            logger.info(f"Transcript content already exists for link: {link}, skipping.")
+            index.mark_duplicate(link)
+            transcripts_processed.inc(outcome="duplicate")
+            return None
+        logger.info(f"Transcript content found for link: {link}")
+
+        # Store the text before indexing it, so the index never points to a missing transcript
+        title = _transcript_title(link)
+        await asyncio.to_thread(store.put_blob, hash_val, writer)
+        index.add_transcript(title, link, transcript_link, hash_val)
+        transcripts_processed.inc(outcome="saved")
+        logger.info(f"Transcript content saved to {title}")
+        return None
+
+    def record_failure(item, error) -> None:
+        link = item if isinstance(item, str) else item[0]
+        index.mark_failed(link, str(error))
+        transcripts_processed.inc(outcome="failed")
+
+    link_queue = asyncio.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+    transcript_queue = asyncio.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+    content_queue = asyncio.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+
+    async def feed_links():
+        # Traverse all the links, skipping the ones already downloaded
+        for link in links:
+            if link in queued_links or index.should_skip(link):
+                logger.info(f"Skipping already visited link: {link}")
+                transcripts_processed.inc(outcome="skipped")
                 continue
-            hash_set.add(hash_val)
-            logger.info(f"Transcript content found for link: {link}")
-
-            title = link.replace(":", "_").replace("/", "_").replace(".", "_") # Replace special characters in the link
-            title = f"{title}.txt"
-            with open(os.path.join("transcripts", title), "w") as f:
-                f.write(transcript_content)
-                logger.info(f"Transcript content saved to {title}")
-            
-            blog_index[title] = {
-                "title": title,
-                "link": link,
-                "transcript_link": transcript_link
-            }
-
-    # Save the blog index to a JSON file
-    with open("transcripts/blog_index.json", "w") as f:
-        json.dump(blog_index, f, indent=4)
-        logger.info("Blog index saved to transcripts/blog_index.json")
-
-    logger.info("All transcripts downloaded and saved.")
\ No newline at end of file
+            queued_links.add(link)
+            await link_queue.put(link)
+        for _ in range(DOWNLOAD_PAGE_WORKERS):
+            await link_queue.put(_DONE)
+
+    try:
+        await asyncio.gather(
+            feed_links(),
+            _run_stage("fetch_episode", link_queue, transcript_queue,
+                       DOWNLOAD_PAGE_WORKERS, DOWNLOAD_TRANSCRIPT_WORKERS, fetch_episode, record_failure),
+            _run_stage("fetch_transcript", transcript_queue, content_queue,
+                       DOWNLOAD_TRANSCRIPT_WORKERS, 1, fetch_transcript, record_failure),
+            _run_stage("save_transcript", content_queue, None, 1, 0, save_transcript, record_failure),
+        )
+        logger.info(f"Transcript index has {len(index)} transcripts.")
+        logger.info(f"Transcript store: {store.stats()}")
+    finally:
+        index.close()
+        store.close()
+
+    logger.info(f"Fetch paths used: {fetch_report.summary()}")
+    logger.info("All transcripts downloaded and saved.")
@@ -1,23 +1,69 @@
-from typing import Any, Optional, Type
+from typing import Any, Iterator, Optional, TextIO, Type
 from pydantic import BaseModel, Field
 from langchain.tools import BaseTool
 import re
 import json
+import hashlib
 from common.logging_config import logger
 
+MODEL_CHUNK_MARKER = "DOCS_modelChunk"
+# Assignment between the marker and the first element of the chunk array
+MODEL_CHUNK_ASSIGNMENT_RE = re.compile(r'\s*=\s*\[\s*')
+
+_decoder = json.JSONDecoder()
+
+
+def iter_transcript_segments(html_content: str) -> Iterator[str]:
+    """
+    Yield the text segments of the DOCS_modelChunk payloads in the content, in one pass.
+    Each payload is located with str.find and its first element decoded in place, so the
+    content is never copied or scanned by a backtracking regex.
+    Args:
+        html_content (str): Rendered text of a Google Docs transcript page.
+    Returns:
+        Iterator[str]: The "s" field of every model chunk.
+    """
+    position = html_content.find(MODEL_CHUNK_MARKER)
+    while position != -1:
+        position += len(MODEL_CHUNK_MARKER)
+        match = MODEL_CHUNK_ASSIGNMENT_RE.match(html_content, position)
+        if match:
+            try:
+                data, position = _decoder.raw_decode(html_content, match.end())
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping malformed model chunk at offset {match.end()}: {e}")
+            else:
+                if isinstance(data, dict) and "s" in data:
+                    yield data["s"]
+        position = html_content.find(MODEL_CHUNK_MARKER, position)
+
+
+def write_transcript_content(html_content: str, file: TextIO) -> tuple:
+    """
+    Stream the transcript text of the content to `file`, segments separated by a space.
+    Args:
+        html_content (str): Rendered text of a Google Docs transcript page.
+        file (TextIO): File to write the transcript to.
+    Returns:
+        tuple: SHA-256 hex digest of the written text and the number of segments.
+    """
+    digest = hashlib.sha256()
+    count = 0
+    for segment in iter_transcript_segments(html_content):
+        piece = segment if count == 0 else f" {segment}"
+        file.write(piece)
+        digest.update(piece.encode('utf-8'))
+        count += 1
+    if count == 0:
+        logger.warning("No match found in the HTML content.")
+    return digest.hexdigest(), count
+
+
 def extract_transcript_content_func(html_content: str) -> str:
     """Extract transcript context text from HTML content."""
-    text_content = []
-    matches = re.findall(r'DOCS_modelChunk\s=\s\[(.*?),\s*{', html_content, re.DOTALL)
-    if matches is None:
+    text_content = list(iter_transcript_segments(html_content))
+    if not text_content:
         logger.warning("No match found in the HTML content.")
         return ""
-    else:
-        logger.info("Match found in the HTML content.")
-        for match in matches:
-            data = json.loads(match)
-            if "s" in data:
-                text_content.append(data["s"])
-
+    logger.info("Match found in the HTML content.")
     return ' '.join(text_content)
-    
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+import sys
+from dotenv import load_dotenv
+from common.logging_config import logger
+from common.metrics import span, start_metrics, stop_metrics
+
+load_dotenv()
+
+# Niceness the job process adds to itself, so queries served by the parent get the CPU first
+INGEST_JOB_NICENESS = int(os.environ.get("INGEST_JOB_NICENESS", "10"))
+
+
+def _report(**event) -> None:
+    """Write a progress event as a JSON line on stdout, where the server reads it."""
+    print(json.dumps(event), flush=True)
+
+
+async def run_ingestion_job(tool_name: str, args: dict) -> dict:
+    """
+    Run a crawl or feed discovery, download the transcripts of the links found and index them,
+    as the graph does after a crawl_web_page or discover_feed tool call.
+    Args:
+        tool_name (str): "crawl_web_page" or "discover_feed".
+        args (dict): Arguments of the tool call.
+    Returns:
+        dict: Number of links found and transcripts indexed.
+    """
+    from langchain_core.messages import ToolMessage
+    from common.transcript_index import TranscriptIndex
+    from functions.download_transcripts_func import DOC_LOCATION, download_transcripts_func
+    from functions.initialize_database import initialize_database
+    from tools.crawl_web_page_tool import CrawlWebPageSyncTool
+    from tools.discover_feed_tool import DiscoverFeedTool
+
+    tools = {tool.name: tool for tool in (CrawlWebPageSyncTool(), DiscoverFeedTool())}
+    if tool_name not in tools:
+        raise ValueError(f"Unknown ingestion tool: {tool_name}")
+
+    _report(stage=tool_name)
+    with span(f"job.{tool_name}"):
+        links = await tools[tool_name].ainvoke(args)
+    _report(stage="download_transcripts", links=len(links))
+    with span("job.download_transcripts"):
+        await download_transcripts_func(
+            {"messages": [ToolMessage(content=json.dumps(links), name=tool_name, tool_call_id="ingest-job")]})
+    _report(stage="initialize_database")
+    with span("job.initialize_database"):
+        await asyncio.to_thread(initialize_database, None)
+
+    index = TranscriptIndex(DOC_LOCATION)
+    try:
+        transcripts = len(index)
+    finally:
+        index.close()
+    return {"links": len(links), "transcripts": transcripts}
+
+
+def main():
+    """Entry point of the job process: python -m functions.ingest_job <tool name> <JSON args>."""
+    if INGEST_JOB_NICENESS and hasattr(os, "nice"):
+        os.nice(INGEST_JOB_NICENESS)
+    tool_name, args = sys.argv[1], json.loads(sys.argv[2])
+    start_metrics()
+    try:
+        result = asyncio.run(run_ingestion_job(tool_name, args))
+    except Exception as e:
+        logger.error(f"Ingestion job {tool_name} {args} failed: {e}")
+        _report(error=str(e))
+        sys.exit(1)
+    finally:
+        stop_metrics()
+    _report(result=result)
+
+
+if __name__ == "__main__":
+    main()
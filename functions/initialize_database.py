@@ -1,78 +1,231 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
 import os
-import json
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from dotenv import load_dotenv
-import logging
 from common.common import GraphState
 import shutil
+from typing import Optional
+from common.embeddings import get_embeddings
 from common.logging_config import logger
+from common.transcript_index import TranscriptIndex
+from common.transcript_store import TranscriptStore
+from common.bm25_index import is_bm25_up_to_date, update_bm25_index
+from common.index_generation import generation_path, new_generation, publish_generation
+from common.parallel_ingest import EmbeddingShardPool, IngestProgress, split_transcripts
+from common.metrics import counter, span
 
 load_dotenv()
 
-DOC_LOCATION = os.environ.get("DOC_LOCATION")
-CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE"))
-CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP"))
-EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
+DOC_LOCATION = os.environ.get("DOC_LOCATION", "transcripts")
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "100"))
+DB_PATH = os.environ.get("DB_PATH", "chroma_db")
+
+# "incremental" embeds only new or changed transcripts into a copy of the current vector store,
+# "full" rebuilds it from scratch, either way in a new generation published once validated
+INDEX_MODE = os.environ.get("INDEX_MODE", "incremental")
+
+# Collection the chunks are stored in, the query tool reads the first collection of the store
+COLLECTION_NAME = "langchain"
+
+# Number of chunks embedded and upserted into the vector store per call
+INDEX_BATCH_SIZE = int(os.environ.get("INDEX_BATCH_SIZE", "1000"))
+
+chunks_indexed = counter("chunks_indexed_total", "Chunks embedded and upserted into the vector store")
+chunks_deleted = counter("chunks_deleted_total", "Stale chunks deleted from the vector store")
 
 def initialize_database(state: GraphState) -> None:
     """
     Initializes the database by loading documents retrieved by web crawler.
+    Only transcripts whose content hash is not in the vector store yet are embedded, and
+    vectors of removed or changed transcripts are deleted. Changes are made in a new
+    generation of the vector store and BM25 index, queries keep using the current one until
+    it is published.
     """
     doc_location = DOC_LOCATION
 
-    # Create a text splitter
-    logger.info(f"Creating text splitter with chunk size {CHUNK_SIZE} and overlap {CHUNK_OVERLAP}.")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE, 
-        chunk_overlap=CHUNK_OVERLAP)
-
     # Load file index
-    logger.info(f"Loading blog index from {doc_location}/blog_index.json")
-    if not os.path.exists(os.path.join(doc_location, "blog_index.json")):
-        raise FileNotFoundError(f"File index file does not exist: {doc_location}")
-    
+    logger.info(f"Loading transcript index from {doc_location}")
+    if not os.path.exists(doc_location):
+        raise FileNotFoundError(f"Transcript directory does not exist: {doc_location}")
+    index = TranscriptIndex(doc_location)
+    blog_index = index.entries()
+    index.close()
+    store = TranscriptStore(doc_location)
+    store.import_files(blog_index, doc_location)
+    try:
+        _index_transcripts(blog_index, doc_location, store)
+    finally:
+        store.close()
+
+
+def _index_transcripts(blog_index: dict, doc_location: str, store: TranscriptStore) -> None:
+    """
+    Bring the vector store and the BM25 index in line with the transcript index entries. Both
+    are built into one new generation and published together, so queries never fuse results
+    of a BM25 index and a vector store built from different transcripts.
+    """
+    settings = _index_settings()
+    if INDEX_MODE != "full" and _is_up_to_date(blog_index, *_published_changes(blog_index, settings)):
+        logger.info("Vector store and BM25 index are up to date.")
+        return
+
+    # Build the next generation off the serving path, other builds wait until it is published
+    with new_generation(DB_PATH) as build_path:
+        # Plan against the latest generation, another build may have published it meanwhile
+        current, indexed_hashes, stale_ids, settings_changed = _published_changes(blog_index, settings)
+        rebuild = INDEX_MODE == "full" or settings_changed
+        if rebuild:
+            if settings_changed:
+                logger.warning(f"Vector store was built with other settings than {settings}, rebuilding it.")
+            else:
+                logger.warning("Full index rebuild requested, building a new vector store.")
+            indexed_hashes, stale_ids = {}, []
+        elif _is_up_to_date(blog_index, current, indexed_hashes, stale_ids, settings_changed):
+            logger.info("Vector store and BM25 index are up to date.")
+            return
+
+        # Load and split only the transcripts that are not indexed yet in a process pool, every
+        # chunk is stored as its own document so it is embedded in full
+        entries_by_hash = {entry["hash"]: entry for entry in blog_index.values()
+                           if entry["hash"] not in indexed_hashes}
+        logger.info(f"Splitting transcripts with chunk size {CHUNK_SIZE} and overlap {CHUNK_OVERLAP}.")
+        chunks = split_transcripts(doc_location, list(entries_by_hash), CHUNK_SIZE, CHUNK_OVERLAP)
+        logger.info(f"Indexing {len(chunks)} chunks of {len(entries_by_hash)} new transcripts, "
+                    f"{len(blog_index) - len(entries_by_hash)} unchanged.")
+        if not chunks and not stale_ids and current is not None and not rebuild \
+                and is_bm25_up_to_date(current, blog_index):
+            logger.info("No new chunks, vector store is up to date.")
+            return
+
+        # Start from a copy of the current generation
+        if indexed_hashes:
+            with span("chroma_copy"):
+                shutil.rmtree(build_path)
+                shutil.copytree(current, build_path)
+        _update_vector_store(build_path, chunks, stale_ids, entries_by_hash, settings)
+        _validate_vector_store(build_path, sum(map(len, indexed_hashes.values())) - len(stale_ids) + len(chunks))
+        # Lexical index, only transcripts added since the current generation are tokenized
+        update_bm25_index(blog_index, doc_location, build_path, current, store=store)
+
+        # Running query tools switch to the new generation on their next query
+        generation = publish_generation(build_path)
+        logger.info(f"Published vector store and BM25 index generation {generation}.")
+
+
+def _index_settings() -> dict:
+    """
+    Settings the stored vectors depend on, kept in the collection metadata. Chunks are only
+    added for new transcripts, so a store built with other settings is rebuilt in full rather
+    than mixing vectors of different models or chunkings in one index.
+    """
+    return {"embedding_model": get_embeddings().cache_model,
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP}
+
+
+def _published_changes(blog_index: dict, settings: dict) -> tuple:
+    """
+    Compare the published vector store with the transcript index entries and the index settings.
+    Returns:
+        tuple: Path of the published generation or None, chunk ids by indexed content hash,
+        ids of the chunks of transcripts that were removed or whose content changed, and
+        whether the store was built with other settings.
+    """
+    current = generation_path(DB_PATH)
+    indexed_hashes, stored_settings = _indexed_hashes(current) if current is not None else ({}, {})
+    wanted_hashes = {entry["hash"] for entry in blog_index.values()}
+    stale_ids = [doc_id for hash_val, ids in indexed_hashes.items()
+                 if hash_val not in wanted_hashes for doc_id in ids]
+    settings_changed = current is not None and bool(indexed_hashes) and \
+        {key: stored_settings.get(key) for key in settings} != settings
+    return current, indexed_hashes, stale_ids, settings_changed
+
+
+def _is_up_to_date(blog_index: dict, current: Optional[str], indexed_hashes: dict, stale_ids: list,
+                   settings_changed: bool) -> bool:
+    if current is None:
+        return not blog_index
+    return not settings_changed and not stale_ids and \
+        all(entry["hash"] in indexed_hashes for entry in blog_index.values()) and \
+        is_bm25_up_to_date(current, blog_index)
+
+
+def _indexed_hashes(path: str) -> tuple:
+    """Return the chunk ids of the vector store at `path` by transcript content hash, and its collection metadata."""
+    import chromadb
+
+    client = chromadb.PersistentClient(path=path)
+    indexed_hashes, metadata = {}, {}
+    for collection in client.list_collections()[:1]:
+        collection = client.get_collection(collection.name)
+        metadata = collection.metadata or {}
+        existing = collection.get(include=["metadatas"])
+        for doc_id, chunk_metadata in zip(existing["ids"], existing["metadatas"]):
+            indexed_hashes.setdefault((chunk_metadata or {}).get("content_hash"), []).append(doc_id)
+    return indexed_hashes, metadata
+
+
+def _update_vector_store(path: str, chunks: list, stale_ids: list, entries_by_hash: dict,
+                         settings: dict) -> None:
+    """Delete the stale chunks from the vector store at `path` and embed and upsert the new ones."""
+    # Imported here so that importing the graph nodes stays cheap at agent startup
+    import chromadb
+
+    embeddings = get_embeddings()
+    client = chromadb.PersistentClient(path=path)
+    # Vectors are always passed in, the collection needs no embedding function
+    collections = client.list_collections()
+    collection = client.get_or_create_collection(collections[0].name if collections else COLLECTION_NAME,
+                                                 embedding_function=None, metadata=settings)
+    try:
+        if stale_ids:
+            logger.info(f"Deleting {len(stale_ids)} stale chunks from the vector store.")
+            with span("chroma_delete", chunks=len(stale_ids)):
+                collection.delete(ids=stale_ids)
+            chunks_deleted.inc(len(stale_ids))
+        if chunks:
+            progress = IngestProgress("embed", len(chunks))
+            with EmbeddingShardPool(embeddings.model_name, embeddings.batch_size,
+                                    embeddings.backend, embeddings.onnx_file) as pool:
+                for i in range(0, len(chunks), INDEX_BATCH_SIZE):
+                    batch = chunks[i:i + INDEX_BATCH_SIZE]
+                    texts = [text for _, _, _, text in batch]
+                    # Vectors are computed here, so they are upserted in bulk without re-embedding
+                    vectors = embeddings.embed_documents(texts, encode=pool.encode)
+                    with span("chroma_upsert", chunks=len(batch)):
+                        collection.upsert(
+                            ids=[f"{hash_val}-{chunk}" for hash_val, chunk, _, _ in batch],
+                            embeddings=vectors,
+                            documents=texts,
+                            # Transcript text lives in the segment store under content_hash,
+                            # the source of a chunk is the episode it was downloaded from
+                            metadatas=[{"source": entries_by_hash[hash_val]["link"],
+                                        "title": entries_by_hash[hash_val]["title"],
+                                        "link": entries_by_hash[hash_val]["link"],
+                                        "content_hash": hash_val,
+                                        "chunk": chunk,
+                                        "start_index": start_index}
+                                       for hash_val, chunk, start_index, _ in batch])
+                    chunks_indexed.inc(len(batch))
+                    progress.update(len(batch))
+            progress.finish()
+    finally:
+        # Chroma shares one system per path, a later client of `path` must not reuse this one,
+        # the generation number is reused when the build is discarded
+        client.clear_system_cache()
+
+
+def _validate_vector_store(path: str, chunks: int) -> None:
+    """Check that the vector store built at `path` opens and holds the expected number of chunks."""
+    import chromadb
+
+    client = chromadb.PersistentClient(path=path)
     try:
-        with open(os.path.join(doc_location, "blog_index.json"), "r") as f:
-            blog_index = json.load(f)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Error decoding JSON from file index: {e}")
-    
-    # Load text files from directory and split them into chunks
-    documents = []
-    for file in os.listdir(DOC_LOCATION):
-        if not file.endswith('.txt'):
-            continue
-
-        with open(os.path.join(DOC_LOCATION, file), 'r') as f:
-            text = f.read()
-            doc = text_splitter.split_text(text)
-            documents.append({
-                "text": doc,
-                "metadata": {"source": os.path.join(DOC_LOCATION, file),
-                            "link": blog_index[file]["link"],}
-            })
-    
-    doc_list = [Document(page_content=json.dumps(doc["text"]), metadata=doc["metadata"]) for doc in documents]
-
-    if os.path.exists("chroma_db"):
-        logger.warning("Chroma database already exists, removing it.")
-        try:
-            # Remove the existing Chroma database directory
-            shutil.rmtree("chroma_db")
-        except Exception as e:
-            logger.error(f"Error removing existing Chroma database: {e}")
-            raise
-
-    # Initialize the vector store with the documents
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-    vector_store = Chroma.from_documents(
-        documents=doc_list,
-        embedding=embeddings,
-        persist_directory="chroma_db"
-    )
+        collections = client.list_collections()
+        count = client.get_collection(collections[0].name).count() if collections else 0
+    finally:
+        client.clear_system_cache()
+    if count != chunks:
+        raise ValueError(f"Vector store at {path} has {count} chunks, expected {chunks}")
 
 if __name__ == "__main__":
     initialize_database(None)
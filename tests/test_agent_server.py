@@ -0,0 +1,146 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import common.agent_server as agent_server
+from common.agent_server import AdmissionLimiter, AgentServer, HttpError, JobQueue
+
+
+class _QueryTool:
+    generation = (1, 2)
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.batches = []
+
+    async def abatch_query(self, queries: list) -> list:
+        self.batches.append(len(queries))
+        await asyncio.sleep(self.delay)
+        return [[{"link": f"http://site/{query}", "score": 1.0}] for query in queries]
+
+
+async def _choose_tool(query: str):
+    if query.startswith("http"):
+        return SimpleNamespace(tool_calls=[{"name": "crawl_web_page", "args": {"url": query}}], content="")
+    if query == "hi":
+        return SimpleNamespace(tool_calls=[], content="hello")
+    return SimpleNamespace(tool_calls=[{"name": "query_database", "args": {"query": query}}], content="")
+
+
+async def _send(port: int, raw: bytes) -> tuple:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(raw)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+async def _request(port: int, method: str, path: str, body=None) -> tuple:
+    data = json.dumps(body).encode() if body is not None else b""
+    return await _send(port, f"{method} {path} HTTP/1.1\r\nContent-Length: {len(data)}\r\n"
+                             f"Connection: close\r\n\r\n".encode() + data)
+
+
+def _serve(test, query_tool=None, **kwargs):
+    """Run `test(server, port)` against a server on a free port."""
+    async def main():
+        server = AgentServer(query_tool or _QueryTool(), _choose_tool,
+                             jobs=JobQueue(workers=0, max_queued=1), **kwargs)
+        await server.start("127.0.0.1", 0)
+        try:
+            return await test(server, server._server.sockets[0].getsockname()[1])
+        finally:
+            await server.close()
+
+    return asyncio.run(asyncio.wait_for(main(), 10))
+
+
+def test_concurrent_queries_are_batched():
+    query_tool = _QueryTool(delay=0.05)
+
+    async def test(server, port):
+        server.batcher.max_wait = 0.05
+        responses = await asyncio.gather(*(_request(port, "POST", "/query", {"query": f"q{i}", "session": "s1"})
+                                           for i in range(6)))
+        assert [status for status, _ in responses] == [200] * 6
+        assert responses[3][1]["results"] == [{"link": "http://site/q3", "score": 1.0}]
+        status, session = await _request(port, "GET", "/sessions/s1")
+        assert status == 200 and session["queries"] == 6
+
+    _serve(test, query_tool)
+    assert sum(query_tool.batches) == 6
+    assert len(query_tool.batches) < 6
+
+
+def test_query_routes():
+    async def test(server, port):
+        status, payload = await _request(port, "POST", "/query", {"query": "hi"})
+        assert (status, payload["tool"], payload["message"]) == (200, None, "hello")
+
+        status, payload = await _request(port, "POST", "/query", {"query": "http://site/"})
+        assert status == 202 and payload["job"]["status"] == "queued"
+        # The same crawl is not queued twice, another one does not fit the queue
+        status, job = await _request(port, "POST", "/jobs", {"tool": "crawl_web_page",
+                                                             "args": {"url": "http://site/"}})
+        assert status == 202 and job["id"] == payload["job"]["id"]
+        status, _ = await _request(port, "POST", "/jobs", {"tool": "crawl_web_page",
+                                                           "args": {"url": "http://other/"}})
+        assert status == 429
+
+        assert (await _request(port, "POST", "/query", {"session": "s1"}))[0] == 400
+        assert (await _request(port, "GET", "/jobs/unknown"))[0] == 404
+        assert (await _request(port, "GET", "/nowhere"))[0] == 404
+        status, health = await _request(port, "GET", "/health")
+        assert status == 200 and health["jobs"] == {"queued": 1}
+        assert health["index_generation"] == [1, 2]
+
+    _serve(test)
+
+
+def test_malformed_requests_are_refused(monkeypatch):
+    monkeypatch.setattr(agent_server, "SERVER_READ_TIMEOUT", 0.2)
+
+    async def test(server, port):
+        assert (await _send(port, b"GARBAGE\r\n\r\n"))[0] == 400
+        assert (await _send(port, b"POST /query HTTP/1.1\r\nContent-Length: ten\r\n\r\n"))[0] == 400
+        assert (await _send(port, b"POST /query HTTP/1.1\r\nContent-Length: -1\r\n\r\n"))[0] == 400
+        too_large = f"POST /query HTTP/1.1\r\nContent-Length: {agent_server.SERVER_MAX_BODY + 1}\r\n\r\n"
+        assert (await _send(port, too_large.encode()))[0] == 413
+        not_an_object = b"POST /query HTTP/1.1\r\nContent-Length: 5\r\nConnection: close\r\n\r\n[1,2]"
+        assert (await _send(port, not_an_object))[0] == 400
+        # The rest of the body never arrives
+        assert (await _send(port, b"POST /query HTTP/1.1\r\nContent-Length: 10\r\n\r\n{"))[0] == 408
+
+    _serve(test)
+
+
+def test_admission_limiter_refuses_beyond_the_queue():
+    async def main():
+        limiter = AdmissionLimiter("query", max_concurrent=1, max_queued=1, timeout=0.1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        async def admitted():
+            try:
+                async with limiter.slot():
+                    return 200
+            except HttpError as e:
+                return e.status
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        # One query waits for the slot and times out, the next finds the queue full
+        waiter = asyncio.create_task(admitted())
+        await asyncio.sleep(0)
+        refused = await admitted()
+        timed_out = await waiter
+        release.set()
+        await holder
+        return refused, timed_out, await admitted(), limiter.active, limiter.waiting
+
+    assert asyncio.run(main()) == (503, 503, 200, 0, 0)
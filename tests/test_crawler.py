@@ -0,0 +1,100 @@
+import asyncio
+
+from common.crawler import Crawler, HostLimiter, normalize_url
+
+
+def _crawl(pages: dict, start: str = "http://site/", **kwargs) -> tuple:
+    visited = []
+
+    async def fetch_links(url: str) -> list:
+        visited.append(url)
+        return pages.get(url, [])
+
+    crawler = Crawler(fetch_links, per_host_delay=0, **kwargs)
+    links = asyncio.run(asyncio.wait_for(crawler.run(start), 5))
+    return sorted(links), visited
+
+
+def test_normalize_url():
+    assert normalize_url("http://site/a/b", "../c#part") == "http://site/c"
+    assert normalize_url("http://site/", "mailto:me@site") is None
+    assert normalize_url("http://site/", "javascript:void(0)") is None
+
+
+def test_crawl_stays_on_the_start_host_and_matches_the_pattern():
+    pages = {"http://site/": ["/episode/1", "/about", "http://other/episode/2"]}
+    links, _ = _crawl(pages, url_pattern="/episode/")
+    assert links == ["http://site/episode/1"]
+
+    links, _ = _crawl(pages, same_domain=False)
+    assert links == ["http://other/episode/2", "http://site/about", "http://site/episode/1"]
+
+
+def test_crawl_respects_max_depth():
+    pages = {"http://site/": ["/1"], "http://site/1": ["/2"], "http://site/2": ["/3"]}
+    links, visited = _crawl(pages, max_depth=1)
+    # Links of pages up to max_depth are reported, pages beyond it are not visited
+    assert links == ["http://site/1", "http://site/2"]
+    assert sorted(visited) == ["http://site/", "http://site/1"]
+
+
+def test_crawl_visits_every_page_once():
+    pages = {"http://site/": ["/a", "/b", "/a#top"],
+             "http://site/a": ["/b", "/"],
+             "http://site/b": ["/a"]}
+    links, visited = _crawl(pages, max_depth=3, workers=2)
+    assert links == ["http://site/", "http://site/a", "http://site/b"]
+    assert sorted(visited) == ["http://site/", "http://site/a", "http://site/b"]
+
+
+def test_crawl_stops_at_the_page_budget():
+    pages = {"http://site/": [f"/{i}" for i in range(10)]}
+    links, visited = _crawl(pages, max_pages=3)
+    assert len(visited) == 3
+    assert len(links) == 10
+
+
+def test_malformed_links_are_skipped():
+    # urlparse raises ValueError on an unterminated IPv6 host
+    pages = {"http://site/": ["http://[bad/x", "/1"],
+             "http://site/1": ["/2", "http://[bad/y"],
+             "http://site/2": ["/3"]}
+    links, visited = _crawl(pages, max_depth=3, workers=2)
+    assert links == ["http://site/1", "http://site/2", "http://site/3"]
+    assert len(visited) == 4
+
+
+def test_error_on_a_page_does_not_stop_the_crawl():
+    async def fetch_links(url: str) -> list:
+        return ["/1", "/2"] if url == "http://site/" else ["/3"]
+
+    crawler = Crawler(fetch_links, per_host_delay=0, workers=1)
+    in_scope = crawler.in_scope
+
+    def failing_in_scope(url: str) -> bool:
+        if url == "http://site/3":
+            raise RuntimeError("boom")
+        return in_scope(url)
+
+    crawler.in_scope = failing_in_scope
+    links = asyncio.run(asyncio.wait_for(crawler.run("http://site/"), 5))
+    assert sorted(links) == ["http://site/1", "http://site/2"]
+    assert crawler.pages_visited == 3
+
+
+def test_cancelled_acquire_releases_the_host_slot():
+    async def main():
+        limiter = HostLimiter(1, 1.0)
+        await limiter.acquire("site")
+        limiter.release("site")
+        # The second acquire sleeps out the politeness delay and is cancelled meanwhile
+        task = asyncio.create_task(limiter.acquire("site"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return limiter._semaphores["site"].locked()
+
+    assert not asyncio.run(main())
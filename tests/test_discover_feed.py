@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+
+import tools.discover_feed_tool as discover_feed_tool
+from tools.visit_web_page_tool import needs_browser
+
+FEED_PAGE = '<html><body><a href="/podcast/feed">RSS</a></body></html>'
+
+
+@pytest.fixture
+def site(monkeypatch):
+    """Serve a feed at /podcast/feed and a page linking to it, recording what is fetched."""
+    fetched = {"pages": [], "feeds": []}
+
+    def fetch_page(url: str) -> str:
+        fetched["pages"].append(url)
+        return FEED_PAGE
+
+    def read_feed(url: str, etag=None, modified=None) -> dict:
+        fetched["feeds"].append(url)
+        if not url.endswith("/podcast/feed"):
+            raise ValueError("Failed to parse feed")
+        return {"entries": [{"link": "https://site/episode/1"}, {"link": "https://site/episode/2"}],
+                "etag": '"v1"', "modified": None, "not_modified": False}
+
+    monkeypatch.setattr(discover_feed_tool, "fetch_page", fetch_page)
+    monkeypatch.setattr(discover_feed_tool, "atom_feed_read_func", read_feed)
+    return fetched
+
+
+def test_feed_url_is_read_without_fetching_the_page(site, tmp_path):
+    links = discover_feed_tool.discover_feed("https://site/podcast/feed", str(tmp_path))
+    assert links == ["https://site/episode/1", "https://site/episode/2"]
+    assert site["pages"] == []
+    assert site["feeds"] == ["https://site/podcast/feed"]
+
+
+def test_feed_is_found_on_the_site_page(site, tmp_path):
+    links = discover_feed_tool.discover_feed("https://site/podcast", str(tmp_path))
+    assert links == ["https://site/episode/1", "https://site/episode/2"]
+    assert site["pages"] == ["https://site/podcast"]
+
+    # The feed is remembered, the next call reads it directly
+    site["pages"].clear()
+    discover_feed_tool.discover_feed("https://site/podcast", str(tmp_path))
+    assert site["pages"] == []
+
+
+def _response(content_type: str, text: str, status_code: int = 200):
+    return SimpleNamespace(status_code=status_code, headers={"content-type": content_type}, text=text)
+
+
+def test_needs_browser_accepts_feeds():
+    feed = '<?xml version="1.0"?><rss><channel><title>Podcast</title></channel></rss>'
+    assert needs_browser(_response("application/rss+xml", feed)) is None
+    assert needs_browser(_response("application/atom+xml; charset=utf-8", feed)) is None
+    assert needs_browser(_response("application/pdf", "")) == "content type application/pdf"
+    assert needs_browser(_response("text/html", "<html><body>hi</body></html>")) == "too little static text"
+    assert needs_browser(_response("text/html", "", 503)) == "status 503"
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+
+import pytest
+
+from common.index_generation import (CURRENT_FILE_NAME, collect_generations, current_generation,
+                                     generation_path, new_generation, publish_generation)
+
+
+def _publish_new(root: str) -> str:
+    with new_generation(root) as path:
+        with open(os.path.join(path, "data"), "w") as f:
+            f.write(os.path.basename(path))
+        publish_generation(path)
+    return path
+
+
+def _generations(root: str) -> list:
+    return sorted(name for name in os.listdir(root) if name.startswith("gen-"))
+
+
+def test_generations_are_numbered_and_published(tmp_path):
+    root = str(tmp_path / "index")
+    assert generation_path(root) is None
+    assert current_generation(root) is None
+
+    first = _publish_new(root)
+    assert os.path.basename(first) == "gen-1"
+    assert generation_path(root) == first
+    signature = current_generation(root)
+
+    second = _publish_new(root)
+    assert os.path.basename(second) == "gen-2"
+    assert generation_path(root) == second
+    assert current_generation(root) != signature
+    with open(os.path.join(root, CURRENT_FILE_NAME)) as f:
+        assert f.read() == "gen-2"
+
+
+def test_unpublished_generation_is_discarded(tmp_path):
+    root = str(tmp_path / "index")
+    published = _publish_new(root)
+
+    with new_generation(root) as path:
+        assert os.path.isdir(path)
+    assert not os.path.exists(path)
+
+    with pytest.raises(RuntimeError):
+        with new_generation(root) as path:
+            raise RuntimeError("build failed")
+    assert not os.path.exists(path)
+    assert generation_path(root) == published
+
+
+def test_interrupted_build_is_removed_by_next_build(tmp_path):
+    root = str(tmp_path / "index")
+    _publish_new(root)
+    # A build killed before publishing leaves its directory behind
+    os.makedirs(os.path.join(root, "gen-5"))
+
+    path = _publish_new(root)
+    assert os.path.basename(path) == "gen-2"
+    assert _generations(root) == ["gen-1", "gen-2"]
+
+
+def test_concurrent_builds_run_one_after_the_other(tmp_path):
+    root = str(tmp_path / "index")
+    _publish_new(root)
+    events = []
+
+    def build(name: str, delay: float) -> None:
+        with new_generation(root) as path:
+            events.append((name, "start", os.path.basename(path)))
+            time.sleep(delay)
+            assert os.path.isdir(path)
+            events.append((name, "publish", os.path.basename(path)))
+            publish_generation(path)
+
+    first = threading.Thread(target=build, args=("a", 0.3))
+    first.start()
+    time.sleep(0.1)
+    second = threading.Thread(target=build, args=("b", 0))
+    second.start()
+    first.join()
+    second.join()
+
+    assert events == [("a", "start", "gen-2"), ("a", "publish", "gen-2"),
+                      ("b", "start", "gen-3"), ("b", "publish", "gen-3")]
+    assert os.path.basename(generation_path(root)) == "gen-3"
+
+
+def test_collect_generations_keeps_current_and_previous(tmp_path):
+    root = str(tmp_path / "index")
+    for _ in range(4):
+        _publish_new(root)
+    # Publishing already collected all but the previous generation
+    assert _generations(root) == ["gen-3", "gen-4"]
+
+    os.makedirs(os.path.join(root, "gen-1"))
+    os.makedirs(os.path.join(root, "gen-9"))
+    assert collect_generations(root, keep=0) == ["gen-3", "gen-1"]
+    assert _generations(root) == ["gen-4", "gen-9"]
+
+
+def test_collect_generations_without_current(tmp_path):
+    root = tmp_path / "index"
+    os.makedirs(root / "gen-1")
+    assert collect_generations(str(root)) == []
+    assert _generations(str(root)) == ["gen-1"]
+
+
+def test_unversioned_index_is_adopted_as_generation_zero(tmp_path):
+    root = str(tmp_path / "index")
+    os.makedirs(root)
+    with open(os.path.join(root, "chroma.sqlite3"), "w") as f:
+        f.write("legacy")
+    assert generation_path(root) == root
+
+    with new_generation(root) as path:
+        assert os.path.basename(path) == "gen-1"
+        # The old files are published as gen-0 before the build starts
+        assert os.path.basename(generation_path(root)) == "gen-0"
+        with open(os.path.join(generation_path(root), "chroma.sqlite3")) as f:
+            assert f.read() == "legacy"
+        publish_generation(path)
+
+    assert generation_path(root) == path
+    assert sorted(os.listdir(root)) == [".build.lock", CURRENT_FILE_NAME, "gen-0", "gen-1"]
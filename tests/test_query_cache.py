@@ -0,0 +1,64 @@
+import time
+
+from common.query_cache import QueryResultCache, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("  Data\tManagement \n") == "data management"
+
+
+def test_exact_hits_ignore_case_and_whitespace():
+    cache = QueryResultCache(max_entries=10, ttl=60, similarity=0)
+    assert cache.get("data management") is None
+    cache.put("Data  Management", None, ["result"])
+    assert cache.get("data management") == ["result"]
+    assert cache.stats() == {"exact_hits": 1, "semantic_hits": 0, "misses": 1, "hit_rate": 0.5, "entries": 1}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryResultCache(max_entries=2, ttl=60, similarity=0)
+    cache.put("a", None, [1])
+    cache.put("b", None, [2])
+    assert cache.get("a") == [1]
+    cache.put("c", None, [3])
+    assert cache.get("b") is None
+    assert cache.get("a") == [1]
+    assert cache.get("c") == [3]
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = QueryResultCache(max_entries=10, ttl=5, similarity=0)
+    cache.put("a", None, [1])
+    now[0] += 4
+    assert cache.get("a") == [1]
+    now[0] += 2
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_semantic_tier_answers_near_duplicates():
+    cache = QueryResultCache(max_entries=10, ttl=60, similarity=0.95)
+    cache.put("kubernetes scaling", [1.0, 0.0, 0.0], ["k8s"])
+    cache.put("data lakes", [0.0, 1.0, 0.0], ["lakes"])
+    assert cache.get("scaling kubernetes") is None
+    assert cache.get_similar([0.99, 0.05, 0.0]) == ["k8s"]
+    assert cache.get_similar([0.7, 0.7, 0.0]) is None
+    stats = cache.stats()
+    assert (stats["semantic_hits"], stats["misses"]) == (1, 1)
+
+
+def test_semantic_tier_is_off_by_default_threshold():
+    cache = QueryResultCache(max_entries=10, ttl=60, similarity=0)
+    cache.put("kubernetes scaling", [1.0, 0.0], ["k8s"])
+    assert cache.get_similar([1.0, 0.0]) is None
+
+
+def test_clear_drops_every_tier():
+    cache = QueryResultCache(max_entries=10, ttl=60, similarity=0.9)
+    cache.put("a", [1.0, 0.0], [1])
+    cache.clear()
+    assert cache.get("a") is None
+    assert cache.get_similar([1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
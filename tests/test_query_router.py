@@ -0,0 +1,45 @@
+import pytest
+
+from common.query_router import (CRAWL_TOOL_NAME, FEED_TOOL_NAME, QUERY_TOOL_NAME, RouterStats,
+                                 make_tool_call, route_query)
+
+
+def test_urls_go_to_the_crawler():
+    assert route_query("crawl https://example.com/podcast.", "auto", "crawl") == \
+        {"name": CRAWL_TOOL_NAME, "args": {"url": "https://example.com/podcast"}}
+    assert route_query("www.example.com", "auto", "crawl") == \
+        {"name": CRAWL_TOOL_NAME, "args": {"url": "https://www.example.com"}}
+
+
+def test_feed_intent_or_mode_goes_to_the_feed_tool():
+    assert route_query("new episodes of https://example.com", "auto", "crawl")["name"] == FEED_TOOL_NAME
+    assert route_query("https://example.com", "auto", "feed")["name"] == FEED_TOOL_NAME
+
+
+def test_search_queries_go_to_the_query_tool():
+    assert route_query("  kubernetes scaling ", "auto") == \
+        {"name": QUERY_TOOL_NAME, "args": {"query": "kubernetes scaling"}}
+
+
+def test_ambiguous_inputs_are_left_to_the_llm():
+    assert route_query("please crawl the site", "auto") is None
+    assert route_query("", "auto") is None
+    assert route_query("kubernetes scaling", "llm") is None
+    # Without the LLM everything that is not a URL is searched
+    assert route_query("please crawl the site", "local")["name"] == QUERY_TOOL_NAME
+    with pytest.raises(ValueError):
+        route_query("kubernetes", "fast")
+
+
+def test_tool_calls_and_stats():
+    call = make_tool_call({"name": QUERY_TOOL_NAME, "args": {"query": "x"}})
+    assert call["type"] == "tool_call" and call["id"].startswith("fast-path-")
+    assert call["id"] != make_tool_call({"name": QUERY_TOOL_NAME, "args": {"query": "x"}})["id"]
+
+    stats = RouterStats()
+    stats.record("fast_path", QUERY_TOOL_NAME, 0.001)
+    stats.record("fast_path", CRAWL_TOOL_NAME, 0.001)
+    stats.record("llm", None, 1.0)
+    summary = stats.summary()
+    assert summary["llm:none"] == {"count": 1, "seconds": 1.0}
+    assert summary["fast_path_rate"] == pytest.approx(2 / 3)
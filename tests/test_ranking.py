@@ -0,0 +1,58 @@
+import pytest
+
+from common.ranking import blend_scores, fuse_results, reciprocal_rank_fusion
+
+
+def _results(*links, scores=None, snippet=""):
+    scores = scores or [float(len(links) - i) for i in range(len(links))]
+    return [{"link": link, "score": score, "snippet": f"{snippet}{link}"} for link, score in zip(links, scores)]
+
+
+def test_rrf_rewards_links_ranked_by_both_lists():
+    dense = _results("a", "b", "c")
+    sparse = _results("b", "c", "d")
+    fused = reciprocal_rank_fusion([dense, sparse], [1.0, 1.0], top_k=4, k=60)
+    assert [result["link"] for result in fused] == ["b", "c", "a", "d"]
+    assert fused[0]["score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[2]["score"] == pytest.approx(1 / 61)
+
+
+def test_rrf_counts_the_first_result_of_a_link_only():
+    # Several chunks of one episode do not add up
+    dense = _results("a", "a", "b", snippet="dense ")
+    fused = reciprocal_rank_fusion([dense], [1.0], top_k=5, k=60)
+    assert [(result["link"], result["score"]) for result in fused] == [("a", pytest.approx(1 / 61)),
+                                                                         ("b", pytest.approx(1 / 62))]
+
+
+def test_rrf_weights_and_top_k():
+    dense = _results("a")
+    sparse = _results("b")
+    fused = reciprocal_rank_fusion([dense, sparse], [1.0, 2.0], top_k=1)
+    assert [result["link"] for result in fused] == ["b"]
+
+
+def test_blend_normalizes_scores_per_list():
+    # Distances and BM25 scores live on different scales
+    dense = _results("a", "b", "c", scores=[-0.1, -0.2, -0.9])
+    sparse = _results("c", "a", scores=[30.0, 10.0])
+    fused = blend_scores([dense, sparse], [1.0, 1.0], top_k=3)
+    assert [result["link"] for result in fused] == ["a", "c", "b"]
+    assert fused[0]["score"] == pytest.approx(1.0)
+    assert fused[1]["score"] == pytest.approx(1.0)
+    assert fused[2]["score"] == pytest.approx(0.875)
+
+
+def test_blend_with_equal_scores_and_empty_lists():
+    fused = blend_scores([_results("a", "b", scores=[2.0, 2.0]), []], [1.0, 1.0], top_k=5)
+    assert [(result["link"], result["score"]) for result in fused] == [("a", 1.0), ("b", 1.0)]
+
+
+def test_fuse_results_prefers_dense_snippets():
+    dense = _results("a", snippet="chunk of ")
+    sparse = _results("a", snippet="start of ")
+    for method in ("rrf", "blend"):
+        fused = fuse_results(sparse, dense, 5, method=method)
+        assert fused[0]["snippet"] == "chunk of a"
+    with pytest.raises(ValueError):
+        fuse_results(sparse, dense, 5, method="max")
@@ -0,0 +1,63 @@
+import hashlib
+import json
+
+from common.transcript_index import TranscriptIndex
+
+
+def test_failed_links_are_retried_until_max_retries(tmp_path):
+    index = TranscriptIndex(str(tmp_path), max_retries=2)
+    assert not index.should_skip("http://site/1")
+    index.mark_failed("http://site/1", "timeout")
+    assert not index.should_skip("http://site/1")
+    index.mark_failed("http://site/1", "timeout")
+    assert index.should_skip("http://site/1")
+
+    # A later success clears the failures
+    index.add_transcript("ep1.txt", "http://site/1", None, "h1")
+    assert index.should_skip("http://site/1")
+    assert index.has_hash("h1")
+    assert index.entries()["ep1.txt"] == {"title": "ep1.txt", "link": "http://site/1",
+                                          "transcript_link": None, "hash": "h1"}
+    index.close()
+
+
+def test_duplicates_are_skipped_and_the_index_persists(tmp_path):
+    index = TranscriptIndex(str(tmp_path))
+    index.add_transcript("ep1.txt", "http://site/1", "http://site/1/t", "h1")
+    index.mark_duplicate("http://site/2")
+    index.close()
+
+    index = TranscriptIndex(str(tmp_path))
+    assert len(index) == 1
+    assert index.should_skip("http://site/1")
+    assert index.should_skip("http://site/2")
+    assert not index.should_skip("http://site/3")
+    index.close()
+
+
+def test_legacy_json_index_is_imported(tmp_path):
+    (tmp_path / "ep1.txt").write_text("first transcript")
+    legacy = {"ep1.txt": {"link": "http://site/1", "transcript_link": "http://site/1/t"},
+              "gone.txt": {"link": "http://site/2"}}
+    (tmp_path / "blog_index.json").write_text(json.dumps(legacy))
+
+    index = TranscriptIndex(str(tmp_path))
+    # Entries whose file is missing are not imported
+    assert list(index.entries()) == ["ep1.txt"]
+    assert index.has_hash(hashlib.sha256(b"first transcript").hexdigest())
+    index.close()
+
+
+def test_pending_feed_links(tmp_path):
+    index = TranscriptIndex(str(tmp_path), max_retries=1)
+    assert index.get_feed("http://site") is None
+    index.set_feed("http://site", "http://site/feed", '"v1"', None)
+    assert index.get_feed("http://site") == {"feed_url": "http://site/feed", "etag": '"v1"', "modified": None}
+
+    index.add_feed_entries("http://site/feed", ["http://site/1", "http://site/2", "http://site/3", "http://site/4"])
+    index.add_transcript("ep1.txt", "http://site/1", None, "h1")
+    index.mark_duplicate("http://site/2")
+    index.mark_failed("http://site/3", "timeout")
+    assert index.pending_feed_links("http://site/feed") == ["http://site/4"]
+    assert index.pending_feed_links("http://other/feed") == []
+    index.close()
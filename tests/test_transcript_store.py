@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from common.transcript_store import TranscriptStore
+
+
+@pytest.fixture(params=["zlib", "zstd"])
+def store(request, tmp_path):
+    if request.param == "zstd":
+        pytest.importorskip("zstandard")
+    store = TranscriptStore(str(tmp_path), codec=request.param, segment_size=64)
+    yield store
+    store.close()
+
+
+def test_put_and_get(store):
+    store.put("h1", "first transcript")
+    store.put("h1", "stored once")
+    assert store.get("h1") == "first transcript"
+    assert store.has("h1")
+    assert store.missing(["h1", "h2"]) == {"h2"}
+    with pytest.raises(KeyError):
+        store.get("h2")
+    assert store.stats()["transcripts"] == 1
+
+
+def test_segments_roll_over(store):
+    texts = {f"h{i}": f"transcript {i} " + os.urandom(64).hex() for i in range(5)}
+    for hash_val, text in texts.items():
+        store.put(hash_val, text)
+    segments = [name for name in os.listdir(store.path) if name.endswith(".seg")]
+    assert len(segments) > 1
+    # Missing hashes are skipped, each stored text is read back once
+    assert dict(store.iter_texts(list(texts) + ["missing", "h0"])) == texts
+
+
+def test_store_reopens_on_the_last_segment(tmp_path):
+    store = TranscriptStore(str(tmp_path), codec="zlib", segment_size=1)
+    store.put("h1", "one")
+    store.put("h2", "two")
+    store.close()
+
+    store = TranscriptStore(str(tmp_path), codec="zlib", segment_size=1)
+    store.put("h3", "three")
+    assert dict(store.iter_texts(["h1", "h2", "h3"])) == {"h1": "one", "h2": "two", "h3": "three"}
+    assert len([name for name in os.listdir(store.path) if name.endswith(".seg")]) == 3
+    store.close()
+
+
+def test_import_files(tmp_path):
+    (tmp_path / "ep1.txt").write_text("first transcript")
+    entries = {"ep1.txt": {"title": "ep1.txt", "link": "http://site/1", "hash": "h1"},
+               "gone.txt": {"title": "gone.txt", "link": "http://site/2", "hash": "h2"}}
+    store = TranscriptStore(str(tmp_path), codec="zlib")
+    assert store.import_files(entries, str(tmp_path)) == 1
+    assert not (tmp_path / "ep1.txt").exists()
+    assert store.get("h1") == "first transcript"
+    assert store.import_files(entries, str(tmp_path)) == 0
+    store.close()
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        TranscriptStore("unused", codec="lz4")
@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import tools.visit_web_page_tool as visit_web_page_tool
+from tools.visit_web_page_tool import FetchReport, afetch_page, fetch_page, html_to_text
+
+STATIC_PAGE = "<html><body><p>" + "static words " * 30 + "</p></body></html>"
+SCRIPT_PAGE = '<html><body><div id="root"></div><script>render()</script></body></html>'
+
+
+class _Responses:
+    def __init__(self, pages: dict):
+        self.pages = pages
+
+    def get(self, url: str):
+        if url not in self.pages:
+            raise ConnectionError("refused")
+        return SimpleNamespace(status_code=200, headers={"content-type": "text/html"}, text=self.pages[url])
+
+
+class _AsyncResponses(_Responses):
+    async def get(self, url: str):
+        return _Responses.get(self, url)
+
+
+class _Browser:
+    def __init__(self):
+        self.visits = []
+
+    def run(self, func):
+        self.visits.append(func)
+        return "rendered"
+
+    async def arun(self, func):
+        self.visits.append(func)
+        return "rendered"
+
+
+@pytest.fixture
+def site(monkeypatch):
+    pages = {"http://site/static": STATIC_PAGE, "http://site/app": SCRIPT_PAGE}
+    browser = _Browser()
+    report = FetchReport()
+    monkeypatch.setattr(visit_web_page_tool, "get_http_client", lambda: _Responses(pages))
+    monkeypatch.setattr(visit_web_page_tool, "get_async_http_client", lambda: _AsyncResponses(pages))
+    monkeypatch.setattr(visit_web_page_tool, "get_browser_pool", lambda: browser)
+    monkeypatch.setattr(visit_web_page_tool, "fetch_report", report)
+    return SimpleNamespace(browser=browser, report=report)
+
+
+def _fetchers():
+    return [fetch_page, lambda *args, **kwargs: asyncio.run(afetch_page(*args, **kwargs))]
+
+
+@pytest.mark.parametrize("fetch", _fetchers(), ids=["sync", "async"])
+def test_fetch_paths(site, fetch):
+    assert fetch("http://site/static") == STATIC_PAGE
+    assert fetch("http://site/static", clean_flag=True) == html_to_text(STATIC_PAGE)
+    # Client rendered, missing expected text and failed requests are rendered in the browser
+    assert fetch("http://site/app") == "rendered"
+    assert fetch("http://site/static", expect="SHOW TRANSCRIPT:") == "rendered"
+    assert fetch("http://site/down") == "rendered"
+    assert fetch("http://site/static", fetch_mode="browser") == "rendered"
+    # Forcing HTTP returns nothing rather than rendering
+    assert fetch("http://site/app", fetch_mode="http") == ""
+
+    assert len(site.browser.visits) == 4
+    summary = site.report.summary()
+    assert summary["http"]["pages"] == 3
+    assert summary["browser"]["pages"] == 4
+
+
+def test_fetch_report_keeps_totals_per_path():
+    report = FetchReport()
+    report.record("http://site/a", "http", 0.5)
+    report.record("http://site/a", "http", 0.25)
+    report.record("http://site/b", "browser", 1.0, "(client rendered)")
+    assert report.summary() == {"http": {"pages": 2, "seconds": 0.75},
+                                "browser": {"pages": 1, "seconds": 1.0}}
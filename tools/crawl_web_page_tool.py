@@ -1,14 +1,17 @@
-from playwright.async_api import async_playwright
-from urllib.parse import urlparse, urljoin
 from typing import Optional, List, Type
 from pydantic import BaseModel, Field
 from langchain.tools import BaseTool
 import asyncio
+from common.browser_pool import get_browser_pool
+from common.crawler import Crawler, CRAWL_MAX_PAGES, CRAWL_WORKERS
 from common.logging_config import logger
 
 class CrawlWebPageSyncToolInput(BaseModel):
     url: str = Field(description="Web page URL to crawl")
     max_depth: Optional[int] = Field(default=2, description="Maximum depth to crawl.")
+    same_domain: Optional[bool] = Field(default=True, description="Only record and follow links on the same domain as the URL.")
+    url_pattern: Optional[str] = Field(default=None, description="Regular expression that links must match to be crawled.")
+    max_pages: Optional[int] = Field(default=CRAWL_MAX_PAGES, description="Maximum number of pages to visit.")
 
 
 class CrawlWebPageSyncTool(BaseTool):
@@ -16,54 +19,51 @@ class CrawlWebPageSyncTool(BaseTool):
     description: str = "Crawl a web page and return all links found up to a specified depth."
     args_schema: Type[BaseModel] = CrawlWebPageSyncToolInput
 
-    def _run(self, url: str, max_depth: int = 10) -> List[str]:
+    def _run(self, url: str, max_depth: int = 10, same_domain: bool = True,
+             url_pattern: Optional[str] = None, max_pages: int = CRAWL_MAX_PAGES) -> List[str]:
         """Crawl a web page and return all links found up to a specified depth."""
         raise NotImplementedError("This tool is designed to be used asynchronously. Use the async version instead.")
     
-    async def _arun(self, url: str, max_depth: int = 2) -> List[str]:
+    async def _arun(self, url: str, max_depth: int = 2, same_domain: bool = True,
+                    url_pattern: Optional[str] = None, max_pages: int = CRAWL_MAX_PAGES) -> List[str]:
         """Asynchronous version of the crawl_web_page method."""
-        return await crawl_web_page(url, max_depth)
+        return await crawl_web_page(url, max_depth, same_domain=same_domain,
+                                    url_pattern=url_pattern, max_pages=max_pages)
     
 
-async def crawl_web_page(url: str, max_depth: int = 1) -> list:
-    """Crawl a web page and return all links found up to a specified depth.
+async def _fetch_page_links(url: str) -> list:
+    """Visit a page with the shared browser and return the hrefs of its anchors."""
+    async def visit(page) -> list:
+        await page.goto(url, timeout=30000)
+        await page.wait_for_load_state("networkidle", timeout=10000)
+        anchors = await page.query_selector_all('a[href]')
+        return [await anchor.get_attribute('href') for anchor in anchors]
+
+    return await get_browser_pool().arun(visit)
+
+
+async def crawl_web_page(url: str, max_depth: int = 1,
+                         same_domain: bool = True,
+                         url_pattern: Optional[str] = None,
+                         max_pages: int = CRAWL_MAX_PAGES,
+                         workers: int = CRAWL_WORKERS) -> list:
+    """Crawl a web page breadth-first and return all links found up to a specified depth.
     Args:
         url (str): The URL of the web page to crawl.
-        max_depth (int): The maximum depth to crawl. Default is 2.
+        max_depth (int): The maximum depth to crawl. Default is 1.
+        same_domain (bool): Only record and follow links on the same host as `url`.
+        url_pattern (Optional[str]): Regular expression that links must match to be crawled.
+        max_pages (int): Maximum number of pages to visit.
+        workers (int): Number of pages visited concurrently.
     Returns:
         list: A list of unique links found on the web page."""
-    visited = set()
-    links = []
-
-    async def crawl(url: str, depth: int):
-        if depth > max_depth or url in visited:
-            return
-        visited.add(url)
-
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page()
-            try:
-                await page.goto(url, timeout=30000)
-                await page.wait_for_load_state("networkidle", timeout=10000)
-
-                page_links = await page.query_selector_all('a[href]')
-                logger.info(f"Visiting {url} at depth {depth}, found {len(page_links)} links.")
-                for link in page_links:
-                    href = await link.get_attribute('href')
-                    if href:
-                        full_url = urljoin(url, href)
-                        parsed_url = urlparse(full_url)
-                        if parsed_url.scheme in ['http', 'https']:
-                            links.append(full_url)
-                            await crawl(full_url, depth + 1)
-            except Exception as e:
-                logger.error(f"Error visiting {url}: {e}")
-            finally:
-                await browser.close()
-
-    await crawl(url, 0)
-    return list(set(links))  # Return unique links
+    crawler = Crawler(_fetch_page_links,
+                      max_depth=max_depth,
+                      workers=workers,
+                      max_pages=max_pages,
+                      same_domain=same_domain,
+                      url_pattern=url_pattern)
+    return await crawler.run(url)
 
 async def main():
     url = "https://www.thecloudcast.net"
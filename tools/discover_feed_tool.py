@@ -0,0 +1,118 @@
+from typing import Iterator, List, Optional, Type
+from urllib.parse import urljoin, urlsplit
+from pydantic import BaseModel, Field
+from langchain.tools import BaseTool
+import asyncio
+import os
+from dotenv import load_dotenv
+from functions.atom_feed_find_func import atom_feed_find_func
+from functions.atom_feed_read_func import atom_feed_read_func
+from tools.visit_web_page_tool import fetch_page
+from common.transcript_index import TranscriptIndex
+from common.logging_config import logger
+
+load_dotenv()
+
+DOC_LOCATION = os.environ.get("DOC_LOCATION", "transcripts")
+DOWNLOAD_MAX_RETRIES = int(os.environ.get("DOWNLOAD_MAX_RETRIES", "3"))
+
+# URLs that are probably feeds themselves and are read before looking for feed links
+FEED_URL_HINTS = ("feed", "rss", "atom", ".xml")
+
+
+class DiscoverFeedToolInput(BaseModel):
+    url: str = Field(description="Web site URL, or the URL of its Atom/RSS feed")
+
+
+class DiscoverFeedTool(BaseTool):
+    name: str = "discover_feed"
+    description: str = ("Find new episodes of a web site from its Atom/RSS feed and return the links "
+                        "not downloaded yet. Much cheaper than crawling, use it to refresh a known site.")
+    args_schema: Type[BaseModel] = DiscoverFeedToolInput
+
+    def _run(self, url: str) -> List[str]:
+        """Return the unseen entry links of the feed of the site."""
+        return discover_feed(url)
+
+    async def _arun(self, url: str) -> List[str]:
+        """Asynchronous version of the discover_feed method."""
+        return await asyncio.to_thread(discover_feed, url)
+
+
+def _site_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path.rstrip('/')}"
+
+
+def _feed_candidates(url: str) -> Iterator[str]:
+    """
+    The URL itself when it looks like a feed, then the feed links found on the page. The page
+    is only fetched once the URL itself turned out not to be a readable feed.
+    """
+    candidates = []
+    if any(hint in url.lower() for hint in FEED_URL_HINTS):
+        candidates.append(url)
+        yield url
+    content = fetch_page(url)
+    for href in atom_feed_find_func(content):
+        candidate = urljoin(url, href)
+        if candidate not in candidates:
+            candidates.append(candidate)
+            yield candidate
+
+
+def _read_feed(index: TranscriptIndex, site: str, feed_url: str, etag: Optional[str] = None,
+               modified: Optional[str] = None) -> bool:
+    """Read the feed conditionally, record its entries and validators. Returns False if it has none."""
+    feed = atom_feed_read_func(feed_url, etag=etag, modified=modified)
+    if feed["not_modified"]:
+        logger.info(f"Feed {feed_url} not modified since the last check.")
+        return True
+    links = [entry.get("link") for entry in feed["entries"] if entry.get("link")]
+    if not links:
+        return False
+    index.add_feed_entries(feed_url, links)
+    index.set_feed(site, feed_url, feed["etag"], feed["modified"])
+    logger.info(f"Feed {feed_url} lists {len(links)} entries.")
+    return True
+
+
+def discover_feed(url: str, doc_location: str = DOC_LOCATION) -> list:
+    """Find the feed of a site and return the entry links that are not downloaded yet.
+    The feed URL and its ETag/Last-Modified validators are persisted in the transcript index,
+    so later calls cost a single conditional request that is usually answered with 304.
+    Args:
+        url (str): Web site URL, or the URL of its feed.
+        doc_location (str): Directory of the transcript index.
+    Returns:
+        list: Entry links still to download, empty if the site has no readable feed."""
+    site = _site_key(url)
+    index = TranscriptIndex(doc_location, max_retries=DOWNLOAD_MAX_RETRIES)
+    try:
+        state = index.get_feed(site)
+        feed_url = None
+        if state is not None:
+            try:
+                if _read_feed(index, site, state["feed_url"], state["etag"], state["modified"]):
+                    feed_url = state["feed_url"]
+            except Exception as e:
+                logger.warning(f"Reading feed {state['feed_url']} failed, discovering it again: {e}")
+
+        if feed_url is None:
+            for candidate in _feed_candidates(url):
+                try:
+                    if _read_feed(index, site, candidate):
+                        feed_url = candidate
+                        break
+                except Exception as e:
+                    logger.info(f"{candidate} is not a readable feed: {e}")
+
+        if feed_url is None:
+            logger.warning(f"No feed found for {url}, crawl the site instead.")
+            return []
+
+        links = index.pending_feed_links(feed_url)
+        logger.info(f"Feed {feed_url} has {len(links)} entries to download.")
+        return links
+    finally:
+        index.close()
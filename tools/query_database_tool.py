@@ -1,19 +1,38 @@
 
 from langchain.tools import BaseTool
-from pydantic import BaseModel
-from typing import Optional, Type
-import chromadb
-from langchain_huggingface import HuggingFaceEmbeddings
+from pydantic import BaseModel, PrivateAttr
+from typing import Any, Optional, Type
 from dotenv import load_dotenv
 import os
+import heapq
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from common.common import SearchResult
+from common.embeddings import get_embeddings
+from common.query_cache import QueryResultCache
+from common.ranking import fuse_results
 from common.logging_config import logger
-import bm25s
-import json
+from common.bm25_index import load_bm25_index, tokenize
+from common.index_generation import current_generation, generation_path
+from common.metrics import counter, span, traced
 
 load_dotenv()
-MAX_RESULTS = os.environ.get("MAX_RESULTS")
-EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
-DOC_LOCATION = os.environ.get("DOC_LOCATION", "transcripts")
+MAX_RESULTS = int(os.environ.get("MAX_RESULTS", "5"))
+DENSE_CHUNK_FANOUT = int(os.environ.get("DENSE_CHUNK_FANOUT", "4"))  # Chunks fetched per requested episode
+QUERY_WORKERS = int(os.environ.get("QUERY_WORKERS", "4"))  # Threads running encoding, BM25 and Chroma lookups
+
+# Keeps CPU bound query work off the event loop
+_query_executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="query")
+
+result_cache_lookups = counter("query_result_cache_lookups_total", "Query result cache lookups, by result")
+queries_answered = counter("queries_total", "Queries answered by the query tool")
+
+
+def _in_query_executor(loop, function, *args):
+    """Run `function` on the query thread pool in a copy of the current context, so spans nest."""
+    return loop.run_in_executor(_query_executor, contextvars.copy_context().run, function, *args)
 
 class QueryDatabaseToolInput(BaseModel):
     """
@@ -29,32 +48,127 @@ class QueryDatabaseTool(BaseTool):
 
     name: str = "query_database"
     description: str = "A tool to query a vector database. It find matching entries based on similarity search. " \
-    "Input should be a text."
+    "Input should be a text. Returns a ranked list of episodes with link, score and a matching snippet."
     args_schema: Type[BaseModel] = QueryDatabaseToolInput
 
-    max_results: int = int(MAX_RESULTS)  # Default maximum number of results to return
-    client: chromadb.PersistentClient = None # ChromaDB client instance
+    max_results: int = MAX_RESULTS  # Default maximum number of results to return
+    client: Optional[Any] = None # ChromaDB client instance
     collections: list = None  # List of collections in the database
+    collection: Optional[Any] = None  # Collection queried for semantic search
+    generation: Optional[tuple] = None  # Index generation the open collection and BM25 index belong to
     embedding_model: Optional[Type] = None  # Embeddings model, if needed
     db_path: Optional[str] = None  # Path to the database
-    bm25_model: Optional[Type] = None  # BM25 model for lexical search
+    bm25_model: Optional[Any] = None  # BM25 model for lexical search, loaded lazily
+    result_cache: Optional[Any] = None  # Results of recent queries for the current index generation
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)  # Guards the open indexes, only held for cheap updates
+    _load_lock: Any = PrivateAttr(default_factory=threading.Lock)  # Serializes first loads of the indexes from disk
+    _reloading: bool = PrivateAttr(default=False)  # A new generation is loading in the background
+    _failed_generation: Optional[tuple] = PrivateAttr(default=None)  # Generation that failed to load
+    _index_path: Optional[str] = PrivateAttr(default=None)  # Generation directory the open indexes are loaded from
 
-    def _run(self, query: str) -> str:
+    def _run(self, query: str) -> list[SearchResult]:
         """
         Run the tool with the given query.
         """
-        sparse_results, dense_results = self._query_vector_store(query)
-        if not sparse_results or not dense_results["documents"]:
-            return None
-        return self._return_search_results(sparse_results, dense_results)
+        return self.batch_query([query])[0]
 
-    async def _arun(self, query: str) -> str:
+    async def _arun(self, query: str) -> list[SearchResult]:
         """
         Asynchronously run the tool with the given query.
         """
-        return self._run(query)  # For simplicity, using the synchronous method in this example
-    
-    def __init__(self, db_path: Optional[str] = None, max_results: int = int(MAX_RESULTS)):
+        return (await self.abatch_query([query]))[0]
+
+    @traced("query_database")
+    def batch_query(self, queries: list[str]) -> list[list[SearchResult]]:
+        """
+        Run many queries together: the queries are embedded in one forward pass and retrieved
+        with a single BM25 and a single Chroma call. Queries answered by the result cache are
+        not encoded or retrieved.
+        """
+        generation = self._check_generation()
+        results, pending = self._cached_results(queries)
+        if pending:
+            embeddings = self.embedding_model.embed_queries([queries[i] for i in pending])
+            pending = self._similar_cached_results(queries, pending, embeddings, results)
+        if pending:
+            pending_queries = [queries[i] for i, _ in pending]
+            sparse_results = self._sparse_search(pending_queries)
+            dense_results = self._dense_search([embedding for _, embedding in pending])
+            self._store_results(queries, pending, sparse_results, dense_results, results, generation)
+        return results
+
+    @traced("query_database")
+    async def abatch_query(self, queries: list[str]) -> list[list[SearchResult]]:
+        """
+        Asynchronous version of batch_query. Encoding, BM25 retrieval and Chroma I/O run on
+        the query thread pool, with the lexical and semantic lookups running concurrently.
+        BM25 also overlaps encoding unless the semantic cache tier needs the embeddings first.
+        """
+        loop = asyncio.get_running_loop()
+        generation = self._check_generation()
+        results, pending = self._cached_results(queries)
+        if not pending:
+            return results
+
+        if self.result_cache.similarity <= 0:
+            # Without the semantic tier nothing waits for the query embeddings, so BM25 runs
+            # while the queries are encoded and searched in Chroma
+            pending_queries = [queries[i] for i in pending]
+
+            async def dense_search():
+                embeddings = await _in_query_executor(loop, self.embedding_model.embed_queries, pending_queries)
+                return embeddings, await _in_query_executor(loop, self._dense_search, embeddings)
+
+            sparse_results, (embeddings, dense_results) = await asyncio.gather(
+                _in_query_executor(loop, self._sparse_search, pending_queries), dense_search())
+            result_cache_lookups.inc(len(pending), result="miss")
+            self._store_results(queries, list(zip(pending, embeddings)), sparse_results, dense_results,
+                                results, generation)
+            return results
+
+        embeddings = await _in_query_executor(
+            loop, self.embedding_model.embed_queries, [queries[i] for i in pending])
+        pending = self._similar_cached_results(queries, pending, embeddings, results)
+        if pending:
+            pending_queries = [queries[i] for i, _ in pending]
+            sparse_results, dense_results = await asyncio.gather(
+                _in_query_executor(loop, self._sparse_search, pending_queries),
+                _in_query_executor(loop, self._dense_search, [embedding for _, embedding in pending]))
+            self._store_results(queries, pending, sparse_results, dense_results, results, generation)
+        return results
+
+    def _cached_results(self, queries: list[str]) -> tuple:
+        """Return the exact cache hits per query and the positions of the misses."""
+        results = [self.result_cache.get(query) for query in queries]
+        pending = [i for i, result in enumerate(results) if result is None]
+        queries_answered.inc(len(queries))
+        result_cache_lookups.inc(len(queries) - len(pending), result="hit")
+        return results, pending
+
+    def _similar_cached_results(self, queries: list[str], pending: list, embeddings: list, results: list) -> list:
+        """Fill in near-duplicate cache hits, returning (position, embedding) of the rest."""
+        remaining = []
+        for i, embedding in zip(pending, embeddings):
+            results[i] = self.result_cache.get_similar(embedding)
+            if results[i] is None:
+                remaining.append((i, embedding))
+        result_cache_lookups.inc(len(pending) - len(remaining), result="similar")
+        result_cache_lookups.inc(len(remaining), result="miss")
+        return remaining
+
+    def _store_results(self, queries: list[str], pending: list, sparse_results: list,
+                       dense_results: list, results: list, generation: Optional[tuple]) -> None:
+        for (i, embedding), sparse, dense in zip(pending, sparse_results, dense_results):
+            results[i] = self._return_search_results(sparse, dense)
+        # Results of a query that started before a generation swap are not cached, the swap
+        # cleared the cache for the new generation
+        with self._lock:
+            if self.generation == generation:
+                for i, embedding in pending:
+                    self.result_cache.put(queries[i], embedding, results[i])
+
+    def __init__(self, db_path: Optional[str] = None, max_results: int = MAX_RESULTS):
         """
         Initialize the QueryDatabaseTool with a database path and maximum results.
         Args:
@@ -69,91 +183,175 @@ class QueryDatabaseTool(BaseTool):
             self.db_path = db_path
 
         # Dense vector embeddings model for semantic search
-        self.embedding_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-
-        # Load documents from the blog index file
-        # Save blog index and text associated as JSON text dump in document
-        documents = []
-        blog_index_path = os.path.join(DOC_LOCATION, "blog_index.json")
-        if not os.path.exists(blog_index_path):
-            raise FileNotFoundError(f"Blog index file does not exist: {blog_index_path}")
-        
-        with open(blog_index_path, "r") as f:
-            blog_index = json.load(f)
-            for key, value in blog_index.items():
-                text = open(os.path.join(DOC_LOCATION, key), 'r').read()
-                value["text"] = text  # Add the text to the value
-                value_text = json.dumps(value)
-                documents.append(value_text)
-
-        # Sparse vector embeddings model with BM25 search for lexical search
-        self.bm25_model = bm25s.BM25(
-            corpus=documents
-        )
-        self.bm25_model.index(bm25s.tokenize(documents))
+        self.embedding_model = get_embeddings()
+
+        # Repeated and near-duplicate queries are answered from the cache
+        self.result_cache = QueryResultCache()
     
-    def _query_vector_store(self, query: str) -> list:
-        """Function to query the vector store."""
-
-        # Query the BM25 model for lexical search
-        sparse_results = {}
-        results, scores = self.bm25_model.retrieve(bm25s.tokenize(query), k=self.max_results)
-        for i in range(len(results[0])):
-            try:
-                result_json = json.loads(results[0, i])
-                link = result_json.get("link", None)
-                if link is not None:
-                    sparse_results[link] = {"link": link, "score": scores[0, i]}
-            except json.JSONDecodeError as e:
-                logger.error(f"Error decoding JSON from BM25 result: {e}")
-                continue
-        logger.info(f"BM25 search results: {sparse_results}")
+    def warm_up(self) -> None:
+        """Load the embedding model, BM25 index and Chroma collection ahead of the first query."""
+        try:
+            self._check_generation()
+            self.embedding_model.embed_queries(["warm up"])
+            self._get_indexes()
+            logger.info("Query tool warm-up finished.")
+        except Exception as e:
+            logger.warning(f"Query tool warm-up failed, loading on first query instead: {e}")
+
+    def reload(self) -> None:
+        """Drop the open Chroma client and BM25 index, they are reopened on the next query."""
+        with self._lock:
+            self.client = None
+            self.collection = None
+            self.bm25_model = None
+            self._index_path = None
+            self.result_cache.clear()
+
+    def _check_generation(self) -> Optional[tuple]:
+        """
+        Switch to the indexes ingestion has published since the last query. The new generation
+        is loaded in the background while queries keep using the open one, so publishing
+        causes no failed or slow queries. Returns the generation the query is served from.
+        """
+        generation = current_generation(self.db_path)
+        with self._lock:
+            if generation == self.generation or self._reloading or generation == self._failed_generation:
+                return self.generation
+            if self.generation is None or (self.collection is None and self.bm25_model is None):
+                # Nothing is open yet, the indexes are loaded on first use
+                self.generation = generation
+                return generation
+            self._reloading = True
+            serving = self.generation
+        threading.Thread(target=self._load_generation, args=(generation,), name="index-reload", daemon=True).start()
+        return serving
+
+    def _load_generation(self, generation: tuple) -> None:
+        """Open the vector store and BM25 index of `generation` from its directory, then swap them in."""
+        try:
+            with span("index_reload"):
+                path = generation_path(self.db_path)
+                client, collections, collection = self._open_collection(path)
+                # Load the vector index into memory before the first query needs it
+                collection.query(query_embeddings=self.embedding_model.embed_queries(["warm up"]), n_results=1)
+                bm25_model = load_bm25_index(path)
+        except Exception as e:
+            logger.warning(f"Loading index generation failed, still serving the previous one: {e}")
+            with self._lock:
+                self._failed_generation = generation
+                self._reloading = False
+            return
 
-        # Query the ChromaDB vector store for semantic search
-        self.client = chromadb.PersistentClient(path=self.db_path)
+        with self._lock:
+            self.bm25_model, self.collection, self.client, self.collections, self._index_path = \
+                bm25_model, collection, client, collections, path
+            self.generation = generation
+            self.result_cache.clear()
+            self._reloading = False
+        logger.info(f"Switched to index generation {path}.")
+        # Chroma caches one system per path for the life of the process, drop the cache so the
+        # previous generation is closed once the queries still running on it are done
+        client.clear_system_cache()
 
-        # Verify the client is initialized by listing collections (optional)
-        self.collections = self.client.list_collections()
-        logger.info(f"Collections in the database: {self.collections}")
+    def _open_collection(self, path: Optional[str]) -> tuple:
+        """Open the Chroma collection of the generation at `path`, returning the client, collections and collection."""
+        import chromadb
 
-        if len(self.collections) == 0:
+        if path is None:
+            raise ValueError("No collections found in the database. Ensure the database is initialized correctly.")
+        client = chromadb.PersistentClient(path=path)
+        collections = client.list_collections()
+        logger.info(f"Collections in the database {path}: {collections}")
+        if len(collections) == 0:
             raise ValueError("No collections found in the database. Ensure the database is initialized correctly.")
-        
-        logger.info(f"Collections in the database: {len(self.collections)}")
-        dense_results = self.client.get_collection(self.collections[0].name).query(
-            query_embeddings=[self.embedding_model.embed_query(query)],  # Convert query to embeddings
-            n_results=self.max_results  # Number of results to return
-        )
-
-        return sparse_results, dense_results
-
-    def _return_search_results(self, sparse_results: dict, dense_results: dict) -> None:
-        """Function to print search results."""
-        links = set()
-        logger.info(f"Processing sparse results: {sparse_results}")
-        results_str = ""
-
-        for i, result in enumerate(dense_results["documents"][0]):
-            distance = dense_results['distances'][0][i]
-            link = dense_results['metadatas'][0][i]["link"]
-            logger.info(f"Result {i+1}: {link} (Distance: {distance})")
-
-            if link in sparse_results:
-                sparse_results[link]["score"] = sparse_results[link]["score"] * 2  # Boost the score if it exists in sparse results
-                logger.info(f"Updated score for {link}: {sparse_results[link]['score']}")
-                continue
-
-            links.add(link)
-            results_str += f"{dense_results['metadatas'][0][i]["link"]}\n"
-        
-        if results_str == "":
-            results_str = "No results found."
-
-        final_result = [[x["link"], x["score"]] for x in sparse_results.values()]
-        final_result.sort(key=lambda x: x[1], reverse=True)
-        logger.info(f"Final results: {final_result}")
-        return "\n".join([x[0] for x in final_result])  # Return the results as a string
-        
+        return client, collections, client.get_collection(collections[0].name)
+
+    def _get_indexes(self) -> tuple:
+        """
+        Return the Chroma collection and the BM25 index, loading both from the same generation
+        on first use. Loading reads from disk, so it only holds the load lock, the event loop
+        checking the generation and caching results never waits for it.
+        """
+        with self._lock:
+            if self.collection is not None and self.bm25_model is not None:
+                return self.collection, self.bm25_model
+        with self._load_lock:
+            with self._lock:
+                if self.collection is not None and self.bm25_model is not None:
+                    return self.collection, self.bm25_model
+                if self._index_path is None:
+                    self._index_path = generation_path(self.db_path)
+                path = self._index_path
+            if path is None:
+                raise FileNotFoundError(f"Index does not exist: {self.db_path}")
+            client, collections, collection = self._open_collection(path)
+            bm25_model = load_bm25_index(path)
+            with self._lock:
+                if self._index_path == path:
+                    self.client, self.collections, self.collection, self.bm25_model = \
+                        client, collections, collection, bm25_model
+                    return collection, bm25_model
+                swapped = self.collection, self.bm25_model
+            # A newer generation was swapped in meanwhile, or reload dropped the indexes
+            return swapped if None not in swapped else (collection, bm25_model)
+
+    def _get_collection(self):
+        """Return the Chroma collection, opening the client on first use."""
+        return self._get_indexes()[0]
+
+    def _get_bm25_model(self):
+        """Return the BM25 index, memory mapping it from disk on first use."""
+        return self._get_indexes()[1]
+
+    def _sparse_search(self, queries: list[str]) -> list[list]:
+        """Query the BM25 model for lexical search, returning one result list per query."""
+        bm25_model = self._get_bm25_model()
+        k = min(self.max_results, len(bm25_model.corpus))
+        with span("bm25_search", queries=len(queries)):
+            results, scores = bm25_model.retrieve(tokenize(queries), k=k, show_progress=False)
+
+        sparse_results = []
+        for q in range(len(queries)):
+            query_results = []
+            for i in range(results.shape[1]):
+                link = results[q, i].get("link", None)
+                if link is not None:
+                    query_results.append({"link": link, "score": float(scores[q, i]),
+                                          "snippet": results[q, i].get("snippet", "")})
+            logger.debug(f"BM25 search results: {query_results}")
+            sparse_results.append(query_results)
+        return sparse_results
+
+    def _dense_search(self, embeddings: list) -> list[list]:
+        """Query the ChromaDB vector store for semantic search, one result list per embedding."""
+        collection = self._get_collection()
+        # Several chunks of the same episode can match, fetch more chunks than episodes
+        with span("chroma_query", queries=len(embeddings)):
+            dense_results = collection.query(
+                query_embeddings=embeddings,
+                n_results=self.max_results * DENSE_CHUNK_FANOUT  # Number of chunks to return
+            )
+        return [self._rollup_dense_results(dense_results, q) for q in range(len(embeddings))]
+
+    def _rollup_dense_results(self, dense_results: dict, q: int = 0) -> list:
+        """Keep the best matching chunk of each episode for query `q`, ordered by distance."""
+        best = {}
+        for document, metadata, distance in zip(dense_results["documents"][q],
+                                                dense_results["metadatas"][q],
+                                                dense_results["distances"][q]):
+            link = metadata["link"]
+            if link not in best or distance < best[link]["distance"]:
+                # Negated distance so that higher scores are better, as for BM25
+                best[link] = {"link": link, "distance": distance, "score": -distance,
+                              "snippet": document, "start_index": metadata.get("start_index")}
+        return heapq.nsmallest(self.max_results, best.values(), key=lambda x: x["distance"])
+
+    def _return_search_results(self, sparse_results: list, dense_results: list) -> list[SearchResult]:
+        """Fuse the lexical and semantic results into one ranked list."""
+        results = fuse_results(sparse_results, dense_results, self.max_results)
+        logger.debug(f"Final results: {[(x['link'], x['score']) for x in results]}")
+        return results
+
 
 if __name__ == "__main__":
     # Example usage
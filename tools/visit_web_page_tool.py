@@ -2,76 +2,248 @@
 from pydantic import BaseModel, Field
 from langchain.tools import BaseTool, StructuredTool, tool
 from typing import Type, Optional, Any
-from playwright.sync_api import sync_playwright
+import html
+import os
 import re
+import threading
+import time
+from dotenv import load_dotenv
+from common.browser_pool import get_browser_pool
+from common.http_client import get_async_http_client, get_http_client
 from common.logging_config import logger
+from common.metrics import counter, histogram, span
 
 from langchain.callbacks.manager import (
     AsyncCallbackManagerForToolRun,
     CallbackManagerForToolRun,
 )
 
+load_dotenv()
+
+# "auto" tries a plain HTTP request first and renders in the browser only when needed,
+# "http" and "browser" force a single path.
+FETCH_MODE = os.environ.get("FETCH_MODE", "auto")
+
+# Pages with fewer visible words than this are assumed to be rendered by JavaScript
+MIN_STATIC_WORDS = int(os.environ.get("MIN_STATIC_WORDS", "40"))
+
+# Collect all text nodes from the body, including script payloads of dynamic pages
+EXTRACT_TEXT_SCRIPT = """
+    () => {
+        // Get all text nodes from the body
+        const walker = document.createTreeWalker(
+            document.body,
+            NodeFilter.SHOW_TEXT,
+            null,
+            false
+        );
+        let text = '';
+        let node;
+        while (node = walker.nextNode()) {
+            text += node.nodeValue.trim() + ' ';
+        }
+        return text;
+    }
+"""
+
+BODY_RE = re.compile(r'<body[^>]*>(.*)</body>', re.DOTALL | re.IGNORECASE)
+RAW_TEXT_RE = re.compile(r'<(script|style)\b[^>]*>(.*?)</\1\s*>', re.DOTALL | re.IGNORECASE)
+TAG_RE = re.compile(r'<[^>]+>')
+CLIENT_RENDERED_RE = re.compile(
+    r'<noscript\b[^>]*>[^<]*(enable|requires?)\s+javascript'
+    r'|<div\s+id="(root|app|__next)"\s*>\s*</div>', re.IGNORECASE)
+
+
 class VisitWebPageSyncToolInput(BaseModel):
     url: str = Field(description="Web page URL to visit")
     clean_flag: Optional[bool] = Field(default=False, description="Clean web page text content, this helps to get text from dynamic web page.")
+    expect: Optional[str] = Field(default=None, description="Text the page must contain, the page is rendered in a browser if a plain HTTP fetch does not contain it.")
+
+
+class FetchReport:
+    """
+    Page counts and seconds per fetch path. Only the totals are kept, a long running server
+    fetches an unbounded number of URLs, each one is logged when it is recorded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._paths = {}
+
+    def record(self, url: str, path: str, elapsed: float, reason: str = "", size: int = 0) -> None:
+        with self._lock:
+            totals = self._paths.setdefault(path, {"pages": 0, "seconds": 0.0})
+            totals["pages"] += 1
+            totals["seconds"] += elapsed
+        pages_fetched.inc(path=path)
+        fetched_bytes.inc(size, path=path)
+        fetch_seconds.observe(elapsed, path=path)
+        logger.info(f"Fetched {url} via {path} in {elapsed:.3f}s {reason}".rstrip())
+
+    def summary(self) -> dict:
+        """Return page counts and total seconds per fetch path."""
+        with self._lock:
+            return {path: dict(totals) for path, totals in self._paths.items()}
+
+
+fetch_report = FetchReport()
+
+pages_fetched = counter("pages_fetched_total", "Pages fetched, by fetch path")
+fetched_bytes = counter("fetched_bytes_total", "Characters of page content returned, by fetch path")
+fetch_seconds = histogram("fetch_seconds", "Time to fetch a page, by fetch path")
+
+
+def html_to_text(content: str) -> str:
+    """
+    Approximate the browser text walk on static HTML: text of the body with tags removed,
+    script and style payloads kept verbatim, whitespace collapsed.
+    """
+    match = BODY_RE.search(content)
+    body = match.group(1) if match else content
+    parts = []
+    position = 0
+    for raw in RAW_TEXT_RE.finditer(body):
+        parts.append(html.unescape(TAG_RE.sub(' ', body[position:raw.start()])))
+        parts.append(raw.group(2))
+        position = raw.end()
+    parts.append(html.unescape(TAG_RE.sub(' ', body[position:])))
+    return re.sub(r'\s+', ' ', ' '.join(parts)).strip()
+
+
+def needs_browser(response, expect: Optional[str] = None) -> Optional[str]:
+    """Return the reason a plain HTTP response can not be used as is, or None if it can."""
+    if response.status_code != 200:
+        return f"status {response.status_code}"
+    content_type = response.headers.get("content-type", "")
+    # Atom and RSS feeds are served as XML and never rendered by scripts
+    is_feed = "xml" in content_type and "html" not in content_type
+    if not is_feed and "html" not in content_type and "text" not in content_type:
+        return f"content type {content_type}"
+    content = response.text
+    if expect is not None:
+        return None if expect in content else f"missing {expect!r}"
+    if is_feed:
+        return None
+    if CLIENT_RENDERED_RE.search(content):
+        return "client rendered"
+    visible_text = TAG_RE.sub(' ', RAW_TEXT_RE.sub(' ', content))
+    if len(visible_text.split()) < MIN_STATIC_WORDS:
+        return "too little static text"
+    return None
+
+
+async def _browser_visit(page, url: str, clean_flag: bool) -> str:
+    try:
+        await page.goto(url, timeout=30000)  # Set a timeout for navigation
+    except Exception as e:
+        logger.error(f"Error navigating to {url}: {str(e)}")
+        return ""
+
+    if not clean_flag:
+        # Return the HTML content of the page
+        return await page.content()
+
+    # Extract all text from the page using JavaScript
+    all_text = await page.evaluate(EXTRACT_TEXT_SCRIPT)
+
+    # Clean up the text (remove extra spaces, newlines, etc.)
+    return re.sub(r'\s+', ' ', all_text).strip()
+
+
+def _http_content(url: str, response, error: Optional[Exception], clean_flag: bool, expect: Optional[str],
+                  fetch_mode: str, start: float, fetch_span) -> tuple:
+    """
+    Decide whether the plain HTTP response of `url` is served, and record it if so.
+    Returns:
+        tuple: The content and None when the response is served, None and the reason the page
+        is rendered in the browser instead otherwise.
+    """
+    try:
+        reason = f"error {error}" if error is not None else needs_browser(response, expect)
+    except Exception as e:
+        reason = f"error {e}"
+    if reason is not None and fetch_mode != "http":
+        return None, reason
+    content = "" if reason is not None else html_to_text(response.text) if clean_flag else response.text
+    fetch_report.record(url, "http", time.perf_counter() - start, size=len(content))
+    fetch_span.set(path="http", size=len(content))
+    if reason is not None:
+        logger.error(f"Error fetching webpage {url}: {reason}")
+    return content, None
+
+
+def _browser_content(url: str, content: str, reason: str, start: float, fetch_span) -> str:
+    """Record a page rendered in the browser and return its content."""
+    fetch_report.record(url, "browser", time.perf_counter() - start, f"({reason})", size=len(content))
+    fetch_span.set(path="browser", size=len(content), reason=reason)
+    return content
+
+
+def fetch_page(url: str, clean_flag: bool = False, expect: Optional[str] = None,
+               fetch_mode: str = FETCH_MODE) -> str:
+    """Fetch a page over HTTP and fall back to the shared browser when it needs rendering."""
+    with span("fetch", url=url) as fetch_span:
+        start = time.perf_counter()
+        reason = "forced"
+        if fetch_mode != "browser":
+            response, error = None, None
+            try:
+                response = get_http_client().get(url)
+            except Exception as e:
+                error = e
+            content, reason = _http_content(url, response, error, clean_flag, expect, fetch_mode, start, fetch_span)
+            if reason is None:
+                return content
+
+        content = get_browser_pool().run(lambda page: _browser_visit(page, url, clean_flag))
+        return _browser_content(url, content, reason, start, fetch_span)
+
+
+async def afetch_page(url: str, clean_flag: bool = False, expect: Optional[str] = None,
+                      fetch_mode: str = FETCH_MODE) -> str:
+    """Asynchronous version of fetch_page."""
+    with span("fetch", url=url) as fetch_span:
+        start = time.perf_counter()
+        reason = "forced"
+        if fetch_mode != "browser":
+            response, error = None, None
+            try:
+                response = await get_async_http_client().get(url)
+            except Exception as e:
+                error = e
+            content, reason = _http_content(url, response, error, clean_flag, expect, fetch_mode, start, fetch_span)
+            if reason is None:
+                return content
+
+        content = await get_browser_pool().arun(lambda page: _browser_visit(page, url, clean_flag))
+        return _browser_content(url, content, reason, start, fetch_span)
+
 
 class VisitWebPageSyncTool(BaseTool):
     name: str = "visit_webpage"
     description: str = "Visit a web page and get the text content."
     args_schema: Type[BaseModel] = VisitWebPageSyncToolInput
 
-    def _run(self, url: str, 
-             clean_flag=False, 
+    fetch_mode: str = FETCH_MODE  # "auto", "http" or "browser"
+
+    def _run(self, url: str,
+             clean_flag=False,
+             expect: Optional[str] = None,
              run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
         logger.info(f"Visiting webpage: {url} with clean_flag={clean_flag}")
-        with sync_playwright() as p:
-            try:
-                browser = p.chromium.launch(headless=True)
-                page = browser.new_page()
-                try:
-                    page.goto(url, timeout=30000)  # Set a timeout for navigation
-                except Exception as e:
-                    logger.error(f"Error navigating to {url}: {str(e)}")
-                    return ""
-                
-                title = page.title()
-                
-                # Extract the text content of the page
-                content = page.content()
-
-                # Extract all text from the page using JavaScript
-                all_text = page.evaluate("""
-                    () => {
-                        // Get all text nodes from the body
-                        const walker = document.createTreeWalker(
-                            document.body,
-                            NodeFilter.SHOW_TEXT,
-                            null,
-                            false
-                        );
-                        let text = '';
-                        let node;
-                        while (node = walker.nextNode()) {
-                            text += node.nodeValue.trim() + ' ';
-                        }
-                        return text;
-                    }
-                """)
-
-                # Clean up the text (remove extra spaces, newlines, etc.)
-                cleaned_text = re.sub(r'\s+', ' ', all_text).strip()
-
-                browser.close()
-                if clean_flag:
-                    return cleaned_text
-                else:
-                    return content
-            except Exception as e:
-                browser.close()
-                logger.error(f"Error visiting webpage: {str(e)}")
-                return ""
-                
-    def _arun(self, url: str, 
-             clean_flag=False, 
-             run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
-        raise NotImplementedError("visit_webpage does not support async")
\ No newline at end of file
+        try:
+            return fetch_page(url, clean_flag, expect, self.fetch_mode)
+        except Exception as e:
+            logger.error(f"Error visiting webpage: {str(e)}")
+            return ""
+
+    async def _arun(self, url: str,
+                    clean_flag=False,
+                    expect: Optional[str] = None,
+                    run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
+        logger.info(f"Visiting webpage: {url} with clean_flag={clean_flag}")
+        try:
+            return await afetch_page(url, clean_flag, expect, self.fetch_mode)
+        except Exception as e:
+            logger.error(f"Error visiting webpage: {str(e)}")
+            return ""
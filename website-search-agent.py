@@ -1,84 +1,158 @@
-# Import relevant functionality
-from langchain_core.messages import HumanMessage, ToolMessage
-from langgraph.prebuilt import create_react_agent
-from langchain.tools.retriever import create_retriever_tool
-from langchain_openai import ChatOpenAI 
 import os
-from langgraph.graph import StateGraph, START, END, MessagesState
-from langgraph.prebuilt import ToolNode, tools_condition
 from dotenv import load_dotenv
-from functions.download_transcripts_func import download_transcripts_func
-from common.common import GraphState
-from tools.crawl_web_page_tool import CrawlWebPageSyncTool
-from tools.query_database_tool import QueryDatabaseTool
-from functions.initialize_database import initialize_database
-import asyncio
-from common.logging_config import logger
+from common.startup_report import StartupReport, phase
 
 load_dotenv()
 
+# Report where startup time goes, install the import timer before the heavy imports below
+startup_report = StartupReport() if os.getenv("STARTUP_REPORT") == "1" else None
+
+with phase(startup_report, "import langchain and langgraph"):
+    # Import relevant functionality
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+    from langchain_core.runnables import RunnableConfig
+    from langchain_openai import ChatOpenAI
+    from langgraph.graph import StateGraph, START, END, MessagesState
+    from langgraph.prebuilt import ToolNode, tools_condition
+
+with phase(startup_report, "import agent tools and functions"):
+    # Vector store, BM25, browser and embedding model imports are deferred to first use
+    from functions.download_transcripts_func import download_transcripts_func
+    from common.common import GraphState
+    from tools.crawl_web_page_tool import CrawlWebPageSyncTool
+    from tools.discover_feed_tool import DiscoverFeedTool
+    from tools.query_database_tool import QueryDatabaseTool
+    from functions.initialize_database import initialize_database
+    import asyncio
+    import threading
+    import time
+    from common.logging_config import logger
+    from common.query_router import ROUTER_MODE, route_query, make_tool_call, log_route, router_stats
+    from common.metrics import counter, span, traced, start_metrics, stop_metrics
+    from common.agent_server import serve
+
+# Load the embedding model and indexes in the background while waiting for the first query
+AGENT_WARMUP = os.getenv("AGENT_WARMUP", "0") == "1"
+# Serve concurrent query sessions over HTTP instead of reading queries from the console
+AGENT_SERVER = os.getenv("AGENT_SERVER", "0") == "1"
+
 async def main():
     """Main function to set up the state graph and invoke the LLM with tools."""
-    llm = ChatOpenAI(
-        temperature=0,
-        model="gpt-4o")
+    # Exporters and the sampling profiler are configured by the METRICS_* variables
+    start_metrics()
+    llm_tokens = counter("llm_tokens_total", "Tokens used by the LLM, by kind")
+
+    with phase(startup_report, "create LLM and tools"):
+        query_tool = QueryDatabaseTool(db_path=os.getenv("DB_PATH"))
+        tools = [CrawlWebPageSyncTool(),
+                DiscoverFeedTool(),
+                query_tool]
 
-    tools = [CrawlWebPageSyncTool(),
-            QueryDatabaseTool(db_path=os.getenv("DB_PATH"))]
+        # The local router never calls the LLM, so no client is needed
+        llm_with_tools = None
+        if ROUTER_MODE != "local":
+            llm = ChatOpenAI(
+                temperature=0,
+                model="gpt-4o")
+            llm_with_tools = llm.bind_tools(tools)
 
-    llm_with_tools = llm.bind_tools(tools)
+    if AGENT_WARMUP or AGENT_SERVER:
+        threading.Thread(target=query_tool.warm_up, name="warm-up", daemon=True).start()
 
     async def tool_calling_llm(state: GraphState) -> dict:
-        """Function to call the LLM with tools."""
-        response = await llm_with_tools.ainvoke(
-            [HumanMessage(content=state["query"])]
-        )
-        state["messages"] = [response]
-        logger.info(f"LLM Response: {response}")
+        """Function to call the LLM with tools, obvious inputs are routed without the LLM."""
+        start = time.perf_counter()
+        route = route_query(state["query"], ROUTER_MODE)
+        if route is not None:
+            response = AIMessage(content="", tool_calls=[make_tool_call(route)])
+            log_route("fast_path", route["name"], start)
+        elif ROUTER_MODE == "local":
+            response = AIMessage(content="Please enter a search query or a URL to crawl.")
+            log_route("fast_path", None, start)
+        else:
+            with span("llm"):
+                response = await llm_with_tools.ainvoke(state["messages"])
+            tool_calls = response.tool_calls
+            log_route("llm", tool_calls[0]["name"] if tool_calls else None, start)
+            usage = response.usage_metadata or {}
+            llm_tokens.inc(usage.get("input_tokens", 0), kind="input")
+            llm_tokens.inc(usage.get("output_tokens", 0), kind="output")
+            logger.info(f"LLM responded with tool calls {[call['name'] for call in tool_calls]}, "
+                        f"{usage.get('total_tokens', 0)} tokens.")
+            logger.debug(f"LLM Response: {response}")
+        state["messages"] = state["messages"] + [response]
         return state
 
     def decide_next_node(state: GraphState) -> str:
         """Decide the next node based on the state."""
         # print(f"decide_next_node: state: {state}")
-        
+
         messages = state["messages"]
         tool_messages = [msg for msg in messages if isinstance(msg, ToolMessage)]
-        
+
         for msg in tool_messages:
-            if msg.name == "crawl_web_page":
+            if msg.name == "crawl_web_page" or msg.name == "discover_feed":
                 return "download_transcripts_func"
             elif msg.name == "query_database":
                 return END
-            
-    # Create the state graph
-    builder = StateGraph(GraphState)
-    builder.add_node("tool_calling_llm", tool_calling_llm)
-    builder.add_node("tools", ToolNode(tools))
-    builder.add_node("download_transcripts_func", download_transcripts_func)
-    builder.add_node("initialize_database", initialize_database)
-
-    builder.add_edge(START, "tool_calling_llm")
-    builder.add_conditional_edges("tool_calling_llm", tools_condition, ["tools", END])
-    builder.add_conditional_edges("tools", decide_next_node)
-    builder.add_edge("download_transcripts_func", "initialize_database")
-    builder.add_edge("initialize_database", END)
-
-    graph = builder.compile()
+
+    tool_node = ToolNode(tools)
+
+    async def run_tools(state: GraphState, config: RunnableConfig):
+        """Run the tool calls of the last message."""
+        return await tool_node.ainvoke(state, config)
+
+    with phase(startup_report, "build graph"):
+        # Create the state graph, every node runs in a span named after it
+        builder = StateGraph(GraphState)
+        builder.add_node("tool_calling_llm", traced("node.tool_calling_llm")(tool_calling_llm))
+        builder.add_node("tools", traced("node.tools")(run_tools))
+        builder.add_node("download_transcripts_func", traced("node.download_transcripts_func")(download_transcripts_func))
+        builder.add_node("initialize_database", traced("node.initialize_database")(initialize_database))
+
+        builder.add_edge(START, "tool_calling_llm")
+        builder.add_conditional_edges("tool_calling_llm", tools_condition, ["tools", END])
+        builder.add_conditional_edges("tools", decide_next_node)
+        builder.add_edge("download_transcripts_func", "initialize_database")
+        builder.add_edge("initialize_database", END)
+
+        graph = builder.compile()
 
     graph.get_graph().print_ascii()
 
+    if startup_report is not None:
+        print(startup_report.finish())
+
+    async def choose_tool(query: str) -> AIMessage:
+        """Pick the tool call for a query sent to the server, the same way the graph does."""
+        state = await tool_calling_llm(GraphState(query=query, messages=[HumanMessage(content=query)]))
+        return state["messages"][-1]
+
+    try:
+        if AGENT_SERVER:
+            await serve(query_tool, choose_tool)
+        else:
+            await run_queries(graph)
+    finally:
+        stop_metrics()
+
+
+async def run_queries(graph) -> None:
+    """Read queries from the console and answer them until the user exits."""
     while True:
         # Get user input
         query = input("User> ")
         if query.lower() == 'exit' or query.lower() == 'quit':
+            logger.info(f"Router summary: {router_stats.summary()}")
             print("Exiting the program.")
             break
 
         # Create the initial state
         initial_state = GraphState(query=query, messages=[HumanMessage(content=query)])
 
-        # Invoke the graph with the initial state
-        result = await graph.ainvoke(initial_state, debug=False)
+        # Invoke the graph with the initial state, the nodes run in spans nested under this one
+        with span("agent_query"):
+            result = await graph.ainvoke(initial_state, debug=False)
 
         # Print the result
         if isinstance(result["messages"][-1], ToolMessage):
@@ -87,4 +161,4 @@ async def main():
             print(f"Agent> No result found.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())